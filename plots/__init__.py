@@ -15,8 +15,18 @@
 # You should have received a copy of the GNU General Public License
 # along with Plots.  If not, see <https://www.gnu.org/licenses/>.
 
-from . import plots
+import os
 import sys
 
+if sys.argv[1:2] == ["render"]:
+    # PyOpenGL chooses its platform when first imported, so this must be set
+    # before importing anything using it
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+
+from . import plots
+
 def main():
-    plots.Plots().run(sys.argv)
+    if sys.argv[1:2] == ["render"]:
+        from . import headless
+        return headless.main(sys.argv[2:])
+    return plots.Plots().run(sys.argv)
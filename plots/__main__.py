@@ -16,4 +16,5 @@
 # along with Plots.  If not, see <https://www.gnu.org/licenses/>.
 
 import plots
-plots.main()
+import sys
+sys.exit(plots.main())
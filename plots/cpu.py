@@ -0,0 +1,221 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import ast
+import os
+import numpy as np
+
+from plots.renderer import Renderer, split_variables
+from plots.ir import NAMESPACE
+
+CPUSources = namedtuple("CPUSources", "formulae hoisted dependent functions undefined sliders")
+
+def rand(x, y):
+    value = np.sin(x*12.9898 + y*78.233) * 43758.5453
+    return value - np.floor(value)
+
+def undefined_function(*args):
+    """Stands in for a function defined by a row which has no value; see
+    plots.renderer.split_variables."""
+    return np.nan
+
+class FloatConstants(ast.NodeTransformer):
+    """Makes numeric literals NumPy floats, so that dividing by zero gives
+    infinity or NaN, as in GLSL, rather than raising an exception."""
+    def visit_Constant(self, node):
+        if isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return self.visit_Num(node)
+        return node
+
+    def visit_Num(self, node):
+        # Python 3.6 and 3.7 parse numbers as Num rather than Constant
+        return ast.copy_location(ast.Call(
+            func=ast.Name(id="_float", ctx=ast.Load()), args=[node], keywords=[]),
+            node)
+
+def compile_numpy(source, mode):
+    tree = ast.fix_missing_locations(FloatConstants().visit(ast.parse(source, mode=mode)))
+    return compile(tree, "<formula>", mode)
+
+def shade(values, stats, colors, weights, graph_x, graph_y, pixel_extent, samples):
+    """Composites the formulae over the pixels at graph_x by graph_y, in the
+    same way as fragment.glsl. values holds the samples of each formula in
+    each pixel column, and stats their reductions, as in columns.glsl.
+
+    Returns an array of RGB colours, one row per element of graph_y.
+    """
+    step = 1.4*pixel_extent[0] / samples
+    jitter = .5
+    color = np.ones((len(graph_y), len(graph_x), 3))
+    for f, (rgba, weight) in enumerate(zip(colors, weights)):
+        rgb, alpha = np.asarray(rgba[:3]), rgba[3]
+        if alpha == 0.0:
+            continue
+        valid = (np.abs(stats[f, 2]) != samples - 3) & (stats[f, 3] == 0.0)
+        half_weight = 0.5*weight
+        inside = np.zeros((len(graph_y), len(graph_x)))
+        outside = np.zeros_like(inside)
+        with np.errstate(invalid="ignore"):
+            for i in range(samples):
+                yj = (jitter*rand(graph_y, graph_y + i*step)/samples)[:, None]
+                lower = (-half_weight + yj)*pixel_extent[1]
+                upper = (half_weight + yj)*pixel_extent[1]
+                d = values[f, i][None, :] - graph_y[:, None]
+                hit = (lower < d) & (d < upper)
+                inside += hit
+                outside += np.where(hit, 0.0, np.sign(d))
+        amount = np.where(valid & (inside > 0), alpha*inside/samples, 0.0)
+        color += (rgb - color)*amount[..., None]
+        amount = np.where(valid & (np.abs(outside) != samples),
+                          alpha*(1. - np.abs(outside)/samples), 0.0)
+        color += (rgb - color)*amount[..., None]
+
+    axis_width = pixel_extent[0]
+    def line(distance):
+        t = np.clip((distance - axis_width)/(axis_width*0.05), 0.0, 1.0)
+        return 1.0 - t*t*(3.0 - 2.0*t)
+    x, y = graph_x[None, :, None], graph_y[:, None, None]
+    color -= (1.0 - np.array([0.2, 0.2, 1.0]))*line(np.abs(x))
+    color -= (1.0 - np.array([0.2, 0.2, 1.0]))*line(np.abs(y))
+    color -= (1.0 - np.array([0.8, 0.8, 1.0]))*line(np.abs(np.mod(x, 1.0)))
+    color -= (1.0 - np.array([0.8, 0.8, 1.0]))*line(np.abs(np.mod(y, 1.0)))
+    return color
+
+class CPURenderer():
+    """Draws the graph with NumPy, for when OpenGL 3.3 is unavailable.
+
+    Has the same interface as Renderer, but its sources are generated by
+    to_numpy rather than to_glsl, and render() returns the image as an
+    array rather than drawing it. Each formula is evaluated for every sample
+    of every pixel column at once, and the pixels are then composited in
+    vertical bands across a pool of threads, as NumPy releases the GIL.
+    Threads rather than processes, as forking a process which is running
+    GTK's threads is unsafe.
+    """
+    SAMPLES = Renderer.SAMPLES
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        self.sources = CPUSources([], [], [], [], {}, [])
+        self.pending = None
+        self.generation = 0
+        self.errors = set()  # reported since the last update
+
+    def update_shader(self, formulae, variables, sliders):
+        self.start_update(self.generate(formulae, variables, sliders))
+        self.finish_update()
+
+    def generate(self, formulae, variables, sliders, labels=None):
+        """Compiles the NumPy expressions of the given rows. May be called
+        from any thread. labels are unused, as there are no GPU spans."""
+        hoisted, dependent, functions, undefined = split_variables(variables)
+        return CPUSources(
+            formulae=[compile_numpy(f.expr, "eval") for f in formulae],
+            hoisted=[compile_numpy(v.expr, "exec") for v in hoisted],
+            dependent=[compile_numpy(v.expr, "exec") for v in dependent],
+            functions=[compile_numpy(f"{f.name} = lambda {', '.join(f.params)}: {f.expr}",
+                                     "exec") for f in functions],
+            undefined={v.name: np.nan if v.type == "variable" else undefined_function
+                       for v in undefined},
+            sliders=[s.name for s in sliders])
+
+    def start_update(self, sources):
+        self.pending = sources
+
+    def update_ready(self):
+        return True
+
+    def finish_update(self):
+        self.sources = self.pending
+        self.pending = None
+        self.generation += 1
+        self.errors.clear()
+
+    def evaluate(self, x, slider_values):
+        """Returns the values of each formula at x."""
+        namespace = {**NAMESPACE, **self.sources.undefined,
+                     **dict(zip(self.sources.sliders, slider_values))}
+        results = []
+        with np.errstate(all="ignore"):
+            for code in self.sources.functions:
+                self.run(code, namespace)
+            for code in self.sources.hoisted:
+                self.run(code, namespace)
+            namespace["x"] = x
+            for code in self.sources.dependent:
+                self.run(code, namespace)
+            for code in self.sources.formulae:
+                try:
+                    value = eval(code, namespace)
+                except Exception as e:
+                    self.report(e)
+                    value = np.nan
+                results.append(np.broadcast_to(np.asarray(value, float), x.shape))
+        return np.array(results).reshape((len(results),) + x.shape)
+
+    def run(self, code, namespace):
+        try:
+            exec(code, namespace)
+        except Exception as e:
+            self.report(e)
+
+    def report(self, error):
+        """Prints an error once for each update, rather than every frame."""
+        if str(error) not in self.errors:
+            self.errors.add(str(error))
+            print(error)
+
+    def render(self, width, height, translation, scale, slider_values, styles,
+               samples=SAMPLES):
+        """Returns a width x height graph as a height x width x 3 array of
+        bytes, top row first."""
+        viewport = np.array([width, height], float)
+        pixel_extent = 2*viewport/viewport[0]*scale / viewport
+        graph_x = (2.0*(np.arange(width) + 0.5)/width - 1.0)*scale - translation[0]
+        graph_y = (2.0*(np.arange(height) + 0.5)/height - 1.0)*scale*height/width \
+            - translation[1]
+
+        step = 1.4*pixel_extent[0] / samples
+        i = np.arange(samples)[:, None]
+        ii = i + .5*rand(graph_x[None, :] + i*step, i)
+        values = self.evaluate(graph_x[None, :] + ii*step, slider_values)
+
+        with np.errstate(invalid="ignore"):
+            monotonic = np.sum(np.sign(np.diff(values, axis=1)), axis=1)
+            nans = np.any(~np.isfinite(values), axis=1)
+            stats = np.stack([values.min(axis=1), values.max(axis=1),
+                              np.nan_to_num(monotonic), nans], axis=1)
+        colors = [rgba for rgba, _ in styles]
+        weights = [weight for _, weight in styles]
+
+        if self.workers > 1:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.workers)
+            # each band of columns needs only the samples of its own columns
+            bands = np.array_split(np.arange(width), min(self.workers, width))
+            futures = [self.executor.submit(shade, values[..., band], stats[..., band],
+                                            colors, weights, graph_x[band], graph_y,
+                                            pixel_extent, samples)
+                       for band in bands]
+            color = np.concatenate([f.result() for f in futures], axis=1)
+        else:
+            color = shade(values, stats, colors, weights, graph_x, graph_y,
+                          pixel_extent, samples)
+        return (np.clip(color, 0.0, 1.0)*255 + 0.5).astype(np.uint8)[::-1]
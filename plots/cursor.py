@@ -45,6 +45,7 @@ class Cursor():
         self.selection_rgba = [0.5, 0.5, 1, 0.6]
         self._position = (0., 0.)     # absolute position in widget (in pixels)
         self.position_changed = False  # set to True when self.position changes
+        self.rectangle = None         # (x, y, width, height) last drawn in widget
         self.clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
 
     @property
@@ -68,6 +69,27 @@ class Cursor():
         if position < 0:
             self.pos = len(self.owner.elements) + position + 1
 
+    def draw(self, ctx, rgba):
+        """Draws the cursor on ctx, in widget coordinates, where its owner
+        placed it when it was last drawn."""
+        x, top, baseline, bottom = self.owner.cursor_extents[self.pos]
+        self.position = (x, baseline)
+        self.rectangle = (x, top, 0, bottom - top)
+        if self.visible:
+            ctx.set_source_rgba(*rgba)
+            ctx.set_line_width(max(ctx.device_to_user_distance(self.WIDTH, self.WIDTH)))
+            ctx.move_to(x, bottom)
+            ctx.line_to(x, top)
+            ctx.stroke()
+
+    def draw_selection(self, ctx):
+        """Highlights the selected elements on ctx, in widget coordinates."""
+        for e in self.selection_ancestor.elements[self.selection_slice]:
+            (x0, y0), (x1, y1) = e.top_left, e.bottom_right
+            ctx.rectangle(x0, y0, x1 - x0, y1 - y0)
+        ctx.set_source_rgba(*self.selection_rgba)
+        ctx.fill()
+
     def cancel_selection(self):
         self.secondary_pos, self.secondary_owner = None, None
         self.selection_bounds, self.selection_ancestor = None, None
@@ -91,7 +113,10 @@ class Cursor():
 
     def paste(self):
         text = self.clipboard.wait_for_text()
-        elements = parser.from_latex(text)
+        try:
+            elements = parser.from_latex(text)
+        except parser.LatexError:
+            return
         if self.selecting:
             self.backspace(None)
         self.owner.insert_elementlist(elements, self, self.pos)
@@ -202,6 +227,7 @@ class Cursor():
         if self.selecting:
             sel = self.selection_ancestor.elements[self.selection_bounds.start:self.selection_bounds.stop]
             del self.selection_ancestor.elements[self.selection_bounds.start:self.selection_bounds.stop]
+            self.selection_ancestor.invalidate()
             self.reparent(self.selection_ancestor, self.selection_bounds.start)
             self.cancel_selection()
             return sel
@@ -1,15 +1,52 @@
+from functools import wraps
+
 from plots.utils import Direction
 
+def cached(method):
+    """Keeps the result of an element's method, or the ValueError it raised,
+    until the element is invalidated."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in self._cache:
+            try:
+                self._cache[key] = method(self, *args, **kwargs), None
+            except ValueError as e:
+                self._cache[key] = None, e
+        result, error = self._cache[key]
+        if error is not None:
+            raise error.with_traceback(None)
+        return result
+    return wrapper
+
 class AbstractElement():
     """Functionality shared by both Element and ElementList
     """
     def __init__(self, parent):
         self.parent = parent
+        self._cache = {}
+
+    def invalidate(self):
+        """Discards the cached code and metrics of this element and its
+        ancestors. Must be called whenever the element or one of its
+        descendants changes."""
+        element = self
+        while element is not None:
+            element._cache.clear()
+            element = element.parent
 
     def contains_device_point(self, x, y):
         return self.top_left[0] <= x <= self.bottom_right[0] and \
             self.top_left[1] <= y <= self.bottom_right[1]
 
+    def child_at(self, x, y):
+        """Returns the child containing the point (x, y) in widget
+        coordinates, as last drawn, or None."""
+        for child in self.children():
+            if child.contains_device_point(x, y):
+                return child
+        return None
+
     def half_containing(self, x, y):
         x_mid = (self.bottom_right[0] + self.top_left[0])/2
         if x < x_mid:
@@ -21,7 +58,7 @@ class AbstractElement():
     def height(self):
         return self.ascent + self.descent
 
-    def draw(self, ctx, cursor, widget_transform):
+    def draw(self, ctx, widget_transform):
         self.top_left = widget_transform.transform_point(
             *ctx.user_to_device(-self.h_spacing, -self.ascent))
         self.bottom_right = widget_transform.transform_point(
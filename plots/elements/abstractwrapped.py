@@ -1,5 +1,6 @@
 from . import elements
 from . import element
+from plots import ir
 from plots.utils import saved, Text
 
 class AbstractWrapped(element.Element):
@@ -38,11 +39,11 @@ sandwiched between two characters (e.g. Abs, Floor, Ceil).
             ctx.move_to(0, 0)
             bar.draw(ctx)
 
-    def draw(self, ctx, cursor, widget_transform):
-        super().draw(ctx, cursor, widget_transform)
+    def draw(self, ctx, widget_transform):
+        super().draw(ctx, widget_transform)
         self.draw_bar(ctx, self.left_bar)
         ctx.translate(self.left_bar.width, 0)
-        self.argument.draw(ctx, cursor, widget_transform)
+        self.argument.draw(ctx, widget_transform)
         ctx.translate(self.argument.width, 0)
         self.draw_bar(ctx, self.right_bar)
 
@@ -50,10 +51,11 @@ sandwiched between two characters (e.g. Abs, Floor, Ceil).
         self.argument.elements.extend(selection)
         for x in selection:
             x.parent = self.argument
+        self.argument.invalidate()
 
-    def to_glsl(self):
-        arg_body, arg_expr = self.argument.to_glsl()
-        return arg_body, f"{self.class_name.lower()}({arg_expr})"
+    def ir_tokens(self, functions):
+        return [("value", ir.Call(self.class_name.lower(),
+                                  (self.argument.to_ir(functions=functions),)))]
 
     def to_latex(self):
         return rf"\{self.class_name.lower()}{{{self.argument.to_latex()}}}"
@@ -1,4 +1,5 @@
 from . import element
+from plots import ir
 from plots.utils import saved, italify_string, deitalify_string, Text
 from plots.data import GREEK_LETTERS_INVERSE
 
@@ -14,8 +15,8 @@ class BaseAtom(element.Element):
         self.width, self.ascent, self.descent = self.layout.width, self.layout.ascent, self.layout.descent
         super().compute_metrics(ctx, metric_ctx)
 
-    def draw(self, ctx, cursor, widget_transform):
-        super().draw(ctx, cursor, widget_transform)
+    def draw(self, ctx, widget_transform):
+        super().draw(ctx, widget_transform)
         self.layout.draw_at_baseline(ctx)
 
     def __repr__(self):
@@ -26,12 +27,15 @@ class BaseAtom(element.Element):
             return self.name == other.name
         return NotImplemented
 
-    def to_glsl(self):
+    def ir_tokens(self, functions):
         s = deitalify_string(self.name)
-        if s in GREEK_LETTERS_INVERSE:
-            return "", GREEK_LETTERS_INVERSE[s]
-        else:
-            return "", deitalify_string(self.name)
+        if self.part_of_number(self):
+            return [("digit", s)]
+        elif s == "!":
+            return [("!",)]
+        elif s == ",":
+            return [(",",)]
+        return [("value", ir.Var(GREEK_LETTERS_INVERSE.get(s, s)))]
 
     def to_latex(self):
         return deitalify_string(self.name)
@@ -53,9 +57,9 @@ class BinaryOperatorAtom(BaseAtom):
         else:
             self.h_spacing = 4
 
-    def to_glsl(self):
+    def ir_tokens(self, functions):
         translation = str.maketrans("−×", "-*")
-        return "", self.name.translate(translation)
+        return [("op", self.name.translate(translation))]
 
     def to_latex(self):
         if self.name == "−":
@@ -68,5 +72,8 @@ class BinaryOperatorAtom(BaseAtom):
 class OperatorAtom(BaseAtom):
     h_spacing = 2
 
+    def ir_tokens(self, functions):
+        return [("func", self.name)]
+
     def to_latex(self):
         return "\\operatorname{" + self.name + "}"
@@ -12,7 +12,7 @@ class Element(abstractelement.AbstractElement):
     """Abstract class describing an element of an equation.
 
     Implementations must provide parent, index_in_parent, lists, ascent, descent,
-    and width properties, compute_metrics(ctx, metric_ctx) and draw(ctx, cursor, widget_transform)."""
+    and width properties, compute_metrics(ctx, metric_ctx) and draw(ctx, widget_transform)."""
 
     h_spacing = 2
     color = Gdk.RGBA()
@@ -24,9 +24,28 @@ class Element(abstractelement.AbstractElement):
         self.default_list = None
         self.cursor_acceptor = None
 
+    @property
+    def index_in_parent(self):
+        """The position of the element in its parent. Lists only renumber
+        their elements when this is found to be stale, so that inserting or
+        deleting an element need not touch its siblings."""
+        if self.parent is None:
+            return self._index_in_parent
+        return self.parent.index_of(self)
+
+    @index_in_parent.setter
+    def index_in_parent(self, index):
+        self._index_in_parent = index
+
     def children(self):
         return self.lists
 
+    def ir_tokens(self, functions):
+        """Returns a list of the tokens which plots.ir.parse reads to turn
+        the list containing this element into an expression tree. functions
+        holds the names of the functions defined in the document."""
+        return []
+
     def compute_metrics(self, ctx, metric_ctx):
         """To be run at the end of overriding methods, if they
         wish to have parens scale around them.
@@ -37,21 +56,15 @@ class Element(abstractelement.AbstractElement):
             stack[-1].descent = max(self.descent, stack[-1].descent)
             stack[-1].compute_stretch()
 
-    def draw(self, ctx, cursor, widget_transform):
+    def draw(self, ctx, widget_transform):
         """Expects (0, 0) to be at the baseline, where it should begin drawing.
         """
-        super().draw(ctx, cursor, widget_transform)
+        super().draw(ctx, widget_transform)
         if DEBUG:
             ctx.set_line_width(0.5)
-            ctx.set_source_rgba(1, 0, 1 if cursor.owner is self else 0, 0.6)
+            ctx.set_source_rgba(1, 0, 0, 0.6)
             ctx.rectangle(0, -self.ascent, self.width, self.ascent + self.descent)
             ctx.stroke()
-        if cursor.selecting and self.parent is cursor.selection_ancestor and \
-           self.index_in_parent in cursor.selection_bounds:
-            ctx.set_source_rgba(*cursor.selection_rgba)
-            ctx.rectangle(-self.h_spacing, -self.ascent,
-                          self.width + 2*self.h_spacing, self.ascent + self.descent)
-            ctx.fill()
         ctx.set_source_rgba(*Element.color)
         ctx.move_to(0, 0)
 
@@ -16,17 +16,22 @@
 # along with Plots.  If not, see <https://www.gnu.org/licenses/>.
 
 import re
-from itertools import count
+import math
+import bisect
+from itertools import count, accumulate
 
+import cairo
 import gi
-from gi.repository import GLib, Gtk, Gdk, cairo, Pango, PangoCairo, GObject
+from gi.repository import GLib, Gtk, Gdk, Pango, PangoCairo, GObject
 from plots.utils import saved, Direction, font_metrics, MetricContext, \
-    deitalify_string, ints_to_floats
-from plots.data import GREEK_REGEXES, FUNCTIONS, BINARY_OPERATORS, GREEK_LETTERS
+    deitalify_string, metrics_key
+from plots import ir
+from plots.data import FUNCTIONS, BINARY_OPERATORS, GREEK_LETTERS
 
 DEBUG = False
 
 from . import abstractelement
+from .abstractelement import cached
 
 class ElementList(abstractelement.AbstractElement):
     h_spacing = 0
@@ -60,55 +65,92 @@ class ElementList(abstractelement.AbstractElement):
         return self.elements
 
     def compute_metrics(self, ctx, metric_ctx):
+        # The metrics of a list depend only on its contents and the font, so
+        # they are kept until the list is invalidated; see invalidate().
+        key = metrics_key(ctx)
+        if self._cache.get("metrics") == key:
+            return
         self.ascent = self.descent = self.width = 0
         metric_ctx = MetricContext(metric_ctx.cursor)
         metric_ctx.prev = font_metrics(ctx)
-        for i, e in enumerate(self.elements):
-            e.index_in_parent = i
+        for e in self.elements:
             e.compute_metrics(ctx, metric_ctx)
             self.ascent = max(self.ascent, e.ascent)
             self.descent = max(self.descent, e.descent)
             self.width += e.width + 2*e.h_spacing
             metric_ctx.prev = e
         if not self.elements:
-            self.ascent = font_metrics(ctx).ascent
-            self.descent = font_metrics(ctx).descent
-            self.width = font_metrics(ctx).width
-
-    def draw_cursor(self, ctx, ascent, descent, cursor, widget_transform):
-        if cursor.owner is self and cursor.visible:
-            ctx.set_source_rgba(*element.Element.color)
-            ctx.set_line_width(max(ctx.device_to_user_distance(cursor.WIDTH, cursor.WIDTH)))
-            ctx.move_to(0, descent-2)
-            ctx.line_to(0, -ascent+2)
-            ctx.move_to(0, 0)
-            ctx.stroke()
-            cursor.position = widget_transform.transform_point(*ctx.user_to_device(0,0))
-
-    def draw(self, ctx, cursor, widget_transform):
-        super().draw(ctx, cursor, widget_transform)
+            metrics = font_metrics(ctx)
+            self.ascent, self.descent, self.width = \
+                metrics.ascent, metrics.descent, metrics.width
+        self._cache["metrics"] = key
+
+    @staticmethod
+    def cursor_extent(ctx, ascent, descent, widget_transform):
+        """Returns where the cursor is drawn when it is at the current point,
+        as (x, top, baseline, bottom) in widget coordinates."""
+        x, top = widget_transform.transform_point(*ctx.user_to_device(0, -ascent+2))
+        _, baseline = widget_transform.transform_point(*ctx.user_to_device(0, 0))
+        _, bottom = widget_transform.transform_point(*ctx.user_to_device(0, descent-2))
+        return x, top, baseline, bottom
+
+    def draw(self, ctx, widget_transform):
+        """Draws the list, and records in cursor_extents where the cursor
+        goes at each position in it; see Cursor.draw. The left edges of those
+        positions are kept in edges, for child_at."""
+        super().draw(ctx, widget_transform)
+        self.cursor_extents = []
         with saved(ctx):
             for i, e in enumerate(self.elements):
-                ctx.move_to(0,0)
-                if i == cursor.pos:
-                    ascent, descent = e.ascent, e.descent
-                    if cursor.pos > 0:
-                        ascent = max(ascent, self.elements[i-1].ascent)
-                        descent = max(descent, self.elements[i-1].descent)
-                    self.draw_cursor(ctx, ascent, descent, cursor, widget_transform)
+                ascent, descent = e.ascent, e.descent
+                if i > 0:
+                    ascent = max(ascent, self.elements[i-1].ascent)
+                    descent = max(descent, self.elements[i-1].descent)
+                self.cursor_extents.append(
+                    self.cursor_extent(ctx, ascent, descent, widget_transform))
                 ctx.move_to(0, 0)
                 ctx.translate(e.h_spacing, 0)
                 with saved(ctx):
-                    e.draw(ctx, cursor, widget_transform)
+                    e.draw(ctx, widget_transform)
                 ctx.move_to(0,0)
                 ctx.translate(e.width + e.h_spacing, 0)
-            if cursor.pos == len(self.elements) > 0:
-                self.draw_cursor(ctx, self.elements[-1].ascent, self.elements[-1].descent, cursor, widget_transform)
-            elif not self.elements:
-                self.draw_cursor(ctx, self.ascent, self.descent, cursor, widget_transform)
+            if self.elements:
+                self.cursor_extents.append(self.cursor_extent(
+                    ctx, self.elements[-1].ascent, self.elements[-1].descent, widget_transform))
+            else:
+                self.cursor_extents.append(
+                    self.cursor_extent(ctx, self.ascent, self.descent, widget_transform))
                 ctx.set_source_rgba(0.5, 0.5, 0.5, 0.2)
                 ctx.rectangle(0, -self.ascent, self.width, self.ascent + self.descent)
                 ctx.fill()
+        self.edges = [x for x, _, _, _ in self.cursor_extents]
+
+    def child_at(self, x, y):
+        # the elements are laid out left to right, so only the one whose
+        # span includes x can contain the point
+        i = max(bisect.bisect_left(self.edges, x) - 1, 0)
+        if i < len(self.elements) and self.elements[i].contains_device_point(x, y):
+            return self.elements[i]
+        return None
+
+    def render(self, ctx, padding):
+        """Returns a surface similar to the target of ctx, holding the list
+        drawn with padding around it, with its top left corner at (0, 0). It
+        is kept until the list is invalidated, or the font, scale or colour
+        it was drawn with changes."""
+        key = (metrics_key(ctx), tuple(element.Element.color))
+        cached = self._cache.get("rendering")
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        surface = ctx.get_target().create_similar(
+            cairo.CONTENT_COLOR_ALPHA,
+            math.ceil(self.width + 2*padding),
+            math.ceil(self.ascent + self.descent + 2*padding))
+        surface_ctx = cairo.Context(surface)
+        surface_ctx.translate(padding, padding + self.ascent)
+        self.draw(surface_ctx, cairo.Matrix())
+        self._cache["rendering"] = key, surface
+        return surface
 
     def backspace(self, cursor, caller=None, direction=Direction.LEFT):
         if self is not cursor.owner:
@@ -126,6 +168,7 @@ class ElementList(abstractelement.AbstractElement):
             else:
                 cursor.pos += shift
                 del self.elements[cursor.pos]
+                self.invalidate()
         elif self.parent:
             self.parent.dissolve(cursor, self)
 
@@ -141,23 +184,33 @@ class ElementList(abstractelement.AbstractElement):
             else:
                 self.elements[old.index_in_parent] = new
                 new.parent = self
+            self.invalidate()
 
-    def update_children(self):
-        for i, e in enumerate(self.elements):
-            e.parent = self
-            e.index_in_parent = i
+    def index_of(self, element):
+        """Returns the position of element, which must be in the list."""
+        i = element._index_in_parent
+        if i is None or i >= len(self.elements) or self.elements[i] is not element:
+            for i, e in enumerate(self.elements):
+                e.index_in_parent = i
+            i = element._index_in_parent
+        return i
 
     def insert(self, element, cursor):
         self.elements.insert(cursor.pos, element)
+        element.parent = self
+        element.index_in_parent = cursor.pos
         cursor.pos += 1
-        self.update_children()
+        self.invalidate()
         self.convert_specials(cursor)
         if element.cursor_acceptor is not None:
             cursor.reparent(element.cursor_acceptor, -1)
 
     def insert_elementlist(self, new, cursor, position, cursor_right=True):
         self.elements[position:position] = new.elements
-        self.update_children()
+        for i, e in enumerate(new.elements):
+            e.parent = self
+            e.index_in_parent = position + i
+        self.invalidate()
         if cursor_right:
             position += len(new)
         cursor.reparent(self, position)
@@ -210,134 +263,108 @@ class ElementList(abstractelement.AbstractElement):
         self.insert(new, cursor)
         cursor.reparent(new.get_next_child(Direction.LEFT if left else Direction.RIGHT), 0)
 
-    def atoms_at_cursor(self, cursor):
-        l = cursor.pos
-        while l - 1 >= 0:
-            if isinstance(self.elements[l-1], (atom.Atom, atom.OperatorAtom)):
-                l -= 1
-            else:
-                break
-        r = cursor.pos
-        while r < len(self.elements):
-            if isinstance(self.elements[r], (atom.Atom, atom.OperatorAtom)):
-                r += 1
-            else:
-                break
-        return l, r
+    def is_atom(self, i):
+        return 0 <= i < len(self.elements) and \
+            isinstance(self.elements[i], (atom.Atom, atom.OperatorAtom))
 
-    @staticmethod
-    def atoms_to_string(atoms):
-        return "".join(deitalify_string(atom.name) for atom in atoms)
+    def atom_name(self, i):
+        return deitalify_string(self.elements[i].name)
 
     def convert_specials(self, cursor):
-        l, r = self.atoms_at_cursor(cursor)
-        atoms = self.elements[l:r]
-        names = index.string_to_names(self.atoms_to_string(atoms))
+        """Replaces keywords completed by the element just inserted before
+        the cursor, e.g. sqrt or alpha, with their elements. The atoms
+        around it were converted as they were typed, so only those within
+        reach of a keyword touching it are tokenized again."""
+        tokenizer = index.tokenizer()
+        # the inserted atom, if it is one, is the only character which changed
+        edited = cursor.pos - 1 if self.is_atom(cursor.pos - 1) else cursor.pos
+        start, reach = edited, 0
+        while self.is_atom(start - 1) and \
+              reach + len(self.atom_name(start - 1)) < tokenizer.max_length:
+            start -= 1
+            reach += len(self.atom_name(start))
+        before = self.atom_name(start - 1)[-1] if self.is_atom(start - 1) else ""
+
+        # Tokenize until a token ends on an atom boundary after the edit, from
+        # where the tokens are those of the atoms as before. Tokens depend on
+        # up to max_length characters, so take more atoms until that is seen.
+        stop, length, horizon = cursor.pos, 0, tokenizer.max_length
+        while True:
+            while self.is_atom(stop) and length < horizon:
+                length += len(self.atom_name(stop))
+                stop += 1
+            names = [self.atom_name(i) for i in range(start, stop)]
+            ends = list(accumulate(map(len, names)))
+            string = "".join(names)
+            edit_end = len(string) - length
+            end, tokens = 0, []
+            for token in tokenizer.tokens(string, before):
+                tokens.append(token)
+                end += len(token)
+                if end > edit_end and end in ends:
+                    break
+            if not self.is_atom(stop) or end - 1 + tokenizer.max_length <= len(string):
+                break
+            horizon *= 2
+        if tokens:
+            stop = start + ends.index(end) + 1
 
         # find index of first difference - it will be stored in i
-        for i, name, atom in zip(count(), names, atoms):
-            if name != deitalify_string(atom.name):
+        for i, name, old in zip(count(), tokens, names):
+            if name != old:
                 break
         else:
             return
 
-        new_elems = [index.name_to_element(name) for name in names]
-        self.elements[l:r] = new_elems
+        new_elems = [index.name_to_element(name) for name in tokens]
+        self.elements[start:stop] = new_elems
         for j, elem in enumerate(new_elems):
             elem.parent = self
-            elem.index_in_parent = l + j
+            elem.index_in_parent = start + j
+        self.invalidate()
         if new_elems[i].default_list:
             cursor.reparent(new_elems[i].default_list, 0)
         else:
             cursor.reparent(self, new_elems[i].index_in_parent)
             cursor.handle_movement(Direction.RIGHT)
 
-    def to_glsl(self):
-        string_stack = [[]]
-        body_stack = [[]]
-        sums = []
-        sum_paren_levels = []
-        prev = None
-        parens = 0
+    @cached
+    def to_ir(self, assignment=False, functions=frozenset()):
+        """Returns the expression tree of the list, which may be a plots.ir
+        Assign or Define if assignment is true. functions holds the names of
+        the functions defined in the document. Raises plots.ir.ParseError if
+        the list is not a valid expression, e.g. while it is being typed."""
+        tokens = []
         for elem in self.elements:
-            if prev is not None and \
-               not isinstance(prev, atom.BinaryOperatorAtom) and \
-               not isinstance(elem, atom.BinaryOperatorAtom) and \
-               not isinstance(elem, supersubscript.SuperscriptSubscript) and \
-               not atom.Atom.part_of_number(elem) and \
-               not paren.Paren.is_paren(elem, left=False) and \
-               not paren.Paren.is_paren(prev, left=True) and \
-               not isinstance(prev, atom.OperatorAtom) and \
-               not isinstance(prev, sum.Sum) and \
-               not (isinstance(elem, atom.Atom) and elem.name == "!"):
-                string_stack[-1].append("*")
-            if isinstance(prev, atom.OperatorAtom) and \
-               not paren.Paren.is_paren(elem, left=True):
-                string_stack[-1].append("(")
-                parens += 1
-            elif isinstance(elem, atom.BinaryOperatorAtom) or paren.Paren.is_paren(elem, left=False):
-                string_stack[-1].append(")"*parens)
-                parens = 0
-            if isinstance(elem, supersubscript.SuperscriptSubscript) and elem.exponent is not None \
-               or isinstance(elem, atom.Atom) and elem.name == "!":
-                parens2 = 0
-                for i, s in reversed(list(enumerate(string_stack[-1]))):
-                    if s == ")":
-                        parens2 += 1
-                    elif s == "(":
-                        parens2 -= 1
-                    if parens2 == 0 and s in "+-*=" or parens2 < 0:
-                        i += 1
-                        break
-                if isinstance(elem, supersubscript.SuperscriptSubscript):
-                    string_stack[-1].insert(i, "mypow(")
-                    b, e = elem.exponent.to_glsl()
-                    string_stack[-1].append(f", ({e}))")
-                    body_stack[-1].append(b)
-                else:
-                    string_stack[-1].insert(i, "factorial(")
-                    string_stack[-1].append(")")
-            elif isinstance(elem, sum.Sum):
-                string_stack.append([])
-                body_stack.append([])
-                sums.append(elem)
-                sum_paren_levels.append(0)
-            elif not isinstance(elem, supersubscript.SuperscriptSubscript):
-                if (isinstance(elem, atom.BinaryOperatorAtom) or
-                    paren.Paren.is_paren(elem, left=False)):
-                    while sums and sum_paren_levels[-1] == 0:
-                        sum_body, sum_expr = sums.pop().to_glsl("".join(body_stack.pop()),
-                                                                "".join(string_stack.pop()))
-                        sum_paren_levels.pop()
-                        string_stack[-1].append(sum_expr)
-                        body_stack[-1].append(sum_body)
-                elem_body, elem_expr = elem.to_glsl()
-                body_stack[-1].append(elem_body)
-                string_stack[-1].append(elem_expr)
-                if sums and paren.Paren.is_paren(elem, left=True):
-                    sum_paren_levels[-1] += 1
-                elif sums and paren.Paren.is_paren(elem, left=False):
-                    sum_paren_levels[-1] -= 1
-            prev = elem
-        string_stack[-1].append(")"*parens)
-        while sums:
-            sum_body, sum_expr = sums.pop().to_glsl("".join(body_stack.pop()),
-                                                    "".join(string_stack.pop()))
-            sum_paren_levels.pop()
-            string_stack[-1].append(sum_expr)
-            body_stack[-1].append(sum_body)
-        return ints_to_floats("".join(body_stack[-1])), \
-            ints_to_floats("".join(string_stack[-1]))
-
+            tokens.extend(elem.ir_tokens(functions))
+        return ir.parse(tokens, assignment, functions)
+
+    @cached
+    def to_glsl(self, functions=frozenset()):
+        """Returns GLSL for the list as (body, expr), where body holds
+        statements which must run before expr is evaluated, or two empty
+        strings if the list is not a valid expression."""
+        try:
+            return ir.to_glsl(self.to_ir(assignment=True, functions=functions))
+        except ir.ParseError:
+            return "", ""
+
+    @cached
+    def to_numpy(self, functions=frozenset()):
+        """Like to_glsl, but generating a NumPy expression; see plots.cpu."""
+        try:
+            return ir.to_numpy(self.to_ir(assignment=True, functions=functions))
+        except ir.ParseError:
+            return "", ""
+
+    @cached
     def to_latex(self):
         return "".join(e.to_latex() for e in self.elements)
 
 
-from . import sum
 from . import paren
 from . import radical
 from . import frac
-from . import supersubscript
 from . import atom
 from . import index
 from . import element
@@ -1,5 +1,6 @@
 from . import elements
 from . import element
+from plots import ir
 from plots.utils import saved, font_metrics
 
 class Frac(element.Element):
@@ -29,8 +30,8 @@ class Frac(element.Element):
             self.vertical_separation//2 - self.bar_height
         super().compute_metrics(ctx, metric_ctx)
 
-    def draw(self, ctx, cursor, widget_transform):
-        super().draw(ctx, cursor, widget_transform)
+    def draw(self, ctx, widget_transform):
+        super().draw(ctx, widget_transform)
         with saved(ctx):
             ctx.translate(0, -self.bar_height)
             ctx.move_to(0,0)
@@ -41,25 +42,25 @@ class Frac(element.Element):
             with saved(ctx):
                 ctx.translate(self.width//2 - self.numerator.width//2,
                               -self.vertical_separation//2 - self.numerator.descent)
-                self.numerator.draw(ctx, cursor, widget_transform)
+                self.numerator.draw(ctx, widget_transform)
             with saved(ctx):
                 ctx.translate(self.width//2 - self.denominator.width//2,
                               self.vertical_separation//2 + self.denominator.ascent)
-                self.denominator.draw(ctx, cursor, widget_transform)
+                self.denominator.draw(ctx, widget_transform)
 
     def accept_selection(self, selection, direction):
         self.numerator.elements.extend(selection)
         for x in selection:
             x.parent = self.numerator
+        self.numerator.invalidate()
 
     @classmethod
     def make_greedily(cls, left, right):
         return cls(numerator=left, denominator=right)
 
-    def to_glsl(self):
-        num_body, num_expr = self.numerator.to_glsl()
-        den_body, den_expr = self.denominator.to_glsl()
-        return num_body + den_body, f"({num_expr})/({den_expr})"
+    def ir_tokens(self, functions):
+        return [("value", ir.Binary("/", self.numerator.to_ir(functions=functions),
+                                    self.denominator.to_ir(functions=functions)))]
 
     def to_latex(self):
         return "\\frac{" + self.numerator.to_latex() + "}{" + self.denominator.to_latex() + "}"
@@ -1,5 +1,6 @@
-import re
-from plots.data import GREEK_REGEXES, FUNCTIONS, BINARY_OPERATORS, GREEK_LETTERS
+from functools import partial
+
+from plots.data import FUNCTIONS, BINARY_OPERATORS, GREEK_LETTERS
 
 from . import sum
 from . import radical
@@ -7,32 +8,82 @@ from . import atom
 from . import floor
 from . import ceil
 
+# Keywords which are replaced by an element as they are typed, mapped to
+# functions which make that element. Change them with register_keyword.
+KEYWORDS = {
+    'sum': sum.Sum,
+    'prod': partial(sum.Sum, char="∏"),
+    'sqrt': partial(radical.Radical, []),
+    'nthroot': partial(radical.Radical, [], index=[]),
+    'floor': partial(floor.Floor, []),
+    'ceil': partial(ceil.Ceil, []),
+}
+KEYWORDS.update((name, partial(atom.OperatorAtom, name)) for name in FUNCTIONS)
+KEYWORDS.update((name, partial(atom.Atom, letter)) for name, letter in GREEK_LETTERS.items())
+
+# Keywords which are not recognised straight after one of the given characters
+NOT_AFTER = {
+    # stops a ψ being inserted while typing epsilon or upsilon
+    'psi': "EUeu",
+}
+
+class Tokenizer():
+    """Splits strings into keywords and single characters, always taking
+    the longest keyword which matches, using a trie of the keywords."""
+    def __init__(self, keywords, not_after):
+        self.trie = {}
+        for word in keywords:
+            node = self.trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[None] = word
+        self.max_length = max(map(len, keywords), default=1)
+        self.not_after = {word: set(chars) for word, chars in not_after.items()}
+
+    def tokens(self, string, before=""):
+        """Yields the tokens of string, where before is the character which
+        precedes it, if any."""
+        i = 0
+        while i < len(string):
+            previous = string[i-1] if i else before
+            node, token = self.trie, string[i]
+            for char in string[i:i+self.max_length]:
+                node = node.get(char)
+                if node is None:
+                    break
+                word = node.get(None)
+                if word is not None and previous not in self.not_after.get(word, ()):
+                    token = word
+            i += len(token)
+            yield token
+
+_tokenizer = None
+
+def tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = Tokenizer(KEYWORDS, NOT_AFTER)
+    return _tokenizer
+
+def register_keyword(name, make_element, not_after=""):
+    """Makes typing name insert make_element(), unless it is typed straight
+    after one of the characters in not_after."""
+    global _tokenizer
+    KEYWORDS[name] = make_element
+    NOT_AFTER.pop(name, None)
+    if not_after:
+        NOT_AFTER[name] = not_after
+    _tokenizer = None
+
 def string_to_names(string):
-    regex = r"sum|prod|sqrt|nthroot|floor|ceil|."
-    regex = "|".join(GREEK_REGEXES) + "|" + "|".join(FUNCTIONS) + "|" + regex
-    names = re.findall(regex, string)
-    return names
+    return list(tokenizer().tokens(string))
 
 def name_to_element(name):
-    if name == 'sqrt':
-        return radical.Radical([])
-    elif name == 'nthroot':
-        return radical.Radical([], index=[])
-    elif name == 'sum':
-        return sum.Sum()
-    elif name == 'prod':
-        return sum.Sum(char="∏")
-    elif name == 'floor':
-        return floor.Floor([])
-    elif name == 'ceil':
-        return ceil.Ceil([])
-    elif name in FUNCTIONS:
-        return atom.OperatorAtom(name)
+    if name in KEYWORDS:
+        return KEYWORDS[name]()
     elif name in BINARY_OPERATORS:
         return atom.BinaryOperatorAtom(name)
     elif len(name) == 1:
         return atom.Atom(name)
-    elif name in GREEK_LETTERS:
-        return atom.Atom(GREEK_LETTERS[name])
     else:
         return atom.OperatorAtom(name)
@@ -58,8 +58,8 @@ class Paren(element.Element):
         else:
             self.stretch = False
 
-    def draw(self, ctx, cursor, widget_transform):
-        super().draw(ctx, cursor, widget_transform)
+    def draw(self, ctx, widget_transform):
+        super().draw(ctx, widget_transform)
         if self.stretch:
             with saved(ctx):
                 ctx.translate(0, -self.ascent - self.top.ink_rect.y*self.shrink)
@@ -88,8 +88,8 @@ class Paren(element.Element):
                 ctx.move_to(0, 0)
                 self.text.draw(ctx)
 
-    def to_glsl(self):
-        return "", "(" if self.left else ")"
+    def ir_tokens(self, functions):
+        return [("(",) if self.left else (")",)]
 
     def to_latex(self):
         if self.char in "{}":
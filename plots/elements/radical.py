@@ -1,5 +1,6 @@
 from . import elements
 from . import element
+from plots import ir
 from plots.utils import saved, Text
 
 class Radical(element.Element):
@@ -36,15 +37,15 @@ class Radical(element.Element):
 
         super().compute_metrics(ctx, metric_ctx)
 
-    def draw(self, ctx, cursor, widget_transform):
-        super().draw(ctx, cursor, widget_transform)
+    def draw(self, ctx, widget_transform):
+        super().draw(ctx, widget_transform)
 
         if self.index is not None:
             with saved(ctx):
                 ctx.translate(0, -self.main_ascent + self.index_y_shift -self.index.descent)
                 ctx.scale(self.index_scale, self.index_scale)
                 ctx.move_to(0, 0)
-                self.index.draw(ctx, cursor, widget_transform)
+                self.index.draw(ctx, widget_transform)
             ctx.translate(self.index.width*self.index_scale - self.index_x_shift, 0)
 
         symbol_size = self.symbol.ink_rect.height
@@ -63,15 +64,15 @@ class Radical(element.Element):
         ctx.rel_line_to(self.radicand.width, 0)
         ctx.stroke()
         ctx.move_to(0,0)
-        self.radicand.draw(ctx, cursor, widget_transform)
+        self.radicand.draw(ctx, widget_transform)
 
-    def to_glsl(self):
-        radicand_body, radicand_expr = self.radicand.to_glsl()
+    def ir_tokens(self, functions):
+        radicand = self.radicand.to_ir(functions=functions)
         if self.index:
-            index_body, index_expr = self.index.to_glsl()
-            return radicand_body + index_body, f"pow({radicand_expr}, 1.0/({index_expr}))"
+            exponent = ir.Binary("/", ir.Num(1.0), self.index.to_ir(functions=functions))
+            return [("value", ir.Call("pow", (radicand, exponent)))]
         else:
-            return radicand_body, f"sqrt({radicand_expr})"
+            return [("value", ir.Call("sqrt", (radicand,)))]
 
     def to_latex(self):
         if self.index:
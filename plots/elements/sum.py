@@ -6,7 +6,6 @@ from plots.utils import saved, Text
 class Sum(element.Element):
     child_scale = 0.7
     bottom_padding = 4
-    glsl_var_counter = 0
 
     def __init__(self, parent=None, char="∑", top=None, bottom=None):
         super().__init__(parent=parent)
@@ -30,8 +29,8 @@ class Sum(element.Element):
             self.child_scale*self.bottom.height + self.bottom_padding
         super().compute_metrics(ctx, metric_ctx)
 
-    def draw(self, ctx, cursor, widget_transform):
-        super().draw(ctx, cursor, widget_transform)
+    def draw(self, ctx, widget_transform):
+        super().draw(ctx, widget_transform)
         with saved(ctx):
             ctx.translate(self.width/2 - self.symbol.width/2, 0)
             self.symbol.draw_at_baseline(ctx)
@@ -39,37 +38,17 @@ class Sum(element.Element):
             ctx.translate(self.width/2, -self.symbol.ascent)
             ctx.scale(self.child_scale, self.child_scale)
             ctx.translate(-self.top.width/2, -self.top.descent)
-            self.top.draw(ctx, cursor, widget_transform)
+            self.top.draw(ctx, widget_transform)
         with saved(ctx):
             ctx.translate(self.width/2, self.symbol.descent + self.bottom_padding)
             ctx.scale(self.child_scale, self.child_scale)
             ctx.translate(-self.bottom.width/2, self.bottom.ascent)
-            self.bottom.draw(ctx, cursor, widget_transform)
+            self.bottom.draw(ctx, widget_transform)
 
-    def to_glsl(self, arg_body, arg_expr):
-        init_body, init_expr = self.bottom.to_glsl()
-        end_body, end_expr = self.top.to_glsl()
-        var = init_expr.split('=')[0].strip()
-        assert var.isidentifier()
-        sum_var = f"sum{Sum.glsl_var_counter}"
-        Sum.glsl_var_counter += 1
-        if Sum.glsl_var_counter > 100000:
-            Sum.glsl_var_counter = 0
-        if self.char == "∑":
-            init = 0.0
-            op = "+="
-        elif self.char == "∏":
-            init = 1.0
-            op = "*="
-        body = f"""
-        {init_body}
-        {end_body}
-        float {sum_var} = {init};
-        for (float {init_expr}; {var} <= {end_expr}; {var}++) {{
-            {arg_body}
-            {sum_var} {op} {arg_expr};
-        }}"""
-        return body, sum_var
+    def ir_tokens(self, functions):
+        op = "+" if self.char == "∑" else "*"
+        return [("sum", (op, self.bottom.to_ir(assignment=True, functions=functions),
+                          self.top.to_ir(functions=functions)))]
 
     def to_latex(self):
         if self.char == "∑":
@@ -24,6 +24,7 @@ class SuperscriptSubscript(element.Element):
         if self.exponent is None:
             self.exponent = elements.ElementList([], self)
             self.update_lists()
+            self.invalidate()
         self.cursor_acceptor = self.exponent
         self._selection_acceptor = self.exponent
 
@@ -31,6 +32,7 @@ class SuperscriptSubscript(element.Element):
         if self.subscript is None:
             self.subscript = elements.ElementList([], self)
             self.update_lists()
+            self.invalidate()
         self.cursor_acceptor = self.subscript
         self._selection_acceptor = self.subscript
 
@@ -57,18 +59,18 @@ class SuperscriptSubscript(element.Element):
             self.descent = max(self.descent, self.subscript.descent*self.subscript_scale + self.subscript_shift)
         super().compute_metrics(ctx, metric_ctx)
 
-    def draw(self, ctx, cursor, widget_transform):
-        super().draw(ctx, cursor, widget_transform)
+    def draw(self, ctx, widget_transform):
+        super().draw(ctx, widget_transform)
         if self.exponent is not None:
             with saved(ctx):
                 ctx.translate(0, self.superscript_shift)
                 ctx.scale(self.exponent_scale, self.exponent_scale)
-                self.exponent.draw(ctx, cursor, widget_transform)
+                self.exponent.draw(ctx, widget_transform)
         if self.subscript is not None:
             with saved(ctx):
                 ctx.translate(0, self.subscript_shift)
                 ctx.scale(self.subscript_scale, self.subscript_scale)
-                self.subscript.draw(ctx, cursor, widget_transform)
+                self.subscript.draw(ctx, widget_transform)
 
     @classmethod
     def make_greedily(cls, left, right):
@@ -81,6 +83,7 @@ class SuperscriptSubscript(element.Element):
             self._selection_acceptor.elements.extend(selection)
         for x in selection:
             x.parent = self._selection_acceptor
+        self._selection_acceptor.invalidate()
 
     def dissolve(self, cursor, caller):
         if len(self.lists) == 1:
@@ -93,6 +96,12 @@ class SuperscriptSubscript(element.Element):
             self.subscript = None
             self.parent.insert_elementlist(caller, cursor, self.index_in_parent, True)
 
+    def ir_tokens(self, functions):
+        # subscripts are only for display
+        if self.exponent is None:
+            return []
+        return [("^", self.exponent.to_ir(functions=functions))]
+
     def to_latex(self):
         res = ""
         if self.subscript is not None:
@@ -16,6 +16,7 @@
 # along with Plots.  If not, see <https://www.gnu.org/licenses/>.
 
 import re
+import math
 from itertools import count
 
 import gi
@@ -65,16 +66,17 @@ class Editor(Gtk.DrawingArea):
 
     def do_draw_cb(self, widget, ctx):
         Element.color = self.get_style_context().get_color(Gtk.StateFlags.NORMAL)
-        widget_transform = ctx.get_matrix()
-        widget_transform.invert()
-        ctx.translate(self.padding, self.padding) # a bit of padding
-        scale = 1
-        ctx.scale(scale, scale)
+        # The expression is drawn once into a surface, which is painted on
+        # every frame between the selection and the cursor.
         self.expr.compute_metrics(ctx, MetricContext(self.cursor))
-        ctx.translate(0, self.expr.ascent)
-        self.set_size_request(self.expr.width*scale + 2*self.padding,
-                              (self.expr.ascent + self.expr.descent)*scale + 2*self.padding)
-        self.expr.draw(ctx, self.cursor, widget_transform)
+        self.set_size_request(self.expr.width + 2*self.padding,
+                              self.expr.ascent + self.expr.descent + 2*self.padding)
+        rendering = self.expr.render(ctx, self.padding)
+        if self.cursor.selecting:
+            self.cursor.draw_selection(ctx)
+        ctx.set_source_surface(rendering, 0, 0)
+        ctx.paint()
+        self.cursor.draw(ctx, Element.color)
         if self.cursor.position_changed:
             self.emit("cursor_position", *self.cursor.position)
             self.cursor.position_changed = False
@@ -91,9 +93,22 @@ class Editor(Gtk.DrawingArea):
 
     def blink_cursor_cb(self):
         self.cursor.visible = not self.cursor.visible
-        self.queue_draw()
+        self.queue_draw_cursor()
         return True
 
+    def queue_draw_cursor(self):
+        """Redraws just the area around the cursor, which is all that changes
+        when it blinks."""
+        if self.cursor.rectangle is None:
+            self.queue_draw()
+            return
+        x, y, width, height = self.cursor.rectangle
+        margin = self.cursor.WIDTH + 1
+        left, top = math.floor(x - margin), math.floor(y - margin)
+        self.queue_draw_area(left, top,
+                             math.ceil(x + width + margin) - left,
+                             math.ceil(y + height + margin) - top)
+
     def restart_blink_sequence(self):
         if not self.cursor.visible:
             self.cursor.visible = True
@@ -150,7 +165,7 @@ class Editor(Gtk.DrawingArea):
             self.queue_draw()
             self.emit("edit")
             return
-        if char in "!'.":
+        if char in "!'.,":
             translation = str.maketrans("'", "′")
             self.cursor.insert(Atom(char.translate(translation)))
             self.queue_draw()
@@ -197,12 +212,10 @@ class Editor(Gtk.DrawingArea):
     def element_at(self, x, y):
         e = self.expr
         while True:
-            for c in e.children():
-                if c.contains_device_point(x, y):
-                    e = c
-                    break
-            else:
+            c = e.child_at(x, y)
+            if c is None:
                 return e, e.half_containing(x, y)
+            e = c
 
     def on_button_press(self, widget, event):
         if event.button == 1:
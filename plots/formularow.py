@@ -22,16 +22,63 @@ from plots import formula, plots, rowcommands
 import re, math
 
 class RowData():
-    def __init__(self, type, expr=None, body=None, rgba=None, name=None):
+    def __init__(self, type, expr=None, body=None, name=None, params=None):
         self.type = type
         if expr:
             self.expr = expr
         if body:
             self.body = body
-        if rgba:
-            self.rgba = rgba
         if name:
             self.name = name
+        if params:
+            self.params = params
+
+    def __eq__(self, other):
+        if isinstance(other, RowData):
+            return vars(self) == vars(other)
+        return NotImplemented
+
+def classify(body, expr):
+    """Works out what kind of row the GLSL generated from a formula is.
+
+    Returns its RowData, and for a slider its value, else None.
+    """
+    m = re.match(r'^([a-zA-Z_]\w*) *=(.*)', expr)
+    m2 = re.match(r'^([a-zA-Z_]\w*) *= *([+-]?([0-9]*[.])?[0-9]+(e[+-]?[0-9]+)?) *$', expr)
+    m3 = re.match(r'^([a-zA-Z_]\w*)\(([\w, ]*)\) *=(.*)', expr)
+    if m3:
+        return RowData(type="function", body=body, expr=m3.group(3), name=m3.group(1),
+                       params=tuple(m3.group(2).split(", "))), None
+    elif m2 and m2.group(1) not in ["x", "y"]:
+        return RowData(type="slider", name=m2.group(1)), float(m2.group(2))
+    elif m and m.group(1) not in ["x", "y"]:
+        return RowData(type="variable", body=body, expr=expr, name=m.group(1)), None
+    elif m and m.group(1) == "y":
+        return RowData(type="formula", body=body, expr=m.group(2)), None
+    elif expr:
+        return RowData(type="formula", body=body, expr=expr), None
+    else:
+        return RowData(type="empty"), None
+
+def style(rgba, visible, line_weight):
+    """The (rgba, line weight) a formula is drawn with, as Renderer.render()
+    takes them. A hidden formula is drawn with no opacity."""
+    r, g, b, a = rgba
+    return (r, g, b, a if visible else 0.0), line_weight
+
+def classify_all(expressions, cpu=False):
+    """Classifies each of a list of parsed formulae, generating NumPy if cpu
+    is set and GLSL otherwise. The functions are found first, so that calls
+    to them are not read as multiplication.
+
+    Returns a list of the RowData and slider value of each formula.
+    """
+    def generate(e, functions=frozenset()):
+        return e.to_numpy(functions) if cpu else e.to_glsl(functions)
+    functions = frozenset(data.name for data in
+                          (classify(*generate(e))[0] for e in expressions)
+                          if data.type == "function")
+    return [classify(*generate(e, functions)) for e in expressions]
 
 class FormulaRow():
     PALETTE = [
@@ -46,10 +93,12 @@ class FormulaRow():
     ]
     PALETTE = [Gdk.RGBA(*(color/255 for color in colors)) for colors in PALETTE]
     _palette_use_next = 0
+    line_weight = 1.0  # of new rows, until their weight button is changed
 
     def __init__(self, app):
         self.app = app
         self.data = RowData("empty")
+        self.applying_value = False  # set while edited() moves the slider
         builder = Gtk.Builder()
         builder.add_from_string(plots.read_ui_file("formula_box.glade"))
         builder.connect_signals(self)
@@ -61,14 +110,22 @@ class FormulaRow():
         self.slider = builder.get_object("slider")
         self.slider_upper = builder.get_object("slider_upper")
         self.slider_lower = builder.get_object("slider_lower")
+        self.visible_button = builder.get_object("visible_button")
+        self.visible_image = builder.get_object("visible_image")
+        self.weight_button = builder.get_object("weight_button")
         self.color_picker.add_palette(Gtk.Orientation.HORIZONTAL, 9, FormulaRow.PALETTE)
         self.color_picker.set_rgba(FormulaRow.PALETTE[FormulaRow._palette_use_next])
         FormulaRow._palette_use_next = (FormulaRow._palette_use_next + 1) % len(FormulaRow.PALETTE)
+        self.rgba = tuple(self.color_picker.get_rgba())
+        self.visible = True
+        self.weight_button.set_value(self.line_weight)
         self.editor = formula.Editor()
         self.editor.connect("edit", self.edited)
         self.editor.connect("cursor_position", self.cursor_position)
         self.delete_button.connect("clicked", self.delete)
         self.color_picker.connect("color-set", self.edited)
+        self.visible_handler = self.visible_button.connect("toggled", self.edited)
+        self.weight_handler = self.weight_button.connect("value-changed", self.edited)
         self.slider.connect("value-changed", self.slider_changed)
         self.slider_upper.connect("changed", self.slider_limits_changed)
         self.slider_lower.connect("changed", self.slider_limits_changed)
@@ -101,30 +158,29 @@ class FormulaRow():
             adj.value = x - adj.page_size + 4
 
     def edited(self, widget, record=True):
-        body, expr = self.editor.expr.to_glsl()
-        rgba = tuple(self.color_picker.get_rgba())
-        m = re.match(r'^([a-zA-Z_]\w*) *=(.*)', expr)
-        m2 = re.match(r'^([a-zA-Z_]\w*) *= *([+-]?([0-9]*[.])?[0-9]+)', expr)
-        if m2 and m2.group(1) not in ["x", "y"]:
-            self.data = RowData(type="slider", name=m2.group(1))
-        elif m and m.group(1) not in ["x", "y"]:
-            self.data = RowData(type="variable", body=body, expr=expr, name=m.group(1))
-        elif m and m.group(1) == "y":
-            self.data = RowData(type="formula", body=body, expr=m.group(2), rgba=rgba)
-        elif expr:
-            self.data = RowData(type="formula", body=body, expr=expr, rgba=rgba)
-        else:
-            self.data = RowData(type="empty")
+        with self.app.profiler.span("codegen"):
+            body, expr = self.editor.expr.to_glsl(self.app.functions())
+        self.rgba = tuple(self.color_picker.get_rgba())
+        self.visible = self.visible_button.get_active()
+        self.line_weight = self.weight_button.get_value()
+        self.visible_image.set_from_icon_name(
+            "view-reveal-symbolic" if self.visible else "view-conceal-symbolic",
+            Gtk.IconSize.BUTTON)
+        old_data = self.data
+        self.data, val = classify(body, expr)
 
-        if self.data.type in ("variable", "slider"):
-            self.color_picker.hide()
-            self.name = m.group(1)
+        style_widgets = (self.color_picker, self.visible_button, self.weight_button)
+        if self.data.type in ("variable", "slider", "function"):
+            for style_widget in style_widgets:
+                style_widget.hide()
+            self.name = self.data.name
         else:
-            self.color_picker.show()
+            for style_widget in style_widgets:
+                style_widget.show()
 
         if self.data.type == "slider":
+            self.applying_value = True
             self.slider_box.show()
-            val = float(m2.group(2))
             if val == 0:
                 u, l = 10., -10.
             else:
@@ -137,6 +193,7 @@ class FormulaRow():
             self.slider_upper.set_text(str(u))
             self.slider_lower.set_text(str(l))
             self.slider.set_value(val)
+            self.applying_value = False
         else:
             self.slider_box.hide()
 
@@ -145,7 +202,11 @@ class FormulaRow():
             command = rowcommands.Edit(self, self.app.rows, mem, self.old)
             self.app.add_to_history(command)
         self.old = mem
-        self.app.update_shader()
+        if self.data != old_data:
+            self.app.update_shader()
+        else:
+            # only the style has changed, which needs no new shaders
+            self.app.gl_area.queue_draw()
 
     def construct_memory(self):
         adj = self.slider.get_adjustment()
@@ -154,12 +215,28 @@ class FormulaRow():
             rgba=self.color_picker.get_rgba(),
             lower=adj.get_lower(),
             upper=adj.get_upper(),
-            slider=adj.get_value())
+            slider=adj.get_value(),
+            visible=self.visible_button.get_active(),
+            weight=self.weight_button.get_value())
+
+    def set_style(self, rgba, visible, weight):
+        """Sets the style widgets, as undo and redo do, without recording
+        an edit; edited() must be called afterwards."""
+        self.color_picker.set_rgba(rgba)
+        with self.visible_button.handler_block(self.visible_handler), \
+             self.weight_button.handler_block(self.weight_handler):
+            self.visible_button.set_active(visible)
+            self.weight_button.set_value(weight)
+
+    @property
+    def style(self):
+        return style(self.rgba, self.visible, self.line_weight)
 
     def slider_changed(self, widget):
         self.editor.cursor.cancel_selection()
         equals_index = self.editor.expr.elements.index(formula.BinaryOperatorAtom("="))
         del self.editor.expr.elements[equals_index+1:]
+        self.editor.expr.invalidate()
         cursor = self.editor.cursor
         cursor.reparent(self.editor.expr, -1)
         new_val = round(self.slider.get_value(), 4)
@@ -169,6 +246,9 @@ class FormulaRow():
             elif char.isdigit() or char == ".":
                 self.editor.expr.insert(formula.Atom(char), cursor)
         self.editor.queue_draw()
+        if not self.applying_value:
+            # only a drag of the slider drops the graph's quality while it moves
+            self.app.interacted()
         self.app.gl_area.queue_draw()
 
     def slider_limits_changed(self, widget):
@@ -184,5 +264,8 @@ class FormulaRow():
     def value(self):
         return self.slider.get_value()
 
-    def to_glsl(self):
-        return self.data
+    def to_glsl(self, functions=frozenset()):
+        return classify(*self.editor.expr.to_glsl(functions))[0]
+
+    def to_numpy(self, functions=frozenset()):
+        return classify(*self.editor.expr.to_numpy(functions))[0]
@@ -0,0 +1,246 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Renders documents to PNG files without a display, using EGL or OSMesa.
+
+PyOpenGL chooses its platform when it is first imported, so
+PYOPENGL_PLATFORM must be set to "egl" (the default for `python -m plots
+render`) or "osmesa" before then. Both run on Mesa's llvmpipe where there
+is no GPU.
+"""
+
+import argparse
+import ctypes
+import json
+import multiprocessing
+import os
+import sys
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.error import NullFunctionError
+
+from plots import formularow, parser, renderer
+
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+DEFAULT_ROW = {"rgba": [0.0, 0.0, 0.0, 1.0], "lower": -10.0, "upper": 10.0,
+               "slider": None, "visible": True,
+               "weight": formularow.FormulaRow.line_weight}
+
+def create_context():
+    """Creates an OpenGL 3.3 core context with no window, and makes it
+    current."""
+    if os.environ.get("PYOPENGL_PLATFORM") == "osmesa":
+        return create_osmesa_context()
+    return create_egl_context()
+
+def create_egl_context():
+    from OpenGL import EGL
+    def attributes(*values):
+        return (EGL.EGLint * (len(values) + 1))(*values, EGL.EGL_NONE)
+    major, minor = EGL.EGLint(), EGL.EGLint()
+    try:
+        # needs no display server at all, where Mesa supports it
+        display = EGL.eglGetPlatformDisplayEXT(EGL_PLATFORM_SURFACELESS_MESA,
+                                               EGL.EGL_DEFAULT_DISPLAY, None)
+        EGL.eglInitialize(display, ctypes.pointer(major), ctypes.pointer(minor))
+    except (EGL.EGLError, NullFunctionError):
+        # Mesa without EGL_MESA_platform_surfaceless, or an EGL without
+        # eglGetPlatformDisplayEXT at all
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        EGL.eglInitialize(display, ctypes.pointer(major), ctypes.pointer(minor))
+    config = EGL.EGLConfig()
+    count = EGL.EGLint()
+    EGL.eglChooseConfig(display, attributes(
+        EGL.EGL_SURFACE_TYPE, 0,
+        EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+    ), ctypes.pointer(config), 1, ctypes.pointer(count))
+    if count.value < 1:
+        raise RuntimeError("no suitable EGL config")
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, attributes(
+        EGL.EGL_CONTEXT_MAJOR_VERSION, 3,
+        EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+        EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+    ))
+    if not context:
+        raise RuntimeError("could not create an OpenGL 3.3 context")
+    # the graph is drawn into a framebuffer object, so no surface is needed
+    EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context)
+    return context
+
+def create_osmesa_context():
+    from OpenGL import osmesa, arrays
+    context = osmesa.OSMesaCreateContextAttribs([
+        osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+        osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+        osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 3,
+        osmesa.OSMESA_CONTEXT_MINOR_VERSION, 3,
+        0], None)
+    if not context:
+        raise RuntimeError("could not create an OpenGL 3.3 context")
+    # the graph is drawn into a framebuffer object, so this is never used
+    create_osmesa_context.buffer = arrays.GLubyteArray.zeros((1, 1, 4))
+    osmesa.OSMesaMakeCurrent(context, create_osmesa_context.buffer,
+                             GL_UNSIGNED_BYTE, 1, 1)
+    return context
+
+def load_document(path):
+    """Reads a document: a JSON object with a list of "rows", each with the
+    fields of a RowMemory, of which only "formula" is required, and
+    optionally the "scale" and "translation" of the view."""
+    with open(path) as f:
+        doc = json.load(f)
+    doc.setdefault("scale", 10)
+    doc.setdefault("translation", [0, 0])
+    doc["rows"] = [{**DEFAULT_ROW, **row} for row in doc["rows"]]
+    return doc
+
+def classify_rows(doc):
+    """Returns the formulae, variables, sliders, slider values and formula
+    styles of a document's rows, in the form Renderer expects."""
+    formulae, variables, sliders, slider_values, styles = [], [], [], [], []
+    expressions = []
+    for n, row in enumerate(doc["rows"], 1):
+        try:
+            expressions.append(parser.from_latex(row["formula"]))
+        except parser.LatexError as e:
+            raise parser.LatexError(f"row {n}: {e}") from e
+    for row, (data, value) in zip(doc["rows"], formularow.classify_all(expressions)):
+        if data.type == "formula":
+            formulae.append(data)
+            styles.append(formularow.style(row["rgba"], row["visible"], row["weight"]))
+        elif data.type in ("variable", "function"):
+            variables.append(data)
+        elif data.type == "slider":
+            sliders.append(data)
+            slider_values.append(value if row["slider"] is None else row["slider"])
+    return formulae, variables, sliders, slider_values, styles
+
+class HeadlessRenderer():
+    """Renders documents into an offscreen framebuffer. Compiled programs
+    are shared between documents, and, through the on-disk program cache,
+    between processes."""
+    def __init__(self):
+        self.context = create_context()
+        self.renderer = renderer.Renderer()
+        self.renderer.realize()
+        self.framebuffer = glGenFramebuffers(1)
+        self.renderbuffer = glGenRenderbuffers(1)
+        self.size = None
+
+    def resize(self, width, height):
+        if (width, height) == self.size:
+            return
+        glBindRenderbuffer(GL_RENDERBUFFER, self.renderbuffer)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+                                  GL_RENDERBUFFER, self.renderbuffer)
+        self.size = (width, height)
+
+    def render(self, doc, width, height):
+        """Returns the graph of a document as a height x width x 3 array of
+        bytes, top row first."""
+        formulae, variables, sliders, slider_values, styles = classify_rows(doc)
+        self.renderer.update_shader(formulae, variables, sliders)
+        self.resize(width, height)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        self.renderer.render(width, height, np.array(doc["translation"], 'f'),
+                             doc["scale"], slider_values, styles)
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.framebuffer)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        pixels = glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE)
+        image = np.frombuffer(pixels, np.uint8).reshape(height, width, 3)
+        return image[::-1]
+
+def save_png(image, path):
+    from gi.repository import GLib, GdkPixbuf
+    height, width, _ = image.shape
+    pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(
+        GLib.Bytes.new(image.tobytes()), GdkPixbuf.Colorspace.RGB,
+        False, 8, width, height, 3*width)
+    pixbuf.savev(path, "png", [], [])
+
+_worker = None
+
+def render_file(job):
+    """Renders one document to a PNG, in a worker process.
+
+    Returns the PNG's path, and None, or if the document could not be read,
+    None and the reason, so that one bad document does not stop the rest.
+    """
+    global _worker
+    source, destination, width, height = job
+    if _worker is None:
+        _worker = HeadlessRenderer()
+    try:
+        doc = load_document(source)
+        image = _worker.render(doc, width, height)
+    except (OSError, ValueError, KeyError) as e:
+        # ValueError includes LatexError and json's errors
+        return None, f"{source}: {e}"
+    save_png(image, destination)
+    return destination, None
+
+def parse_size(size):
+    try:
+        width, height = (int(n) for n in size.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, not {size!r}")
+    return width, height
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(
+        prog="plots render",
+        description="Render Plots documents to PNG files without a display.")
+    arg_parser.add_argument("source",
+                            help="a JSON document, or a directory of them")
+    arg_parser.add_argument("-o", "--output", required=True,
+                            help="the PNG file, or directory of PNG files, to write")
+    arg_parser.add_argument("--size", type=parse_size, default=(1280, 720),
+                            help="image size, as WIDTHxHEIGHT (default 1280x720)")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                            help="number of documents to render at once")
+    args = arg_parser.parse_args(argv)
+    width, height = args.size
+
+    if os.path.isdir(args.source):
+        os.makedirs(args.output, exist_ok=True)
+        jobs = [(os.path.join(args.source, name),
+                 os.path.join(args.output, os.path.splitext(name)[0] + ".png"),
+                 width, height)
+                for name in sorted(os.listdir(args.source)) if name.endswith(".json")]
+    else:
+        jobs = [(args.source, args.output, width, height)]
+
+    def report(results):
+        failed = False
+        for destination, error in results:
+            if error is None:
+                print(destination)
+            else:
+                print(error, file=sys.stderr)
+                failed = True
+        return 1 if failed else 0
+
+    if len(jobs) == 1 or args.jobs == 1:
+        return report(render_file(job) for job in jobs)
+    # each worker creates its own context, after the fork
+    with multiprocessing.Pool(min(args.jobs, len(jobs))) as pool:
+        return report(pool.imap_unordered(render_file, jobs))
@@ -0,0 +1,867 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Expression trees, from which GLSL and NumPy code is generated.
+
+Element lists are turned into a stream of tokens (see the ir_tokens methods
+of the elements), which parse() turns into a tree of the nodes below. Every
+expression is a float; the only statements are assignments and definitions. simplify() folds
+constants, and emitting a tree shares repeated subexpressions. Each of these
+passes visits every node once.
+
+A row may also define a function, as f(x, y) = ... The names of the
+functions defined in a document are given to the parser, so that f(x) is
+read as a call of f rather than as f times x.
+"""
+
+from collections import namedtuple
+from itertools import count
+import math
+import numpy as np
+
+
+SUM_LIMIT = 100000  # most terms of a sum or product, so it cannot hang
+FACTORIALS = np.array([float(math.factorial(n)) for n in range(171)])  # 171! overflows
+LANCZOS = [0.99999999999980993, 676.5203681218851, -1259.1392167224028,
+           771.32342877765313, -176.61502916214059, 12.507343278686905,
+           -0.13857109526572012, 9.9843695780195716e-6, 1.5056327351493116e-7]
+
+def _sum(term, start, end):
+    total = 0.0
+    k = start
+    for _ in range(SUM_LIMIT):
+        active = k <= end
+        if not np.any(active):
+            break
+        total = np.where(active, total + term(k), total)
+        k = k + 1
+    return total
+
+def _prod(term, start, end):
+    total = 1.0
+    k = start
+    for _ in range(SUM_LIMIT):
+        active = k <= end
+        if not np.any(active):
+            break
+        total = np.where(active, total * term(k), total)
+        k = k + 1
+    return total
+
+def lanczos_gamma(x):
+    x = x - 1.0
+    a = LANCZOS[0] + sum(c/(x + i) for i, c in enumerate(LANCZOS[1:], 1))
+    t = x + 7.5
+    p = np.power(t, 0.5*x + 0.25)
+    # beyond 172, 171! has overflowed, and exp(-t) would underflow to 0
+    return np.where(x > 171.0, np.inf, math.sqrt(2*math.pi) * p * np.exp(-t) * p * a)
+
+def factorial(x):
+    """The gamma function of x + 1, as in common.glsl, with integers looked
+    up in a table. Infinite at the poles, the negative integers, and where
+    it overflows, which is at 171 rather than common.glsl's 35."""
+    x = np.asarray(x, float)
+    with np.errstate(all="ignore"):
+        integer = (x == np.floor(x)) & (x >= 0) & (x < len(FACTORIALS))
+        table = FACTORIALS[np.where(integer, x, 0).astype(int)]
+        reflected = np.pi / (np.sin(np.pi*(x + 1)) * lanczos_gamma(np.where(x < -0.5, -x, 1.0)))
+        gamma = np.where(x < -0.5, reflected, lanczos_gamma(np.maximum(x + 1, 0.5)))
+        pole = (x == np.floor(x)) & (x < 0)
+        return np.where(integer, table, np.where(pole, np.inf, gamma))
+
+def mypow(x, y):
+    x, y = np.asarray(x, float), np.asarray(y, float)
+    odd = np.mod(y, 2.0) == 1.0
+    negative = np.where(odd, -np.power(-x, y), np.power(-x, y))
+    return np.where(x >= 0, np.power(np.abs(x), y),
+                    np.where(np.floor(y) == y, negative, np.nan))
+
+# the functions and constants of common.glsl, as NumPy functions for
+# folding constants and for plots.cpu
+NAMESPACE = {
+    "_sum": _sum, "_prod": _prod, "factorial": factorial, "mypow": mypow,
+    "pi": math.pi, "e": math.e,
+    "sin": np.sin, "cos": np.cos, "tan": np.tan,
+    "asin": np.arcsin, "acos": np.arccos, "atan": np.arctan,
+    "sinh": np.sinh, "cosh": np.cosh, "tanh": np.tanh,
+    "asinh": np.arcsinh, "acosh": np.arccosh, "atanh": np.arctanh,
+    "exp": np.exp, "log": np.log, "ln": np.log, "lg": np.log2, "log2": np.log2,
+    "sqrt": np.sqrt, "pow": np.power, "abs": np.abs,
+    "floor": np.floor, "ceil": np.ceil, "sign": np.sign, "sgn": np.sign,
+    "max": np.maximum,
+    "sec": lambda x: 1/np.cos(x), "csc": lambda x: 1/np.sin(x),
+    "cot": lambda x: 1/np.tan(x),
+    "asec": lambda x: np.arccos(1/x), "acsc": lambda x: np.arcsin(1/x),
+    "acot": lambda x: np.arctan(1/x) - np.where(x > 0, 0.0, math.pi),
+    "sech": lambda x: 1/np.cosh(x), "csch": lambda x: 1/np.sinh(x),
+    "coth": lambda x: 1/np.tanh(x),
+    "asech": lambda x: np.arccosh(1/x), "acsch": lambda x: np.arcsinh(1/x),
+    "acoth": lambda x: np.arctanh(1/x),
+    "sinc": lambda x: np.sin(x)/x,
+    "_float": np.float64,
+}
+for alias, name in [("arcsin", "asin"), ("arccos", "acos"), ("arctan", "atan"),
+                    ("cosec", "csc"), ("arcsec", "asec"), ("arccsc", "acsc"),
+                    ("acosec", "acsc"), ("arccosec", "acsc"), ("arccot", "acot"),
+                    ("cosech", "csch"), ("acosech", "acsch")]:
+    NAMESPACE[alias] = NAMESPACE[name]
+
+Num = namedtuple("Num", "value")
+Var = namedtuple("Var", "name")
+Neg = namedtuple("Neg", "operand")
+Binary = namedtuple("Binary", "op left right")  # op is one of + - * /
+Call = namedtuple("Call", "function args")
+Sum = namedtuple("Sum", "op var start end term")  # op is + for ∑, * for ∏
+Assign = namedtuple("Assign", "name value")
+Define = namedtuple("Define", "name params value")  # params is a tuple of names
+
+CONSTANTS = {"pi": math.pi, "e": math.e}
+# functions whose results are never negative
+NON_NEGATIVE = {"abs", "sqrt", "exp", "cosh", "sech"}
+# the largest integer exponent computed by multiplication rather than pow
+MULTIPLICATION_LIMIT = 16
+# the most terms of a sum or product with constant bounds to write out in full
+UNROLL_LIMIT = 32
+# calls which are not worth folding, or cannot be folded
+IMPURE = {"_sum", "_prod", "_float", "rand"}
+
+class ParseError(ValueError):
+    pass
+
+class Parser():
+    """Parses a list of tokens by recursive descent. Tokens are tuples whose
+    first item is their kind:
+
+    ("digit", c)   a digit or decimal point, part of a number
+    ("value", n)   an operand which is already a node, e.g. a fraction
+    ("op", c)      a binary operator, one of + - * =
+    ("(",), (")",) brackets
+    (",",)         separates the arguments of a call
+    ("func", name) a function, applied to a bracketed argument or else
+                   to the implicit product which follows it
+    ("^", n)       raises the preceding operand to the power of node n
+    ("!",)         the factorial of the preceding operand
+    ("sum", (op, assign, end))
+                   a sum or product of the implicit product which follows
+    """
+    def __init__(self, tokens, functions=frozenset()):
+        self.tokens = list(tokens)
+        self.functions = functions
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return ("end",)
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return True
+        return False
+
+    def parse(self, assignment=False):
+        node = assignment and self.definition()
+        if node:
+            return node
+        node = self.expression()
+        if assignment and self.accept("op", "="):
+            if not isinstance(node, Var):
+                raise ParseError("can only assign to a variable")
+            node = Assign(node.name, self.expression())
+        if self.peek()[0] != "end":
+            raise ParseError(f"unexpected {self.peek()!r}")
+        return node
+
+    def definition(self):
+        """Parses a function definition, f(x, y) = value, returning None
+        without consuming any tokens if there is not one."""
+        if not (self.peek()[0] == "value" and isinstance(self.peek()[1], Var)):
+            return None
+        name = self.next()[1].name
+        params = []
+        if self.accept("("):
+            while self.peek()[0] == "value" and isinstance(self.peek()[1], Var):
+                params.append(self.next()[1].name)
+                if not self.accept(","):
+                    break
+        if not (params and self.accept(")") and self.accept("op", "=")):
+            self.pos = 0
+            return None
+        if name in ("x", "y") or name in CONSTANTS or name in NAMESPACE:
+            raise ParseError(f"cannot define a function called {name}")
+        if len(set(params)) < len(params):
+            raise ParseError("parameters must have different names")
+        node = Define(name, tuple(params), self.expression())
+        if self.peek()[0] != "end":
+            raise ParseError(f"unexpected {self.peek()!r}")
+        return node
+
+    def expression(self):
+        node = self.term()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            node = Binary(self.next()[1], node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while self.accept("op", "*"):
+            node = Binary("*", node, self.unary())
+        return node
+
+    def unary(self):
+        if self.accept("op", "-"):
+            return Neg(self.unary())
+        if self.accept("op", "+"):
+            return self.unary()
+        return self.implicit()
+
+    def implicit(self):
+        node = self.postfix()
+        while self.peek()[0] in ("digit", "value", "(", "func", "sum"):
+            node = Binary("*", node, self.postfix())
+        return node
+
+    def postfix(self):
+        node = self.primary()
+        while True:
+            token = self.peek()
+            if token[0] == "^":
+                self.next()
+                node = Call("mypow", (node, token[1]))
+            elif token[0] == "!":
+                self.next()
+                node = Call("factorial", (node,))
+            else:
+                return node
+
+    def primary(self):
+        token = self.next()
+        kind = token[0]
+        if kind == "digit":
+            digits = [token[1]]
+            while self.peek()[0] == "digit":
+                digits.append(self.next()[1])
+            try:
+                return Num(float("".join(digits)))
+            except ValueError:
+                raise ParseError(f"bad number {''.join(digits)!r}") from None
+        elif kind == "value":
+            node = token[1]
+            if isinstance(node, Var) and node.name in self.functions and self.accept("("):
+                args = [self.expression()]
+                while self.accept(","):
+                    args.append(self.expression())
+                if not self.accept(")") and self.peek()[0] != "end":
+                    raise ParseError(f"unexpected {self.peek()!r}")
+                return Call(node.name, tuple(args))
+            return node
+        elif kind == "(":
+            node = self.expression()
+            # brackets left open while typing are closed at the end
+            if not self.accept(")") and self.peek()[0] != "end":
+                raise ParseError(f"unexpected {self.peek()!r}")
+            return node
+        elif kind == "func":
+            if self.peek()[0] == "(":
+                return Call(token[1], (self.primary(),))
+            return Call(token[1], (self.unary(),))
+        elif kind == "sum":
+            op, assign, end = token[1]
+            if not isinstance(assign, Assign):
+                raise ParseError("a sum needs a variable to sum over")
+            return Sum(op, assign.name, assign.value, end, self.unary())
+        raise ParseError(f"unexpected {token!r}")
+
+def parse(tokens, assignment=False, functions=frozenset()):
+    """Returns the tree of the tokens, which may be an Assign or a Define if
+    assignment is true, or raises ParseError. functions holds the names of
+    the functions which may be called."""
+    return Parser(tokens, functions).parse(assignment)
+
+def finite(value):
+    return value is not None and math.isfinite(value)
+
+def fold_call(function, args):
+    if function in IMPURE or function not in NAMESPACE:
+        return None
+    with np.errstate(all="ignore"):
+        try:
+            return float(NAMESPACE[function](*(np.float64(a.value) for a in args)))
+        except (TypeError, ValueError, ArithmeticError):
+            return None
+
+def fold_binary(op, a, b):
+    with np.errstate(all="ignore"):
+        a, b = np.float64(a), np.float64(b)
+        return float({"+": a + b, "-": a - b, "*": a * b, "/": a / b}[op])
+
+def simplify(node):
+    """Folds constant subexpressions and makes cheap strength reductions,
+    such as x*1 to x and x/4 to x*0.25. Apart from x^0, which is always 1
+    as pow(0, 0) is undefined in GLSL, never changes where NaN or infinite
+    results occur, so x*0 is left alone."""
+    if isinstance(node, Num):
+        return node
+    elif isinstance(node, Var):
+        if node.name in CONSTANTS:
+            return Num(CONSTANTS[node.name])
+        return node
+    elif isinstance(node, Assign):
+        return Assign(node.name, simplify(node.value))
+    elif isinstance(node, Define):
+        return Define(node.name, node.params, simplify(node.value))
+    elif isinstance(node, Neg):
+        operand = simplify(node.operand)
+        if isinstance(operand, Num):
+            return Num(-operand.value)
+        if isinstance(operand, Neg):
+            return operand.operand
+        return Neg(operand)
+    elif isinstance(node, Binary):
+        return simplify_binary(node.op, simplify(node.left), simplify(node.right))
+    elif isinstance(node, Call):
+        args = tuple(simplify(a) for a in node.args)
+        if all(isinstance(a, Num) for a in args):
+            value = fold_call(node.function, args)
+            if finite(value):
+                return Num(value)
+        if node.function == "mypow":
+            return simplify_power(*args)
+        return Call(node.function, args)
+    elif isinstance(node, Sum):
+        return simplify_sum(node.op, node.var, simplify(node.start),
+                            simplify(node.end), simplify(node.term))
+    raise TypeError(f"not an expression: {node!r}")
+
+def simplify_binary(op, left, right):
+    if isinstance(left, Num) and isinstance(right, Num):
+        value = fold_binary(op, left.value, right.value)
+        if finite(value):
+            return Num(value)
+    if isinstance(right, Num):
+        v = right.value
+        if op in "+-" and v == 0 or op in "*/" and v == 1:
+            return left
+        if op in "+-" and v < 0:
+            return Binary("+" if op == "-" else "-", left, Num(-v))
+        if op == "/" and v != 0 and finite(1/v):
+            return Binary("*", left, Num(1/v))
+    if isinstance(left, Num):
+        if op == "+" and left.value == 0:
+            return right
+        if op == "-" and left.value == 0:
+            return simplify(Neg(right))
+        if op == "*" and left.value == 1:
+            return right
+    if op in "+-" and isinstance(right, Neg):
+        return Binary("+" if op == "-" else "-", left, right.operand)
+    if op in "+-" and isinstance(right, Binary) and right.op in "*/" and \
+       isinstance(right.left, Num) and right.left.value < 0:
+        return Binary("+" if op == "-" else "-", left,
+                      Binary(right.op, Num(-right.left.value), right.right))
+    return Binary(op, left, right)
+
+def simplify_power(base, exponent):
+    """Replaces mypow, which branches on the signs of its arguments, by
+    multiplications for small integer exponents, or by pow where the base
+    cannot be negative."""
+    if isinstance(exponent, Num):
+        n = exponent.value
+        if n == 0:
+            return Num(1.0)
+        if n == int(n) and abs(n) <= MULTIPLICATION_LIMIT:
+            product = multiplications(base, int(abs(n)))
+            return product if n > 0 else Binary("/", Num(1.0), product)
+    if non_negative(base):
+        return Call("pow", (base, exponent))
+    return Call("mypow", (base, exponent))
+
+def multiplications(base, n):
+    """Returns base to the power of n by repeated squaring. The squares use
+    the same node twice, so that the GLSL emitter computes them once."""
+    if n == 1:
+        return base
+    half = multiplications(base, n // 2)
+    square = Binary("*", half, half)
+    return square if n % 2 == 0 else Binary("*", square, base)
+
+def non_negative(node):
+    """Whether node is certainly not negative, when it is not NaN."""
+    if isinstance(node, Num):
+        return node.value >= 0
+    elif isinstance(node, Call):
+        return node.function in NON_NEGATIVE or node.function == "pow" and \
+            non_negative(node.args[0])
+    elif isinstance(node, Binary):
+        if node.op == "*" and node.left is node.right:
+            return True
+        return node.op in "+*/" and non_negative(node.left) and non_negative(node.right)
+    elif isinstance(node, Sum):
+        return non_negative(node.term)
+    return False
+
+def contains(node, var):
+    """Whether the variable var occurs free in node."""
+    if isinstance(node, Var):
+        return node.name == var
+    elif isinstance(node, Neg):
+        return contains(node.operand, var)
+    elif isinstance(node, Binary):
+        return contains(node.left, var) or contains(node.right, var)
+    elif isinstance(node, Call):
+        return any(contains(a, var) for a in node.args)
+    elif isinstance(node, Sum):
+        return contains(node.start, var) or contains(node.end, var) or \
+            node.var != var and contains(node.term, var)
+    return False
+
+def free_variables(node, memo):
+    """Returns the set of variables occurring free in node, remembering the
+    sets of its subexpressions in memo, by id."""
+    if id(node) in memo:
+        return memo[id(node)]
+    if isinstance(node, Var):
+        result = frozenset((node.name,))
+    elif isinstance(node, Neg):
+        result = free_variables(node.operand, memo)
+    elif isinstance(node, Binary):
+        result = free_variables(node.left, memo) | free_variables(node.right, memo)
+    elif isinstance(node, Call):
+        result = frozenset().union(*(free_variables(a, memo) for a in node.args))
+    elif isinstance(node, Sum):
+        result = free_variables(node.start, memo) | free_variables(node.end, memo) | \
+            (free_variables(node.term, memo) - {node.var})
+    else:
+        result = frozenset()
+    memo[id(node)] = result
+    return result
+
+def substitute(node, var, value):
+    """Replaces the free occurrences of the variable var in node by value."""
+    if isinstance(node, Var):
+        return value if node.name == var else node
+    elif isinstance(node, Neg):
+        return Neg(substitute(node.operand, var, value))
+    elif isinstance(node, Binary):
+        return Binary(node.op, substitute(node.left, var, value),
+                      substitute(node.right, var, value))
+    elif isinstance(node, Call):
+        return Call(node.function, tuple(substitute(a, var, value) for a in node.args))
+    elif isinstance(node, Sum):
+        term = node.term if node.var == var else substitute(node.term, var, value)
+        return Sum(node.op, node.var, substitute(node.start, var, value),
+                   substitute(node.end, var, value), term)
+    return node
+
+def polynomial(node, var):
+    """Returns the coefficients of node as a polynomial in var, of degree at
+    most 2, as a dict from degree to node. Returns None if node is not such
+    a polynomial."""
+    if not contains(node, var):
+        return {0: node}
+    elif isinstance(node, Var):
+        return {1: Num(1.0)}
+    elif isinstance(node, Neg):
+        p = polynomial(node.operand, var)
+        return p and {d: Neg(c) for d, c in p.items()}
+    elif isinstance(node, Binary) and node.op in "+-":
+        p, q = polynomial(node.left, var), polynomial(node.right, var)
+        if p is None or q is None:
+            return None
+        result = dict(p)
+        for d, c in q.items():
+            result[d] = Binary(node.op, result[d], c) if d in result else \
+                c if node.op == "+" else Neg(c)
+        return result
+    elif isinstance(node, Binary) and node.op == "*":
+        p, q = polynomial(node.left, var), polynomial(node.right, var)
+        if p is None or q is None or max(p) + max(q) > 2:
+            return None
+        result = {}
+        for d, c in p.items():
+            for e, f in q.items():
+                term = Binary("*", c, f)
+                result[d+e] = Binary("+", result[d+e], term) if d+e in result else term
+        return result
+    elif isinstance(node, Binary) and node.op == "/" and not contains(node.right, var):
+        p = polynomial(node.left, var)
+        return p and {d: Binary("/", c, node.right) for d, c in p.items()}
+    return None
+
+def geometric(node, var):
+    """Returns (c, r) if node is c*r^var, where r is a constant other than 1
+    and c does not depend on var, else None."""
+    if isinstance(node, Call) and node.function in ("mypow", "pow"):
+        base, exponent = node.args
+        if isinstance(exponent, Var) and exponent.name == var and \
+           isinstance(base, Num) and base.value != 1:
+            return Num(1.0), base
+    elif isinstance(node, Binary) and node.op == "*":
+        for a, b in ((node.left, node.right), (node.right, node.left)):
+            g = geometric(a, var)
+            if g is not None and not contains(b, var):
+                return Binary("*", g[0], b), g[1]
+    elif isinstance(node, Binary) and node.op == "/" and not contains(node.right, var):
+        g = geometric(node.left, var)
+        return g and (Binary("/", g[0], node.right), g[1])
+    elif isinstance(node, Neg):
+        g = geometric(node.operand, var)
+        return g and (Neg(g[0]), g[1])
+    return None
+
+def rotations(node, var, found):
+    """Collects into found the arguments of sines and cosines in node which
+    are linear in var, as a dict from argument to (step, offset). Nested
+    sums are not searched, since their terms are evaluated in their own
+    loops."""
+    if isinstance(node, Call) and node.function in ("sin", "cos"):
+        p = polynomial(node.args[0], var)
+        if p is not None and max(p) == 1:
+            found[node.args[0]] = (p[1], p.get(0, Num(0.0)))
+            return found
+    if isinstance(node, Neg):
+        rotations(node.operand, var, found)
+    elif isinstance(node, Binary):
+        rotations(node.left, var, found)
+        rotations(node.right, var, found)
+    elif isinstance(node, Call):
+        for arg in node.args:
+            rotations(arg, var, found)
+    return found
+
+def simplify_sum(op, var, start, end, term):
+    """Lowers a sum or product with a closed form, or with few enough terms
+    to write out, to an expression without a loop."""
+    # a loop evaluates sines and cosines of multiples of the loop variable
+    # by rotation, which is cheaper than writing them out
+    if isinstance(start, Num) and isinstance(end, Num) and not rotations(term, var, {}):
+        n = max(math.floor(end.value - start.value) + 1, 0)
+        if n <= UNROLL_LIMIT:
+            if n == 0:
+                return Num(0.0 if op == "+" else 1.0)
+            terms = [substitute(term, var, Num(start.value + i)) for i in range(n)]
+            result = terms[0]
+            for t in terms[1:]:
+                result = Binary(op, result, t)
+            return simplify(result)
+    # the number of terms, which the loop would run for
+    n = Call("max", (Binary("+", Call("floor", (Binary("-", end, start),)), Num(1.0)),
+                     Num(0.0)))
+    if op == "*":
+        if not contains(term, var):
+            return simplify(Call("mypow", (term, n)))
+        return Sum(op, var, start, end, term)
+    p = polynomial(term, var)
+    if p is not None:
+        # sums of 1, j and j^2 for j from 0 to n - 1, where k = start + j
+        s0 = n
+        s1 = Binary("/", Binary("*", n, Binary("-", n, Num(1.0))), Num(2.0))
+        s2 = Binary("/", Binary("*", Binary("*", Binary("-", n, Num(1.0)), n),
+                                Binary("-", Binary("*", Num(2.0), n), Num(1.0))), Num(6.0))
+        if start == Num(0.0):
+            sums = [s0, s1, s2]
+        else:
+            sums = [s0,
+                    Binary("+", Binary("*", start, s0), s1),
+                    Binary("+", Binary("+", Binary("*", Binary("*", start, start), s0),
+                                        Binary("*", Binary("*", Num(2.0), start), s1)), s2)]
+        result = None
+        for d, c in sorted(p.items()):
+            t = Binary("*", c, sums[d])
+            result = t if result is None else Binary("+", result, t)
+        return simplify(result)
+    g = geometric(term, var)
+    if g is not None:
+        c, r = g
+        # c r^start (r^n - 1)/(r - 1)
+        return simplify(Binary("*", Binary("*", c, Call("mypow", (r, start))),
+                               Binary("/", Binary("-", Call("mypow", (r, n)), Num(1.0)),
+                                      Binary("-", r, Num(1.0)))))
+    return Sum(op, var, start, end, term)
+
+PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2}
+UNARY = 3
+ATOM = 4
+
+def number(value):
+    # repr gives the shortest string which reads back as the same float,
+    # always with a decimal point or an exponent, as GLSL needs
+    return repr(float(value))
+
+class Emitter():
+    """Emits an expression tree as code, as (body, expr) strings. The body
+    holds statements which must run before the expression is evaluated.
+
+    Subclasses give the syntax of calls and sums.
+    """
+    def emit(self, node):
+        if isinstance(node, Assign):
+            body, expr = self.emit(node.value)
+            return body, f"{node.name}={expr}"
+        elif isinstance(node, Define):
+            # parameters are prefixed so as not to clash with the names of
+            # variables, which may be macros in GLSL
+            value = node.value
+            for param in node.params:
+                value = substitute(value, param, Var("_" + param))
+            body, expr = self.emit(value)
+            params = ", ".join("_" + param for param in node.params)
+            return body, f"{node.name}({params})={expr}"
+        lines = []
+        expr = self.scope(node, lines)
+        return "\n".join(lines), expr
+
+    def scope(self, node, lines):
+        return self.expression(node, lines)
+
+    def expression(self, node, lines):
+        if isinstance(node, Num):
+            return number(node.value)
+        elif isinstance(node, Var):
+            return node.name
+        elif isinstance(node, Neg):
+            return "-" + self.operand(node.operand, UNARY, lines, right=True)
+        elif isinstance(node, Binary):
+            p = PRECEDENCE[node.op]
+            left = self.operand(node.left, p, lines)
+            # the parser is left associative, so an equal precedence on the
+            # right came from brackets, which matter for floats
+            right = self.operand(node.right, p + 1, lines, right=True)
+            return f"{left}{node.op}{right}"
+        elif isinstance(node, Call):
+            args = ", ".join(self.expression(a, lines) for a in node.args)
+            return f"{node.function}({args})"
+        elif isinstance(node, Sum):
+            return self.sum(node, lines)
+        raise TypeError(f"not an expression: {node!r}")
+
+    def precedence(self, node):
+        if isinstance(node, Binary):
+            return PRECEDENCE[node.op]
+        if isinstance(node, Neg) or isinstance(node, Num) and node.value < 0:
+            return UNARY
+        return ATOM
+
+    def operand(self, node, p, lines, right=False):
+        expr = self.expression(node, lines)
+        q = self.precedence(node)
+        # unary minus is bracketed after operators, so as not to give x--y
+        if q < p or right and q == UNARY:
+            return f"({expr})"
+        return expr
+
+class GLSLEmitter(Emitter):
+    """Emits GLSL, writing sums as loops in the body. Subexpressions which
+    occur more than once within a loop body, or outside all loops, are
+    computed once into temporaries."""
+    def __init__(self):
+        self.sum_names = count()
+        self.temporary_names = count()
+        self.ids, self.shared, self.temporaries = {}, set(), {}
+
+    def scope(self, node, lines):
+        ids = {}
+        self.identify(node, ids, {})
+        counts = {}
+        self.count(node, ids, counts)
+        shared = {key for key, n in counts.items() if n > 1}
+        saved = self.ids, self.shared, self.temporaries
+        self.ids, self.shared, self.temporaries = ids, shared, {}
+        try:
+            return self.expression(node, lines)
+        finally:
+            self.ids, self.shared, self.temporaries = saved
+
+    @staticmethod
+    def children(node):
+        if isinstance(node, Neg):
+            return (node.operand,)
+        elif isinstance(node, Binary):
+            return (node.left, node.right)
+        elif isinstance(node, Call):
+            return node.args
+        elif isinstance(node, Sum):
+            # the term is left for the sum's own scope
+            return (node.start, node.end)
+        return ()
+
+    def identify(self, node, ids, keys):
+        """Gives node and its subexpressions ids, which are equal for equal
+        subtrees. A key is made from the ids of a node's children, so its
+        size does not depend on the size of the subtree."""
+        child_keys = tuple(self.identify(c, ids, keys) for c in self.children(node))
+        if isinstance(node, (Num, Var)):
+            key = node
+        elif isinstance(node, Sum):
+            # sums are not shared, so need not be compared
+            key = ("sum", id(node))
+        else:
+            key = (type(node).__name__, getattr(node, "op", None),
+                   getattr(node, "function", None), child_keys)
+        ids[id(node)] = key = keys.setdefault(key, len(keys))
+        return key
+
+    def count(self, node, ids, counts):
+        """Counts how often each id occurs. The children of a repeated
+        subtree are only counted the first time, since later occurrences
+        will use its temporary."""
+        key = ids[id(node)]
+        counts[key] = counts.get(key, 0) + 1
+        if counts[key] == 1:
+            for child in self.children(node):
+                self.count(child, ids, counts)
+
+    def expression(self, node, lines):
+        key = self.ids.get(id(node))
+        if key in self.temporaries:
+            return self.temporaries[key]
+        expr = super().expression(node, lines)
+        if key in self.shared and not isinstance(node, (Num, Var, Sum)):
+            name = f"t{next(self.temporary_names)}"
+            lines.append(f"float {name} = {expr};")
+            self.temporaries[key] = expr = name
+        return expr
+
+    def precedence(self, node):
+        if self.ids.get(id(node)) in self.temporaries:
+            return ATOM
+        return super().precedence(node)
+
+    def sum(self, node, lines):
+        start = self.expression(node.start, lines)
+        # the end is compared against on every iteration
+        end = self.temporary(self.expression(node.end, lines), lines)
+        term = self.hoist(node.term, {node.var}, lines, {}, {})
+        term, updates = self.rotate(term, node, lines)
+        body = []
+        term = self.scope(term, body)
+        name = f"sum{next(self.sum_names)}"
+        lines.append(f"float {name} = {'0.0' if node.op == '+' else '1.0'};")
+        lines.append(f"for (float {node.var}={start}; {node.var} <= {end}; {node.var}++) {{")
+        lines.extend("    " + line for line in body)
+        lines.append(f"    {name} {node.op}= {term};")
+        lines.extend("    " + line for line in updates)
+        lines.append("}")
+        return name
+
+    def rotate(self, term, node, lines):
+        """Replaces sines and cosines of a + b*k in the term of a sum over k
+        by variables which are rotated by b on each iteration, using
+        sin(x + b) = sin(x)cos(b) + cos(x)sin(b) and the like. Returns the
+        new term and the statements which rotate the variables."""
+        found = rotations(term, node.var, {})
+        replacements = {}
+        updates = []
+        for arg, (step, offset) in found.items():
+            step = self.temporary(self.scope(simplify(step), lines), lines)
+            offset = simplify(offset)
+            if node.start == Num(0.0):
+                phase = offset
+            elif node.start == Num(1.0):
+                phase = simplify(Binary("+", Var(step), offset))
+            else:
+                phase = simplify(Binary("+", Binary("*", Var(step), node.start), offset))
+            phase = self.temporary(self.scope(phase, lines), lines)
+            s, c, ds, dc, t = (f"t{next(self.temporary_names)}" for _ in range(5))
+            lines.append(f"float {s} = sin({phase});")
+            lines.append(f"float {c} = cos({phase});")
+            if phase == step:
+                lines.append(f"float {ds} = {s};")
+                lines.append(f"float {dc} = {c};")
+            else:
+                lines.append(f"float {ds} = sin({step});")
+                lines.append(f"float {dc} = cos({step});")
+            updates.append(f"float {t} = {s}*{dc}+{c}*{ds};")
+            updates.append(f"{c} = {c}*{dc}-{s}*{ds};")
+            updates.append(f"{s} = {t};")
+            replacements[Call("sin", (arg,))] = Var(s)
+            replacements[Call("cos", (arg,))] = Var(c)
+        return self.replace(term, replacements), updates
+
+    def replace(self, node, replacements):
+        if node in replacements:
+            return replacements[node]
+        elif isinstance(node, Neg):
+            return Neg(self.replace(node.operand, replacements))
+        elif isinstance(node, Binary):
+            return Binary(node.op, self.replace(node.left, replacements),
+                          self.replace(node.right, replacements))
+        elif isinstance(node, Call):
+            return Call(node.function, tuple(self.replace(a, replacements)
+                                             for a in node.args))
+        return node
+
+    def temporary(self, expr, lines):
+        """Returns a name holding expr, which is expr itself if it is a
+        name or a number."""
+        if expr.isidentifier():
+            return expr
+        try:
+            float(expr)
+            return expr
+        except ValueError:
+            name = f"t{next(self.temporary_names)}"
+            lines.append(f"float {name} = {expr};")
+            return name
+
+    def hoist(self, node, bound, lines, memo, hoisted):
+        """Computes the subexpressions of a loop body which do not depend on
+        the loop variables bound before the loop, returning the body with
+        them replaced by their temporaries."""
+        if isinstance(node, (Num, Var)):
+            return node
+        if not free_variables(node, memo) & bound:
+            if node not in hoisted:
+                hoisted[node] = Var(self.temporary(self.scope(node, lines), lines))
+            return hoisted[node]
+        if isinstance(node, Neg):
+            return Neg(self.hoist(node.operand, bound, lines, memo, hoisted))
+        elif isinstance(node, Binary):
+            return Binary(node.op, self.hoist(node.left, bound, lines, memo, hoisted),
+                          self.hoist(node.right, bound, lines, memo, hoisted))
+        elif isinstance(node, Call):
+            return Call(node.function, tuple(self.hoist(a, bound, lines, memo, hoisted)
+                                             for a in node.args))
+        elif isinstance(node, Sum):
+            return Sum(node.op, node.var,
+                       self.hoist(node.start, bound, lines, memo, hoisted),
+                       self.hoist(node.end, bound, lines, memo, hoisted),
+                       self.hoist(node.term, bound | {node.var}, lines, memo, hoisted))
+        return node
+
+class NumPyEmitter(Emitter):
+    """Emits a NumPy expression, with sums as calls to plots.ir._sum and
+    _prod. The body is always empty."""
+    def sum(self, node, lines):
+        function = "_sum" if node.op == "+" else "_prod"
+        term = self.expression(node.term, lines)
+        start = self.expression(node.start, lines)
+        end = self.expression(node.end, lines)
+        return f"{function}(lambda {node.var}: {term}, {start}, {end})"
+
+def to_glsl(node):
+    return GLSLEmitter().emit(simplify(node))
+
+def to_numpy(node):
+    return NumPyEmitter().emit(simplify(node))
@@ -15,124 +15,113 @@
 # You should have received a copy of the GNU General Public License
 # along with Plots.  If not, see <https://www.gnu.org/licenses/>.
 
-from lark import Lark, Transformer
+"""Reads the LaTeX written by the elements' to_latex methods back into an
+ElementList, by recursive descent, in time linear in its length."""
+
+import re
 
 from plots import elements
 
-class LatexTransformer(Transformer):
-    def list(self, items):
+class LatexError(ValueError):
+    pass
+
+# commands are matched by name rather than as a run of letters, since
+# to_latex may write a letter straight after one, as in \timesx
+TOKEN = re.compile(r"\s*(\\(?:times|operatorname|frac|sqrt|abs|floor|ceil|sum|prod|\{|\})|\S)")
+BINARY_OPERATORS = {"+": "+", "-": "−", "=": "=", "\\times": "×"}
+PARENS = {"(": "(", "[": "[", ")": ")", "]": "]", "\\{": "{", "\\}": "}"}
+WRAPPED = {"\\abs": elements.Abs, "\\floor": elements.Floor, "\\ceil": elements.Ceil}
+SUMS = {"\\sum": "∑", "\\prod": "∏"}
+
+def is_atom(token):
+    return ("a" <= token <= "z" or "A" <= token <= "Z" or "0" <= token <= "9"
+            or "α" <= token <= "ω" or "Α" <= token <= "Ω" or token in ".!,")
+
+class LatexParser():
+    def __init__(self, string):
+        self.tokens = TOKEN.findall(string)
+        self.pos = 0
+
+    def error(self, expected=None):
+        found = repr(self.tokens[self.pos]) if self.pos < len(self.tokens) else "end of input"
+        message = f"unexpected {found} at token {self.pos}"
+        if expected:
+            message += f", expected {expected}"
+        return LatexError(message)
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else ""
+
+    def expect(self, token):
+        if self.peek() != token:
+            raise self.error(repr(token))
+        self.pos += 1
+
+    def list(self, end=None):
+        """Parses elements up to a closing brace, end, or the end of the
+        input, none of which are consumed."""
+        items = []
+        while self.peek() not in ("", "}", end):
+            items.append(self.element())
         return elements.ElementList(elements=items)
 
-    def atom(self, items):
-        return elements.Atom(items[0])
-
-    def times(self, _):
-        return elements.BinaryOperatorAtom("×")
-
-    def plus(self, _):
-        return elements.BinaryOperatorAtom("+")
-
-    def minus(self, _):
-        return elements.BinaryOperatorAtom("−")
-
-    def equals(self, _):
-        return elements.BinaryOperatorAtom("=")
-
-    def operator(self, items):
-        return elements.OperatorAtom(items[0].value)
-
-    def superscript(self, items):
-        return elements.SuperscriptSubscript(exponent=items[0])
-
-    def subscript(self, items):
-        return elements.SuperscriptSubscript(subscript=items[0])
-
-    def subscriptsuperscript(self, items):
-        return elements.SuperscriptSubscript(subscript=items[0], exponent=items[1])
-
-    def frac(self, items):
-        return elements.Frac(numerator=items[0], denominator=items[1])
-
-    def sqrt(self, items):
-        return elements.Radical(items[0])
-
-    def nthroot(self, items):
-        return elements.Radical(items[1], index=items[0])
-
-    def abs(self, items):
-        return elements.Abs(items[0])
-
-    def floor(self, items):
-        return elements.Floor(items[0])
-
-    def ceil(self, items):
-        return elements.Ceil(items[0])
-
-    def paren(self, items):
-        return elements.Paren(items[0].value.replace("\\", ""))
-
-    def sum(self, items):
-        return elements.Sum(char="∑", bottom=items[0], top=items[1])
-
-    def prod(self, items):
-        return elements.Sum(char="∏", bottom=items[0], top=items[1])
-
-latex_parser = Lark(r"""
-list : element*
-?blist : "{" list "}"
-?element : atom
-         | binary
-         | operator
-         | supersub
-         | frac
-         | radical
-         | abs
-         | floor
-         | ceil
-         | paren
-         | sum
-         | prod
-         | subscriptsuperscript
-
-GREEK : "α".."ω" | "Α".."Ω"
-SYMBOL : "." | "!"
-atom : LETTER | GREEK | DIGIT | SYMBOL
-
-TIMES : "\\times"
-binary : TIMES -> times
-       | "+" -> plus
-       | "-" -> minus
-       | "=" -> equals
-
-OPNAME : LETTER+
-operator : "\\operatorname{" OPNAME "}"
-
-subscriptsuperscript.2 : "_" blist "^" blist
-supersub : "_" blist -> subscript
-         | "^" blist -> superscript
-
-frac.10 : "\\frac" blist blist
-
-radical : "\\sqrt" blist -> sqrt
-        | "\\sqrt" "[" list "]" blist -> nthroot
-
-abs : "\\abs" blist
-floor : "\\floor" blist
-ceil : "\\ceil" blist
-
-PAREN : "(" | "[" | "\\{" | ")" | "]" | "\\}"
-paren : PAREN
-
-sum : "\\sum" "_" blist "^" blist
-prod : "\\prod" "_" blist "^" blist
-
-%import common.LETTER
-%import common.DIGIT
-
-%import common.WS
-%ignore WS
-""", start='list') # lalr seems to have problems with ']'
+    def group(self):
+        self.expect("{")
+        items = self.list()
+        self.expect("}")
+        return items
+
+    def element(self):
+        token = self.peek()
+        self.pos += 1
+        if is_atom(token):
+            return elements.Atom(token)
+        elif token in BINARY_OPERATORS:
+            return elements.BinaryOperatorAtom(BINARY_OPERATORS[token])
+        elif token in PARENS:
+            return elements.Paren(PARENS[token])
+        elif token == "^":
+            return elements.SuperscriptSubscript(exponent=self.group())
+        elif token == "_":
+            subscript = self.group()
+            if self.peek() == "^":
+                self.pos += 1
+                return elements.SuperscriptSubscript(subscript=subscript,
+                                                     exponent=self.group())
+            return elements.SuperscriptSubscript(subscript=subscript)
+        elif token == "\\operatorname":
+            self.expect("{")
+            start = self.pos
+            while "a" <= self.peek().lower() <= "z":
+                self.pos += 1
+            if self.pos == start:
+                raise self.error("a function name")
+            name = "".join(self.tokens[start:self.pos])
+            self.expect("}")
+            return elements.OperatorAtom(name)
+        elif token == "\\frac":
+            return elements.Frac(numerator=self.group(), denominator=self.group())
+        elif token == "\\sqrt":
+            if self.peek() == "[":
+                self.pos += 1
+                index = self.list("]")
+                self.expect("]")
+                return elements.Radical(self.group(), index=index)
+            return elements.Radical(self.group())
+        elif token in WRAPPED:
+            return WRAPPED[token](self.group())
+        elif token in SUMS:
+            self.expect("_")
+            bottom = self.group()
+            self.expect("^")
+            return elements.Sum(char=SUMS[token], bottom=bottom, top=self.group())
+        self.pos -= 1
+        raise self.error()
 
-transformer = LatexTransformer()
 def from_latex(string):
-    return transformer.transform(latex_parser.parse(string))
+    """Returns the ElementList written as string, or raises LatexError."""
+    parser = LatexParser(string)
+    items = parser.list()
+    if parser.peek():
+        raise parser.error()
+    return items
@@ -21,12 +21,9 @@ import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk, GLib, Gio, GdkPixbuf
 
-from plots import formula, formularow, rowcommands
+from plots import formula, formularow, rowcommands, renderer, tiles, profiling, cpu
 from OpenGL.GL import *
 from OpenGL.GLU import *
-from OpenGL.arrays import vbo
-from OpenGL.GL import shaders
-from jinja2 import Environment, FileSystemLoader, PackageLoader
 import sys
 try:
     import importlib.resources as resources
@@ -34,22 +31,38 @@ except ModuleNotFoundError:
     import importlib_resources as resources
 import re
 import math
+import cairo
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 class Plots(Gtk.Application):
     INIT_SCALE = 10
+    UPDATE_DELAY = 30  # ms to wait for more edits before updating the shaders
+    COMPILE_POLL = 10  # ms between checks for compiled shaders
+    # samples per pixel column in each stage of refinement, from the one used
+    # while the graph is being interacted with, to full quality when idle
+    SAMPLE_STAGES = (8, 18, renderer.Renderer.SAMPLES)
+    REFINE_DELAY = 150  # ms without interaction before each refinement stage
     def __init__(self):
         super().__init__(application_id="com.github.alexhuntley.Plots")
         self._scale = self.INIT_SCALE
         self._translation = np.array([0, 0], 'f')
-        self.jinja_env = Environment(loader=PackageLoader('plots', 'shaders'))
-        self.vertex_template = self.jinja_env.get_template('vertex.glsl')
-        self.fragment_template = self.jinja_env.get_template('fragment.glsl')
+        self.profiler = profiling.Profiler.from_environment()
+        self.renderer = renderer.Renderer(self.profiler)
+        self.tiles = tiles.TileCache(self.renderer)
+        self.cpu = False  # whether the graph is drawn by cpu.CPURenderer
         self.rows = []
         self.slider_rows = []
+        self.formula_rows = []
         self.history = []
         self.history_position = 0 # index of the last undone command / next in line for redo
         self.overlay_source = None
+        self.update_source = None
+        self.compile_source = None
+        self.next_sources = None
+        self.stage = len(self.SAMPLE_STAGES) - 1
+        self.refine_source = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
 
     @property
     def scale(self):
@@ -125,6 +138,8 @@ class Plots(Gtk.Application):
         self.zoom_reset_button = builder.get_object("zoom_reset")
         self.zoom_reset_button.connect("clicked", self.reset_zoom)
         self.update_zoom_reset()
+        self.profile_label = builder.get_object("profile_label")
+        self.profile_label.set_visible(self.profiler.enabled)
 
         menu_button = builder.get_object("menu_button")
 
@@ -163,6 +178,10 @@ class Plots(Gtk.Application):
 .zoom-box {
         background-color: rgba(0, 0, 0, 0);
 }
+.profile-label {
+        font-family: monospace;
+        padding: 4px;
+}
 '''
         css_provider = Gtk.CssProvider()
         css_provider.load_from_data(css.encode())
@@ -171,6 +190,13 @@ class Plots(Gtk.Application):
         context.add_provider_for_screen(screen, css_provider,
                                         Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
 
+        self.connect_graph_area()
+        self.graph_overlay.add_events(Gdk.EventMask.ENTER_NOTIFY_MASK)
+        self.graph_overlay.connect('enter-notify-event', self.enter_overlay_cb)
+
+        self.refresh_history_buttons()
+
+    def connect_graph_area(self):
         self.drag = Gtk.GestureDrag(widget=self.gl_area)
         self.drag.set_propagation_phase(Gtk.PropagationPhase.CAPTURE)
         self.drag.connect("drag-update", self.drag_update)
@@ -179,73 +205,104 @@ class Plots(Gtk.Application):
         self.gl_area.connect('scroll_event', self.scroll_zoom)
         self.gl_area.add_events(Gdk.EventMask.POINTER_MOTION_MASK)
         self.gl_area.connect('motion-notify-event', self.motion_cb)
-        self.graph_overlay.add_events(Gdk.EventMask.ENTER_NOTIFY_MASK)
-        self.graph_overlay.connect('enter-notify-event', self.enter_overlay_cb)
 
-        self.refresh_history_buttons()
+    def do_shutdown(self):
+        self.profiler.save()
+        Gtk.Application.do_shutdown(self)
 
     def gl_render(self, area, context):
         area.make_current()
         w = area.get_allocated_width() * area.get_scale_factor()
         h = area.get_allocated_height() * area.get_scale_factor()
         self.viewport = np.array([w, h], 'f')
-        graph_extent = 2*self.viewport/self.viewport[0]*self.scale
-        # extent of each pixel, in graph coordinates
-        pixel_extent = graph_extent / self.viewport
-        glViewport(0, 0, w, h)
-
-        glClearColor(0, 0, 1, 0)
-        glClear(GL_COLOR_BUFFER_BIT)
-
-        shaders.glUseProgram(self.shader)
-        glUniform2f(glGetUniformLocation(self.shader, "viewport"), *self.viewport)
-        glUniform2f(glGetUniformLocation(self.shader, "translation"), *self.translation)
-        glUniform2f(glGetUniformLocation(self.shader, "pixel_extent"), *pixel_extent)
-        glUniform1f(glGetUniformLocation(self.shader, "scale"), self.scale)
-        for slider in self.slider_rows:
-            glUniform1f(glGetUniformLocation(self.shader, slider.name), slider.value)
-        glBindVertexArray(self.vao)
-        glDrawArrays(GL_TRIANGLES, 0, 18)
-        glBindVertexArray(0)
-
+        slider_values = [row.value for row in self.slider_rows]
+        styles = [row.style for row in self.formula_rows]
+        samples = self.SAMPLE_STAGES[self.stage]
+        self.profiler.next_frame()
+        with self.profiler.span("draw", samples=samples):
+            complete = self.tiles.draw(w, h, self.translation, self.scale,
+                                       slider_values, styles, samples)
+        if not complete:
+            GLib.idle_add(area.queue_draw)
+        if self.profiler.enabled:
+            self.profile_label.set_text(self.profiler.summary())
         return True
 
     def gl_realize(self, area):
         area.make_current()
 
         if (area.get_error() != None):
+            self.errorlabel.set_text("Warning: OpenGL is unavailable, so graphs will be drawn slowly.")
+            self.errorbar.props.revealed = True
+            GLib.idle_add(self.use_cpu)
             return
 
         version = glGetString(GL_VERSION).decode().split(" ")[0]
         if version < "3.3":
-            self.errorlabel.set_text(f"Warning: OpenGL {version} is unsupported. Plots supports OpenGL 3.3 or greater.")
+            self.errorlabel.set_text(f"Warning: OpenGL {version} is unsupported, so graphs will be drawn slowly. Plots supports OpenGL 3.3 or greater.")
             self.errorbar.props.revealed = True
+            GLib.idle_add(self.use_cpu)
+            return
 
-        self.vertex_shader = shaders.compileShader(
-            self.vertex_template.render(), GL_VERTEX_SHADER)
+        self.renderer.realize()
         self.update_shader()
 
-        self.vbo = vbo.VBO(np.array([
-            [-1, -1, 0],
-            [-1, 1, 0],
-            [1, 1, 0],
-            [-1, -1, 0],
-            [1, -1, 0],
-            [1, 1, 0]
-        ],'f'), usage="GL_STATIC_DRAW_ARB")
-
-        self.vao = glGenVertexArrays(1)
-        glBindVertexArray(self.vao)
-        self.vbo.bind()
-        self.vbo.copy_data()
-        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 3*self.vbo.data.itemsize, self.vbo)
-        glEnableVertexAttribArray(0)
-        self.vbo.unbind()
-        glBindVertexArray(0)
+    def use_cpu(self):
+        """Replaces the GL area with a drawing area, drawn by CPURenderer."""
+        self.cpu = True
+        self.renderer = cpu.CPURenderer()
+        self.tiles = None
+        self.graph_overlay.remove(self.gl_area)
+        self.gl_area = Gtk.DrawingArea(visible=True)
+        self.gl_area.connect("draw", self.cpu_draw)
+        self.graph_overlay.add(self.gl_area)
+        self.connect_graph_area()
+        self.update_shader()
+        return False
+
+    def cpu_draw(self, area, ctx):
+        scale_factor = area.get_scale_factor()
+        w = area.get_allocated_width() * scale_factor
+        h = area.get_allocated_height() * scale_factor
+        self.viewport = np.array([w, h], 'f')
+        slider_values = [row.value for row in self.slider_rows]
+        styles = [row.style for row in self.formula_rows]
+        samples = self.SAMPLE_STAGES[self.stage]
+        with self.profiler.span("draw", samples=samples):
+            image = self.renderer.render(w, h, self.translation, self.scale,
+                                         slider_values, styles, samples)
+        # cairo's RGB24 is stored as BGRX
+        pixels = np.empty((h, w, 4), np.uint8)
+        pixels[..., 2::-1] = image
+        surface = cairo.ImageSurface.create_for_data(
+            memoryview(pixels), cairo.FORMAT_RGB24, w, h, 4*w)
+        ctx.scale(1/scale_factor, 1/scale_factor)
+        ctx.set_source_surface(surface, 0, 0)
+        ctx.paint()
+        if self.profiler.enabled:
+            self.profile_label.set_text(self.profiler.summary())
+        return True
+
+    def interacted(self):
+        """Drops to the fastest stage of refinement, refining again once the
+        interaction has stopped for REFINE_DELAY."""
+        self.stage = 0
+        if self.refine_source is not None:
+            GLib.source_remove(self.refine_source)
+        self.refine_source = GLib.timeout_add(self.REFINE_DELAY, self.refine)
+
+    def refine(self):
+        self.stage += 1
+        self.gl_area.queue_draw()
+        if self.stage < len(self.SAMPLE_STAGES) - 1:
+            return True
+        self.refine_source = None
+        return False
 
     def drag_update(self, gesture, dx, dy):
         dr = 2*np.array([dx, -dy], 'f')/self.viewport[0]*self.gl_area.get_scale_factor()
         self.translation = self.init_translation + dr*self.scale
+        self.interacted()
         self.gl_area.queue_draw()
 
     def drag_begin(self, gesture, start_x, start_y):
@@ -254,6 +311,7 @@ class Plots(Gtk.Application):
     def scroll_zoom(self, widget, event):
         _, dx, dy = event.get_scroll_deltas()
         self.scale *= math.exp(dy/10)
+        self.interacted()
         widget.queue_draw()
 
     def zoom(self, button, factor):
@@ -295,32 +353,79 @@ class Plots(Gtk.Application):
 
 
     def update_shader(self):
+        """Schedules the shaders to be regenerated once a burst of edits is
+        over. The graph is drawn with the previous shaders until the new ones
+        have been compiled."""
+        if not self.gl_area.get_realized():
+            return
+        if self.update_source is not None:
+            GLib.source_remove(self.update_source)
+        self.update_source = GLib.timeout_add(self.UPDATE_DELAY, self.generate_shaders)
+
+    def functions(self):
+        """Returns the names of the functions defined by the rows."""
+        return frozenset(r.data.name for r in self.rows if r.data.type == "function")
+
+    def generate_shaders(self):
+        self.update_source = None
         formulae = []
         variables = []
         sliders = []
-        self.slider_rows.clear()
-        for r in self.rows:
-            data = r.to_glsl()
+        slider_rows = []
+        formula_rows = []
+        labels = []
+        functions = self.functions()
+        for n, r in enumerate(self.rows, 1):
+            data = r.to_numpy(functions) if self.cpu else r.to_glsl(functions)
             if data.type == "formula":
                 formulae.append(data)
-            elif data.type == "variable":
+                formula_rows.append(r)
+                labels.append(f"row {n}")
+            elif data.type in ("variable", "function"):
                 variables.append(data)
             elif data.type == "slider":
                 sliders.append(data)
-                self.slider_rows.append(r)
+                slider_rows.append(r)
+        future = self.executor.submit(self.renderer.generate, formulae, variables, sliders,
+                                      labels)
+        future.add_done_callback(
+            lambda f: GLib.idle_add(self.shaders_generated, f, slider_rows, formula_rows))
+        return False
+
+    def shaders_generated(self, future, slider_rows, formula_rows):
         try:
-            fragment_shader = shaders.compileShader(
-                self.fragment_template.render(formulae=formulae, variables=variables,
-                                              sliders=sliders),
-                GL_FRAGMENT_SHADER)
-        except RuntimeError as e:
-            print(e.args[0].encode('ascii', 'ignore').decode('unicode_escape'))
-            fragment_shader = shaders.compileShader(
-                self.fragment_template.render(formulae=[], variables=[], sliders=[]),
-                GL_FRAGMENT_SHADER)
-            #print(e.args[1][0].decode())
-        self.shader = shaders.compileProgram(self.vertex_shader, fragment_shader)
+            sources = future.result()
+        except Exception as e:
+            # keep drawing the last sources which could be generated
+            print(f"could not generate shaders: {e!r}")
+            return False
+        self.next_sources = sources, slider_rows, formula_rows
+        if self.compile_source is None:
+            self.start_compile()
+        return False
+
+    def start_compile(self):
+        sources, *self.compiling_rows = self.next_sources
+        self.next_sources = None
+        if not self.cpu:
+            self.gl_area.make_current()
+        self.compile_start = self.profiler.timestamp()
+        self.renderer.start_update(sources)
+        self.compile_source = GLib.timeout_add(self.COMPILE_POLL, self.poll_compile)
+
+    def poll_compile(self):
+        if not self.cpu:
+            self.gl_area.make_current()
+        if not self.renderer.update_ready():
+            return True
+        self.profiler.record("compile", self.compile_start, self.profiler.timestamp())
+        self.renderer.finish_update()
+        self.slider_rows, self.formula_rows = self.compiling_rows
+        self.compile_source = None
         self.gl_area.queue_draw()
+        if self.next_sources is not None:
+            self.start_compile()
+        return False
 
     def add_equation(self, _, record=True):
         row = formularow.FormulaRow(self)
@@ -0,0 +1,142 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+from OpenGL.GL import *
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+class Profiler():
+    """Records how long parts of Plots take, on the CPU and on the GPU.
+
+    Timings are kept as Chrome trace events, which can be saved with save()
+    and loaded into chrome://tracing or Perfetto. GPU timings come from
+    GL_TIME_ELAPSED queries, which are read back a few frames later without
+    stalling; the totals of the latest complete frame are kept in
+    frame_times, and the duration of the latest CPU span of each name in
+    cpu_times.
+
+    A disabled profiler records nothing, and its spans cost next to nothing.
+    """
+    GPU_THREAD = 0  # thread id of the GPU timings in the trace
+
+    def __init__(self, enabled=False, path=None):
+        self.enabled = enabled
+        self.path = path
+        self.events = []
+        self.cpu_times = {}
+        self.frame_times = {}
+        self.frame = 0
+        self.pending = []  # (frame, name, query, start) of unread GPU queries
+        self.frames = defaultdict(lambda: defaultdict(float))
+        self.queries = []
+        self.start = time.perf_counter()
+
+    @classmethod
+    def from_environment(cls):
+        """A profiler enabled when PLOTS_PROFILE is set to the path to save
+        the trace to."""
+        path = os.environ.get("PLOTS_PROFILE")
+        return cls(enabled=bool(path), path=path)
+
+    def timestamp(self):
+        """Microseconds since the profiler was created."""
+        return (time.perf_counter() - self.start)*1e6
+
+    def record(self, name, start, end, gpu=False, **args):
+        """Records a span between two timestamps()."""
+        if not self.enabled:
+            return
+        self.events.append({
+            "name": name, "ph": "X", "ts": start, "dur": end - start,
+            "pid": os.getpid(),
+            "tid": self.GPU_THREAD if gpu else threading.get_ident(),
+            "args": args,
+        })
+        if not gpu:
+            self.cpu_times[name] = (end - start)/1000
+
+    @contextmanager
+    def span(self, name, **args):
+        """Times the CPU work in a with block."""
+        if not self.enabled:
+            yield
+            return
+        start = self.timestamp()
+        try:
+            yield
+        finally:
+            self.record(name, start, self.timestamp(), **args)
+
+    @contextmanager
+    def gpu_span(self, name):
+        """Times the GL commands in a with block, which must not contain
+        another gpu_span. Requires the context to be current."""
+        if not self.enabled:
+            yield
+            return
+        query = self.queries.pop() if self.queries else int(glGenQueries(1)[0])
+        glBeginQuery(GL_TIME_ELAPSED, query)
+        try:
+            yield
+        finally:
+            glEndQuery(GL_TIME_ELAPSED)
+            self.pending.append((self.frame, name, query, self.timestamp()))
+
+    def next_frame(self):
+        """Reads back the GPU queries which have finished, and starts a new
+        frame. Requires the context to be current."""
+        if not self.enabled:
+            return
+        while self.pending:
+            frame, name, query, start = self.pending[0]
+            if not int(glGetQueryObjectuiv(query, GL_QUERY_RESULT_AVAILABLE)):
+                break
+            self.pending.pop(0)
+            # PyOpenGL cannot convert the results of glGetQueryObjectui64v,
+            # but 32 bits of nanoseconds are over four seconds
+            duration = int(glGetQueryObjectuiv(query, GL_QUERY_RESULT))/1000
+            self.queries.append(query)
+            self.record(name, start, start + duration, gpu=True)
+            self.frames[frame][name] += duration/1000
+        oldest = self.pending[0][0] if self.pending else self.frame + 1
+        for frame in sorted(self.frames):
+            if frame < oldest:
+                self.frame_times = dict(self.frames.pop(frame))
+        self.frame += 1
+
+    def summary(self):
+        """A short, human readable summary of the latest timings."""
+        lines = [f"GPU {sum(self.frame_times.values()):.2f} ms"]
+        for name, ms in sorted(self.frame_times.items(), key=lambda t: -t[1])[:5]:
+            lines.append(f"  {name} {ms:.2f} ms")
+        for name, ms in sorted(self.cpu_times.items()):
+            lines.append(f"{name} {ms:.2f} ms")
+        return "\n".join(lines)
+
+    def save(self, path=None):
+        path = path or self.path
+        if not self.enabled or not path:
+            return
+        thread_name = {"name": "thread_name", "ph": "M", "pid": os.getpid(),
+                       "tid": self.GPU_THREAD, "args": {"name": "GPU"}}
+        with open(path, "w") as f:
+            json.dump({"traceEvents": [thread_name] + self.events,
+                       "displayTimeUnit": "ms"}, f)
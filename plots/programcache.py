@@ -0,0 +1,226 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+from OpenGL.error import GLError
+from collections import OrderedDict
+import hashlib
+import os
+import numpy as np
+try:
+    from OpenGL.GL.KHR.parallel_shader_compile import \
+        glInitParallelShaderCompileKHR, glMaxShaderCompilerThreadsKHR, \
+        GL_COMPLETION_STATUS_KHR
+except ImportError:
+    glInitParallelShaderCompileKHR = None
+
+def cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "plots", "programs")
+
+class ProgramCache():
+    """LRU cache of linked shader programs, keyed by a hash of their source.
+    Sources which failed to compile or link are remembered with their
+    error, so that they are not compiled again.
+
+    Where the driver supports program binaries, linked programs are also
+    saved to the XDG cache directory, so that they need not be compiled
+    again in later sessions. Where it supports KHR_parallel_shader_compile,
+    programs are compiled on the driver's own threads; see request().
+    """
+    def __init__(self, capacity=128, directory=None):
+        self.capacity = capacity
+        self.directory = directory or cache_dir()
+        self.programs = OrderedDict()
+        self.failures = OrderedDict()
+        self.shaders = {}
+        self.pending = {}
+        self.binaries = False
+        self.parallel = False
+
+    def realize(self):
+        """Must be called with the context current, before first use."""
+        driver = "".join(glGetString(name).decode() for name in
+                         (GL_VENDOR, GL_RENDERER, GL_VERSION))
+        self.driver_hash = hashlib.sha256(driver.encode()).hexdigest()
+        try:
+            self.binaries = bool(glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS)) \
+                and bool(glGetProgramBinary) and bool(glProgramBinary)
+        except Exception:
+            self.binaries = False
+        if glInitParallelShaderCompileKHR is not None and glInitParallelShaderCompileKHR():
+            self.parallel = True
+            # let the driver choose how many threads to use
+            glMaxShaderCompilerThreadsKHR(0xFFFFFFFF)
+        if self.binaries:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+            except OSError:
+                self.binaries = False
+
+    def key(self, vertex_source, fragment_source):
+        h = hashlib.sha256()
+        for part in (self.driver_hash, vertex_source, fragment_source):
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, vertex_source, fragment_source):
+        """Returns a linked program, compiling it only if necessary.
+
+        Raises RuntimeError if the sources fail to compile or link.
+        """
+        return self.request(vertex_source, fragment_source).result()
+
+    def request(self, vertex_source, fragment_source):
+        """Starts compiling a program, unless it is cached, and returns a
+        PendingProgram for it without waiting for the compilation to finish.
+        """
+        key = self.key(vertex_source, fragment_source)
+        if key in self.programs:
+            self.programs.move_to_end(key)
+            return PendingProgram(self, key, self.programs[key])
+        if key in self.pending:
+            return self.pending[key]
+        if key in self.failures:
+            self.failures.move_to_end(key)
+            failed = PendingProgram(self, key, None)
+            failed.error = self.failures[key]
+            return failed
+        program = self.load(key)
+        if program is not None:
+            self.programs[key] = program
+            return PendingProgram(self, key, program)
+        fragment_shader = glCreateShader(GL_FRAGMENT_SHADER)
+        glShaderSource(fragment_shader, fragment_source)
+        glCompileShader(fragment_shader)
+        program = glCreateProgram()
+        if self.binaries:
+            glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+        vertex_shader = self.vertex_shader(vertex_source)
+        glAttachShader(program, vertex_shader)
+        glAttachShader(program, fragment_shader)
+        glLinkProgram(program)
+        self.pending[key] = PendingProgram(self, key, program,
+                                           (vertex_shader, fragment_shader))
+        return self.pending[key]
+
+    def trim(self, keep=()):
+        """Deletes least recently used programs not in keep, until the cache
+        is within capacity."""
+        keep = set(keep)
+        for key in list(self.programs):
+            if len(self.programs) <= self.capacity:
+                break
+            if self.programs[key] not in keep:
+                glDeleteProgram(self.programs.pop(key))
+
+    def vertex_shader(self, source):
+        if source not in self.shaders:
+            self.shaders[source] = shaders.compileShader(source, GL_VERTEX_SHADER)
+        return self.shaders[source]
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def load(self, key):
+        if not self.binaries:
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) > 4:
+            binary_format = int.from_bytes(data[:4], "little")
+            binary = np.frombuffer(data[4:], np.uint8)
+            program = glCreateProgram()
+            try:
+                glProgramBinary(program, binary_format, binary, len(binary))
+                # fails for stale binaries, e.g. after a driver update
+                if glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE:
+                    return program
+            except GLError:
+                # truncated or foreign file
+                pass
+            glDeleteProgram(program)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+        return None
+
+    def save(self, key, program):
+        if not self.binaries:
+            return
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        binary = np.empty(length, np.uint8)
+        binary_format = np.zeros(1, np.uint32)
+        glGetProgramBinary(program, length, None, binary_format, binary)
+        tmp = self.path(key) + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(int(binary_format[0]).to_bytes(4, "little"))
+                f.write(binary.tobytes())
+            os.replace(tmp, self.path(key))
+        except OSError:
+            pass
+
+class PendingProgram():
+    """A program which may still be being compiled by the driver."""
+    def __init__(self, cache, key, program, shaders=None):
+        self.cache = cache
+        self.key = key
+        self.program = program
+        self.shaders = shaders
+        self.error = None
+
+    def ready(self):
+        """Whether result() can be called without blocking."""
+        if self.shaders is None or not self.cache.parallel:
+            return True
+        return bool(glGetProgramiv(self.program, GL_COMPLETION_STATUS_KHR))
+
+    def result(self):
+        """Returns the linked program, or raises RuntimeError with the
+        compiler's log if it failed to compile or link."""
+        if self.error is not None:
+            raise self.error
+        if self.shaders is None:
+            return self.program
+        (vertex_shader, shader), self.shaders = self.shaders, None
+        del self.cache.pending[self.key]
+        glDetachShader(self.program, vertex_shader)
+        glDetachShader(self.program, shader)
+        try:
+            if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
+                raise RuntimeError(glGetShaderInfoLog(shader).decode())
+            if glGetProgramiv(self.program, GL_LINK_STATUS) != GL_TRUE:
+                raise RuntimeError(glGetProgramInfoLog(self.program).decode())
+        except RuntimeError as e:
+            glDeleteProgram(self.program)
+            self.error = e
+            self.cache.failures[self.key] = e
+            if len(self.cache.failures) > self.cache.capacity:
+                self.cache.failures.popitem(last=False)
+            raise
+        finally:
+            glDeleteShader(shader)
+        self.cache.save(self.key, self.program)
+        self.cache.programs[self.key] = self.program
+        return self.program
@@ -0,0 +1,440 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+from OpenGL.GL import *
+from OpenGL.arrays import vbo
+from jinja2 import Environment, PackageLoader
+from collections import namedtuple
+import math
+import re
+import numpy as np
+
+from plots.programcache import ProgramCache
+from plots.profiling import Profiler
+
+ShaderSources = namedtuple("ShaderSources", "samples fragment variables variable_count labels")
+Definitions = namedtuple("Definitions", "hoisted dependent functions undefined")
+
+def identifiers(source):
+    return set(re.findall(r"\b[a-zA-Z_]\w*\b", source))
+
+def uses(row, names):
+    """Returns those of names which a row's code refers to, not counting the
+    name a variable row assigns to."""
+    expr = row.expr.split("=", 1)[1] if row.type == "variable" else row.expr
+    return identifiers(getattr(row, "body", "") + expr) & names
+
+def dependencies(variables):
+    """Returns a dict from the name of each variable or function to the
+    names of the variables and functions it uses."""
+    names = {v.name for v in variables}
+    return {v.name: uses(v, names) for v in variables}
+
+def schedule(variables):
+    """Orders variable and function rows so that each comes after those it
+    uses, otherwise keeping them in their original order.
+
+    Returns the ordered rows, and the names of those which have no value
+    because they depend on themselves, directly or through others. These
+    are left out of the ordered rows.
+    """
+    graph = dependencies(variables)
+    ordered, done = [], set()
+    remaining = list(variables)
+    while True:
+        ready = next((v for v in remaining if graph[v.name] <= done), None)
+        if ready is None:
+            break
+        remaining.remove(ready)
+        ordered.append(ready)
+        done.add(ready.name)
+    return ordered, {v.name for v in remaining}
+
+def split_variables(variables):
+    """Schedules variable and function rows, and splits the variables into
+    those which depend on x, directly or through other rows, and those which
+    do not.
+
+    Functions are compiled outside formula(), so cannot use x, or variables
+    which depend on it, except through their parameters. Such functions
+    have no value, as do the rows returned by schedule() as cyclic.
+
+    Returns Definitions holding the lists of rows in order.
+    """
+    ordered, cyclic = schedule(variables)
+    dependent = {"x"}
+    names = {v.name for v in variables} | dependent
+    for v in ordered:
+        if uses(v, names) & dependent:
+            dependent.add(v.name)
+    undefined = [v for v in variables if v.name in cyclic or
+                 v.type == "function" and v.name in dependent]
+    ordered = [v for v in ordered if v not in undefined]
+    return Definitions(
+        hoisted=[v for v in ordered if v.type == "variable" and v.name not in dependent],
+        dependent=[v for v in ordered if v.type == "variable" and v.name in dependent],
+        functions=[v for v in ordered if v.type == "function"],
+        undefined=undefined)
+
+def required(row, graph):
+    """Returns the names of the variables which a row uses, directly or
+    through other variables, given the graph from dependencies()."""
+    stack = list(uses(row, graph.keys()))
+    found = set(stack)
+    while stack:
+        for name in graph[stack.pop()] - found:
+            found.add(name)
+            stack.append(name)
+    return found
+
+class Renderer():
+    """Draws the graph into the currently bound framebuffer.
+
+    Rendering is done in three passes, so that each formula is evaluated
+    once per sample per pixel column, rather than once per sample per pixel:
+
+    1. every formula is sampled up to SAMPLES times in each pixel column, into
+       one layer per formula of the `values` texture array. Each formula
+       has its own program, so editing one does not recompile the others;
+    2. the samples of each column are reduced to their minimum, maximum,
+       monotonicity and NaN-ness, into one row per formula of `columns`;
+    3. each pixel tests the samples of its column against its own extent,
+       compositing all the formulae. Columns which lie entirely above or
+       below the pixel are skipped using the minimum and maximum from pass 2.
+
+    Variables which do not depend on x are evaluated beforehand by a
+    separate program, into the `variables` texture, which is only redrawn
+    when the sliders or variables change.
+
+    The view parameters and slider values are uploaded once per frame, into
+    a single uniform buffer shared by all the programs.
+
+    Expects an OpenGL 3.3 context to be current whenever it is used.
+    """
+    SAMPLES = 36  # the most samples per pixel column, used by default
+    VIEW_BINDING = 0
+    SLIDERS_BINDING = 1
+    VIEW_SIZE = 8  # floats in the View uniform block
+
+    def __init__(self, profiler=None):
+        self.profiler = profiler or Profiler()
+        self.jinja_env = Environment(loader=PackageLoader('plots', 'shaders'))
+        self.vertex_template = self.jinja_env.get_template('vertex.glsl')
+        self.samples_template = self.jinja_env.get_template('samples.glsl')
+        self.columns_template = self.jinja_env.get_template('columns.glsl')
+        self.fragment_template = self.jinja_env.get_template('fragment.glsl')
+        self.variables_template = self.jinja_env.get_template('variables.glsl')
+        self.cache = ProgramCache()
+        self.samples_programs = []
+        self.formula_labels = []
+        self.generation = 0  # incremented whenever the programs change
+        self.variables_program = None
+        self.variables_state = None
+        self.pending = None
+        self.texture_size = None
+        self.locations = {}
+        self.frame_data = None
+
+    def realize(self):
+        self.cache.realize()
+        self.vertex_source = self.vertex_template.render()
+        self.columns_program = self.cache.get(self.vertex_source,
+                                              self.columns_template.render())
+        self.prepare(self.columns_program)
+
+        self.vbo = vbo.VBO(np.array([
+            [-1, -1, 0],
+            [-1, 1, 0],
+            [1, 1, 0],
+            [-1, -1, 0],
+            [1, -1, 0],
+            [1, 1, 0]
+        ],'f'), usage="GL_STATIC_DRAW_ARB")
+
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+        self.vbo.bind()
+        self.vbo.copy_data()
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 3*self.vbo.data.itemsize, self.vbo)
+        glEnableVertexAttribArray(0)
+        self.vbo.unbind()
+        glBindVertexArray(0)
+
+        self.framebuffer = glGenFramebuffers(1)
+        self.values_texture, self.columns_texture, self.variables_texture = \
+            glGenTextures(3)
+        for target, texture in ((GL_TEXTURE_2D_ARRAY, self.values_texture),
+                                (GL_TEXTURE_2D, self.columns_texture),
+                                (GL_TEXTURE_2D, self.variables_texture)):
+            glBindTexture(target, texture)
+            glTexParameteri(target, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(target, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glBindTexture(target, 0)
+
+        self.frame_buffer = glGenBuffers(1)
+        alignment = int(glGetIntegerv(GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT))
+        # the sliders are stored after the view, at the first aligned offset
+        self.sliders_offset = -(-4*self.VIEW_SIZE // alignment) * alignment
+
+        self.update_shader([], [], [])
+
+    def update_shader(self, formulae, variables, sliders):
+        """Compiles the programs for the given rows, waiting until they are
+        ready. See generate() and start_update() for the asynchronous
+        equivalent."""
+        self.start_update(self.generate(formulae, variables, sliders))
+        self.finish_update()
+
+    def generate(self, formulae, variables, sliders, labels=None):
+        """Renders the shader templates for the given rows: one sampling
+        program per formula, the compositing program and, if any variables
+        do not depend on x, the program evaluating them. labels name each
+        formula's GPU span when profiling, such as by its row.
+
+        Does not use OpenGL, so may be called from any thread.
+        """
+        if labels is None:
+            labels = [f"formula {i + 1}" for i in range(len(formulae))]
+        with self.profiler.span("generate", formulae=len(formulae)):
+            return self._generate(formulae, variables, sliders, labels)
+
+    def _generate(self, formulae, variables, sliders, labels):
+        hoisted, dependent, functions, undefined = split_variables(variables)
+        graph = dependencies(variables)
+        # styles are uniform arrays, sized in powers of two so that adding
+        # formulae rarely changes the compositing program
+        capacity = 2**max(3, math.ceil(math.log2(max(1, len(formulae)))))
+        samples = []
+        for f in formulae:
+            # only the variables a formula uses are included in its program,
+            # so that editing a variable recompiles only the formulae using it
+            used = required(f, graph)
+            samples.append(self.samples_template.render(
+                formula=f, sliders=sliders,
+                hoisted=[(i, v) for i, v in enumerate(hoisted) if v.name in used],
+                variables=[v for v in dependent if v.name in used],
+                functions=[v for v in functions if v.name in used],
+                undefined=[v for v in undefined if v.name in used]))
+        used = set().union(*(required(v, graph) for v in hoisted))
+        return ShaderSources(
+            samples=samples,
+            fragment=self.fragment_template.render(capacity=capacity),
+            variables=self.variables_template.render(
+                variables=hoisted, sliders=sliders,
+                functions=[v for v in functions if v.name in used], undefined=[])
+            if hoisted else None,
+            variable_count=len(hoisted),
+            labels=list(labels))
+
+    def start_update(self, sources):
+        """Starts compiling the programs for the given ShaderSources.
+
+        Programs are cached by their source, so only formulae whose generated
+        GLSL has not been seen recently are compiled. The current programs
+        continue to be used for rendering until finish_update() is called.
+        """
+        self.pending = ShaderSources(
+            samples=[self.cache.request(self.vertex_source, s) for s in sources.samples],
+            fragment=self.cache.request(self.vertex_source, sources.fragment),
+            variables=self.cache.request(self.vertex_source, sources.variables)
+            if sources.variables else None,
+            variable_count=sources.variable_count,
+            labels=sources.labels)
+
+    def update_ready(self):
+        """Whether finish_update() can be called without blocking."""
+        pending = self.pending.samples + [self.pending.fragment, self.pending.variables]
+        return all(p.ready() for p in pending if p is not None)
+
+    def finish_update(self):
+        """Starts rendering with the programs from the last start_update()."""
+        with self.profiler.span("link"):
+            self._finish_update()
+
+    def _finish_update(self):
+        blank = self.samples_template.render()
+        self.samples_programs = [self.program(p, blank) for p in self.pending.samples]
+        self.fragment_program = self.program(self.pending.fragment,
+                                             self.fragment_template.render(capacity=8))
+        self.variables_program = self.program(self.pending.variables,
+                                              self.variables_template.render()) \
+            if self.pending.variables else None
+        self.variable_count = self.pending.variable_count
+        self.formula_labels = self.pending.labels
+        self.generation += 1
+        self.variables_state = None
+        self.pending = None
+        programs = self.samples_programs + [self.fragment_program]
+        if self.variables_program is not None:
+            programs.append(self.variables_program)
+        for program in programs:
+            self.prepare(program)
+        self.cache.trim(keep=programs + [self.columns_program])
+        live = set(self.cache.programs.values())
+        self.locations = {p: l for p, l in self.locations.items() if p in live}
+
+    def prepare(self, program):
+        """Binds the uniform blocks and samplers of a program, and looks up
+        the locations of its other uniforms, the first time it is used."""
+        if program in self.locations:
+            return
+        for name, binding in (("View", self.VIEW_BINDING),
+                              ("Sliders", self.SLIDERS_BINDING)):
+            index = glGetUniformBlockIndex(program, name)
+            if index != GL_INVALID_INDEX:
+                glUniformBlockBinding(program, index, binding)
+        glUseProgram(program)
+        glUniform1i(glGetUniformLocation(program, "values"), 0)
+        glUniform1i(glGetUniformLocation(program, "columns"), 1)
+        glUniform1i(glGetUniformLocation(program, "variables"), 2)
+        glUseProgram(0)
+        self.locations[program] = {
+            name: glGetUniformLocation(program, name)
+            for name in ("formula_count", "colors", "line_weights")}
+
+    def program(self, pending, fallback):
+        try:
+            return pending.result()
+        except RuntimeError as e:
+            print(e.args[0].encode('ascii', 'ignore').decode('unicode_escape'))
+            return self.cache.get(self.vertex_source, fallback)
+
+    def resize_textures(self, width, layers):
+        size = (width, layers)
+        if size == self.texture_size:
+            return
+        glBindTexture(GL_TEXTURE_2D_ARRAY, self.values_texture)
+        glTexImage3D(GL_TEXTURE_2D_ARRAY, 0, GL_R32F, width, self.SAMPLES, layers,
+                     0, GL_RED, GL_FLOAT, None)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+        glBindTexture(GL_TEXTURE_2D, self.columns_texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA32F, width, layers,
+                     0, GL_RGBA, GL_FLOAT, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        self.texture_size = size
+
+    def evaluate_variables(self, slider_values):
+        """Redraws the variables texture, if the variables program or the
+        sliders have changed since it was last drawn."""
+        state = (self.variables_program, tuple(slider_values))
+        if state == self.variables_state:
+            return
+        width = -(-self.variable_count // 4)
+        glBindTexture(GL_TEXTURE_2D, self.variables_texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA32F, width, 1,
+                     0, GL_RGBA, GL_FLOAT, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+                               GL_TEXTURE_2D, self.variables_texture, 0)
+        glViewport(0, 0, width, 1)
+        glUseProgram(self.variables_program)
+        with self.profiler.gpu_span("variables"):
+            glDrawArrays(GL_TRIANGLES, 0, 6)
+        self.variables_state = state
+
+    def upload_frame(self, viewport, translation, pixel_extent, scale, samples,
+                     slider_values):
+        """Updates the uniform buffer with the parameters of this frame."""
+        slider_floats = 4*(-(-len(slider_values) // 4))
+        size = self.sliders_offset//4 + max(4, slider_floats)
+        if self.frame_data is None or len(self.frame_data) != size:
+            self.frame_data = np.zeros(size, 'f')
+        self.frame_data[:self.VIEW_SIZE] = (*viewport, *translation, *pixel_extent,
+                                            scale, samples)
+        start = self.sliders_offset//4
+        self.frame_data[start:start + len(slider_values)] = slider_values
+        glBindBuffer(GL_UNIFORM_BUFFER, self.frame_buffer)
+        glBufferData(GL_UNIFORM_BUFFER, self.frame_data.nbytes, self.frame_data,
+                     GL_STREAM_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        glBindBufferRange(GL_UNIFORM_BUFFER, self.VIEW_BINDING, self.frame_buffer,
+                          0, 4*self.VIEW_SIZE)
+        if slider_values:
+            glBindBufferRange(GL_UNIFORM_BUFFER, self.SLIDERS_BINDING, self.frame_buffer,
+                              self.sliders_offset, 4*slider_floats)
+
+    def render(self, width, height, translation, scale, slider_values, styles,
+               samples=SAMPLES):
+        """Draws a width x height graph into the bound framebuffer.
+
+        slider_values is a list of the values of the sliders, in the order
+        they were given to generate(), and styles a list of
+        (rgba, line_weight) tuples, one for each formula. Fewer samples per
+        pixel column than SAMPLES render faster, but more roughly.
+        """
+        target = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        viewport = np.array([width, height], 'f')
+        graph_extent = 2*viewport/viewport[0]*scale
+        # extent of each pixel, in graph coordinates
+        pixel_extent = graph_extent / viewport
+        self.upload_frame(viewport, translation, pixel_extent, scale, samples,
+                          slider_values)
+        formula_count = len(self.samples_programs)
+        self.resize_textures(width, max(1, formula_count))
+        glBindVertexArray(self.vao)
+
+        if formula_count:
+            if self.variables_program is not None:
+                self.evaluate_variables(slider_values)
+                glActiveTexture(GL_TEXTURE2)
+                glBindTexture(GL_TEXTURE_2D, self.variables_texture)
+                glActiveTexture(GL_TEXTURE0)
+            glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+            glViewport(0, 0, width, samples)
+            for i, (program, label) in enumerate(zip(self.samples_programs,
+                                                     self.formula_labels)):
+                glFramebufferTextureLayer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+                                          self.values_texture, 0, i)
+                glUseProgram(program)
+                with self.profiler.gpu_span(label):
+                    glDrawArrays(GL_TRIANGLES, 0, 6)
+
+            glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+                                   GL_TEXTURE_2D, self.columns_texture, 0)
+            glViewport(0, 0, width, formula_count)
+            glUseProgram(self.columns_program)
+            glActiveTexture(GL_TEXTURE0)
+            glBindTexture(GL_TEXTURE_2D_ARRAY, self.values_texture)
+            with self.profiler.gpu_span("columns"):
+                glDrawArrays(GL_TRIANGLES, 0, 6)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, target)
+        glViewport(0, 0, width, height)
+        glClearColor(0, 0, 1, 0)
+        glClear(GL_COLOR_BUFFER_BIT)
+        glUseProgram(self.fragment_program)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, self.values_texture)
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, self.columns_texture)
+        locations = self.locations[self.fragment_program]
+        glUniform1i(locations["formula_count"], formula_count)
+        if formula_count:
+            colors = np.array([rgba for rgba, _ in styles], 'f')
+            line_weights = np.array([weight for _, weight in styles], 'f')
+            glUniform4fv(locations["colors"], formula_count, colors)
+            glUniform1fv(locations["line_weights"], formula_count, line_weights)
+        with self.profiler.gpu_span("composite"):
+            glDrawArrays(GL_TRIANGLES, 0, 6)
+
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glActiveTexture(GL_TEXTURE2)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+        glBindVertexArray(0)
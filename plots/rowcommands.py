@@ -18,13 +18,15 @@
 from plots import formularow, parser
 from collections import namedtuple
 
-RowMemory = namedtuple("RowMemory", "formula rgba lower upper slider")
+RowMemory = namedtuple("RowMemory", "formula rgba lower upper slider visible weight")
 
 class Delete():
     def __init__(self, row, rows):
         self.index = rows.index(row)
         self.formula = row.editor.expr.to_latex()
         self.rgba = row.color_picker.get_rgba()
+        self.visible = row.visible_button.get_active()
+        self.weight = row.weight_button.get_value()
         self.last = len(rows) == 1
 
     def do(self, app):
@@ -36,7 +38,7 @@ class Delete():
         row = formularow.FormulaRow(app)
         app.insert_row(self.index, row)
         row.editor.set_expr(parser.from_latex(self.formula))
-        row.color_picker.set_rgba(self.rgba)
+        row.set_style(self.rgba, self.visible, self.weight)
         row.edited(None, record=False)
         row.editor.grab_focus()
 
@@ -63,7 +65,7 @@ class Edit():
     def do(self, app):
         row = app.rows[self.index]
         row.editor.set_expr(parser.from_latex(self.after.formula))
-        row.color_picker.set_rgba(self.after.rgba)
+        row.set_style(self.after.rgba, self.after.visible, self.after.weight)
         row.editor.grab_focus()
         row.editor.queue_draw()
         row.edited(None, record=False)
@@ -71,7 +73,7 @@ class Edit():
     def undo(self, app):
         row = app.rows[self.index]
         row.editor.set_expr(parser.from_latex(self.before.formula))
-        row.color_picker.set_rgba(self.before.rgba)
+        row.set_style(self.before.rgba, self.before.visible, self.before.weight)
         row.editor.grab_focus()
         row.editor.queue_draw()
         row.edited(None, record=False)
@@ -0,0 +1,46 @@
+/*
+   Copyright 2021 Alexander Huntley
+
+   This file is part of Plots.
+
+   Plots is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   Plots is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+*/
+
+#version 330 core
+out vec4 stats;
+
+{% include "view.glsl" %}
+uniform sampler2DArray values;
+
+// Reduces the samples of one formula in one pixel column to
+// (minimum, maximum, monotonicity, whether any were infinite or NaN).
+// x is the pixel column and y the formula.
+void main() {
+    ivec2 p = ivec2(gl_FragCoord.xy);
+    float lowest = uintBitsToFloat(0x7F800000u);
+    float highest = -lowest;
+    float prev = 0.0;
+    int monotonic = 0;
+    bool nans = false;
+    for (int i = 0; i < int(samples); i++) {
+        float f = texelFetch(values, ivec3(p.x, i, p.y), 0).r;
+        if (i != 0)
+            monotonic += int(sign(f - prev));
+        prev = f;
+        nans = nans || isinf(f) || isnan(f);
+        lowest = min(lowest, f);
+        highest = max(highest, f);
+    }
+    stats = vec4(lowest, highest, float(monotonic), nans ? 1.0 : 0.0);
+}
@@ -0,0 +1,107 @@
+/*
+   Copyright 2021 Alexander Huntley
+
+   This file is part of Plots.
+
+   Plots is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   Plots is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+*/
+
+#define pi 3.141592653589793
+#define e 2.718281828459045
+
+#define ln(x) log(x)
+#define lg(x) log2(x)
+#define sec(x) (1.0/cos(x))
+#define csc(x) (1.0/sin(x))
+#define cosec(x) csc(x)
+#define cot(x) (1.0/tan(x))
+#define arcsin(x) asin(x)
+#define arccos(x) acos(x)
+#define arctan(x) atan(x)
+#define asec(x) acos(1.0/(x))
+#define acsc(x) asin(1.0/(x))
+#define acosec(x) acsc(x)
+#define acot(x) (atan(1.0/(x)) - ((x) > 0 ? 0.0 : pi))
+#define arcsec(x) asec(x)
+#define arccsc(x) acsc(x)
+#define arccosec(x) acsc(x)
+#define arccot(x) acot(x)
+#define sech(x) (1.0/cosh(x))
+#define csch(x) (1.0/sinh(x))
+#define cosech(x) csch(x)
+#define coth(x) (1.0/tanh(x))
+#define asech(x) acosh(1.0/(x))
+#define acsch(x) asinh(1.0/(x))
+#define acosech(x) acsch(x)
+#define acoth(x) atanh(1.0/(x))
+#define sgn(x) sign(x)
+#define sinc(x) (sin(x)/(x))
+
+float rand(vec2 co){
+    // implementation found at: lumina.sourceforge.net/Tutorials/Noise.html
+    return fract(sin(dot(co.xy ,vec2(12.9898,78.233))) * 43758.5453);
+}
+
+// factorials of 0 to 34; 35! overflows single precision
+const float FACTORIALS[35] = float[35](
+    1.0, 1.0, 2.0, 6.0, 24.0,
+    120.0, 720.0, 5040.0, 40320.0, 362880.0,
+    3628800.0, 39916800.0, 479001600.0, 6227020800.0, 87178291200.0,
+    1307674368000.0, 20922789888000.0, 355687428096000.0, 6402373705728000.0, 1.21645100408832e+17,
+    2.43290200817664e+18, 5.109094217170944e+19, 1.1240007277776077e+21, 2.585201673888498e+22, 6.204484017332394e+23,
+    1.5511210043330986e+25, 4.0329146112660565e+26, 1.0888869450418352e+28, 3.0488834461171387e+29, 8.841761993739702e+30,
+    2.6525285981219107e+32, 8.222838654177922e+33, 2.631308369336935e+35, 8.683317618811886e+36, 2.9523279903960416e+38);
+
+float lanczos_gamma(float x) {
+    // the Lanczos approximation, with g = 7, for x >= 0.5
+    if (x > 35.5)
+        // 34.5! already overflows single precision, and beyond about 100
+        // exp(-t) underflows, which would make the result 0*inf = NaN
+        return uintBitsToFloat(0x7F800000u);
+    x -= 1.0;
+    float a = 0.99999999999980993;
+    a += 676.5203681218851/(x + 1.0);
+    a += -1259.1392167224028/(x + 2.0);
+    a += 771.32342877765313/(x + 3.0);
+    a += -176.61502916214059/(x + 4.0);
+    a += 12.507343278686905/(x + 5.0);
+    a += -0.13857109526572012/(x + 6.0);
+    a += 9.9843695780195716e-6/(x + 7.0);
+    a += 1.5056327351493116e-7/(x + 8.0);
+    float t = x + 7.5;
+    // t^(x + 0.5) in two halves, so that it does not overflow before
+    // exp(-t) brings it back down
+    float p = pow(t, 0.5*x + 0.25);
+    return sqrt(2.0*pi)*p*exp(-t)*p*a;
+}
+
+float factorial(float x) {
+    if (x == floor(x) && x >= 0.0 && x < 35.0)
+        return FACTORIALS[int(x)];
+    // the poles of the gamma function, where sin() below is only nearly 0
+    if (x == floor(x) && x < 0.0)
+        return uintBitsToFloat(0x7F800000u);
+    // the gamma function of x + 1, reflected for x + 1 < 0.5
+    if (x < -0.5)
+        return pi/(sin(pi*(x + 1.0))*lanczos_gamma(-x));
+    return lanczos_gamma(x + 1.0);
+}
+
+float mypow(float x, float y) {
+    if (x >= 0)
+        return pow(x, y);
+    else if (floor(y) == y) {
+        return int(y) % 2 == 0 ? pow(-x, y) : -pow(-x, y);
+    }
+}
@@ -21,124 +21,67 @@
 in vec2 graph_pos;
 out vec3 color;
 
-uniform vec2 pixel_extent;
-uniform float scale;
+{% include "view.glsl" %}
+uniform sampler2DArray values;
+uniform sampler2D columns;
 
-#define pi 3.141592653589793
-#define e 2.718281828459045
+uniform int formula_count;
+// colour of each formula, whose alpha is its opacity, so 0 hides it
+uniform vec4 colors[{{ capacity }}];
+// thickness of each formula's line, in pixels
+uniform float line_weights[{{ capacity }}];
 
-#define ln(x) log(x)
-#define lg(x) log2(x)
-#define sec(x) (1.0/cos(x))
-#define csc(x) (1.0/sin(x))
-#define cosec(x) csc(x)
-#define cot(x) (1.0/tan(x))
-#define arcsin(x) asin(x)
-#define arccos(x) acos(x)
-#define arctan(x) atan(x)
-#define asec(x) acos(1.0/(x))
-#define acsc(x) asin(1.0/(x))
-#define acosec(x) acsc(x)
-#define acot(x) (atan(1.0/(x)) - ((x) > 0 ? 0.0 : pi))
-#define arcsec(x) asec(x)
-#define arccsc(x) acsc(x)
-#define arccosec(x) acsc(x)
-#define arccot(x) acot(x)
-#define sech(x) (1.0/cosh(x))
-#define csch(x) (1.0/sinh(x))
-#define cosech(x) csch(x)
-#define coth(x) (1.0/tanh(x))
-#define asech(x) acosh(1.0/(x))
-#define acsch(x) asinh(1.0/(x))
-#define acosech(x) acsch(x)
-#define acoth(x) atanh(1.0/(x))
-#define sgn(x) sign(x)
-#define sinc(x) (sin(x)/(x))
+{% include "common.glsl" %}
 
-float rand(vec2 co){
-    // implementation found at: lumina.sourceforge.net/Tutorials/Noise.html
-    return fract(sin(dot(co.xy ,vec2(12.9898,78.233))) * 43758.5453);
-}
-
-float factorial(float x) {
-    float res = 1;
-    for (float i = 1; i <= x; i++)
-        res *= i;
-    return res;
-}
-
-float mypow(float x, float y) {
-    if (x >= 0)
-        return pow(x, y);
-    else if (floor(y) == y) {
-        return int(y) % 2 == 0 ? pow(-x, y) : -pow(-x, y);
-    }
-}
-
-{% for s in sliders %}
-uniform float {{ s.name }};
-{% endfor %}
-
-{% for v in variables %}
-float {{ v.name }} = 0.0/0.0;
-{% endfor %}
-
-{% for f in formulae %}
-float formula{{ loop.index0 }}(float x) {
-    {{ f.body }}
-    return {{ f.expr }};
-}
-{% endfor %}
-
-void main() {
-    {% for v in variables %}
-    {{ v.body }}
-    {{ v.expr }};
-    {% endfor %}
-    float samples = 36;
+// Counts how many of the samples of a formula in this pixel's column lie
+// inside the pixel (inside), and the net number above and below it (outside).
+void coverage(int formula, float weight, vec4 stats, out float inside, out float outside) {
     float step = 1.4*pixel_extent.x / samples;
     float jitter = .5;
-
-    {% if formulae %}
-    float inside[]= float[]({{ ([0.0] * formulae|length) | join(",") }});
-    float outside[]= float[]({{ ([0.0] * formulae|length) | join(",") }});
-    float prev[]= float[]({{ ([0.0] * formulae|length) | join(",") }});
-    int monotonic[] = int[]({{ ([0] * formulae|length) | join(",") }});
-    bool nans[] = bool[]({{ (["false"] * formulae|length) | join(",") }});
+    float half_weight = 0.5*weight;
+    inside = 0.0;
+    outside = 0.0;
+    // the whole column is clear of this pixel, whatever the jitter
+    if (stats.x - graph_pos.y >= (half_weight + jitter/samples)*pixel_extent.y) {
+        outside = samples;
+        return;
+    }
+    if (stats.y - graph_pos.y <= -half_weight*pixel_extent.y) {
+        outside = -samples;
+        return;
+    }
+    int column = int(gl_FragCoord.x);
     for (float i = 0.0; i < samples; i++) {
-            float ii = i + jitter*rand(vec2(graph_pos.x + i*step, graph_pos.y));
-            float x = graph_pos.x + ii*step;
-            float yj = jitter*rand(vec2(graph_pos.y, graph_pos.y + i*step))/samples;
-            float lower = (-0.5+yj)*pixel_extent.y;
-            float upper = (0.5+yj)*pixel_extent.y;
-            float fp, f;
-            {% for _ in formulae %}
-            f = formula{{loop.index0}}(x) - graph_pos.y;
-            if (lower < f && f < upper)
-                inside[{{loop.index0}}] += 1.0;
-            else
-                outside[{{loop.index0}}] += sign(f);
-            fp = prev[{{loop.index0}}];
-            if (i != 0.0)
-                monotonic[{{loop.index0}}] += int(sign(f - fp));
-            prev[{{loop.index0}}] = f;
-            nans[{{loop.index0}}] = nans[{{loop.index0}}] || isinf(f) || isnan(f);
-            {% endfor %}
+        float yj = jitter*rand(vec2(graph_pos.y, graph_pos.y + i*step))/samples;
+        float lower = (-half_weight+yj)*pixel_extent.y;
+        float upper = (half_weight+yj)*pixel_extent.y;
+        float f = texelFetch(values, ivec3(column, int(i), formula), 0).r - graph_pos.y;
+        if (lower < f && f < upper)
+            inside += 1.0;
+        else
+            outside += sign(f);
     }
-    {% endif %}
+}
+
+void main() {
     color = vec3(1.0);
-    vec3 formula_color = vec3(0);
-    {% for f in formulae %}
-    formula_color = vec3({{ f.rgba[:3] | join(",") }});
-    if (abs(monotonic[{{loop.index0}}]) != int(samples) - 3 && !nans[{{loop.index0}}]) {
-        if (inside[{{loop.index0}}] > 0.0)
-            color = mix(color, formula_color, inside[{{loop.index0}}]/samples);
-        if (abs(outside[{{loop.index0}}]) != samples)
-            color = mix(color, formula_color, 1. - abs(outside[{{loop.index0}}])/samples);
+    vec4 stats;
+    float inside, outside;
+    for (int i = 0; i < formula_count; i++) {
+        vec4 formula_color = colors[i];
+        if (formula_color.a == 0.0)
+            continue;
+        stats = texelFetch(columns, ivec2(gl_FragCoord.x, i), 0);
+        if (abs(int(stats.z)) != int(samples) - 3 && stats.w == 0.0) {
+            coverage(i, line_weights[i], stats, inside, outside);
+            if (inside > 0.0)
+                color = mix(color, formula_color.rgb, formula_color.a*inside/samples);
+            if (abs(outside) != samples)
+                color = mix(color, formula_color.rgb,
+                            formula_color.a*(1. - abs(outside)/samples));
+        }
     }
 
-    {% endfor %}
-
     float axis_width = pixel_extent.x;
     color -= (1.0-vec3(0.2,0.2,1.0))*(1.0-smoothstep(axis_width, axis_width*1.05, abs(graph_pos.x)));
     color -= (1.0-vec3(0.2,0.2,1.0))*(1.0-smoothstep(axis_width, axis_width*1.05, abs(graph_pos.y)));
@@ -0,0 +1,32 @@
+/*
+   Copyright 2021 Alexander Huntley
+
+   This file is part of Plots.
+
+   Plots is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   Plots is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+*/
+
+// Functions defined by rows such as f(x) = ..., compiled once and called
+// by the rows using them, rather than written out at every call.
+{% for f in undefined if f.type == "function" %}
+float {{ f.name }}({% for p in f.params %}float {{ p }}{{ ", " if not loop.last }}{% endfor %}) {
+    return 0.0/0.0;
+}
+{% endfor %}
+{% for f in functions %}
+float {{ f.name }}({% for p in f.params %}float {{ p }}{{ ", " if not loop.last }}{% endfor %}) {
+    {{ f.body }}
+    return {{ f.expr }};
+}
+{% endfor %}
@@ -0,0 +1,80 @@
+/*
+   Copyright 2021 Alexander Huntley
+
+   This file is part of Plots.
+
+   Plots is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   Plots is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+*/
+
+#version 330 core
+out float value;
+
+{% include "view.glsl" %}
+
+{% include "common.glsl" %}
+
+{% include "sliders.glsl" %}
+
+{% if hoisted %}
+// variables which do not depend on x, evaluated by the variables program
+uniform sampler2D variables;
+{% endif %}
+{% for i, v in hoisted %}
+float {{ v.name }};
+{% endfor %}
+
+// Like load_sliders, for the hoisted variables
+void load_variables() {
+    {% for i, v in hoisted %}
+    {{ v.name }} = texelFetch(variables, ivec2({{ i // 4 }}, 0), 0)[{{ i % 4 }}];
+    {% endfor %}
+}
+
+{% include "functions.glsl" %}
+
+{% if formula %}
+float formula(float x) {
+    {% for v in undefined if v.type == "variable" %}
+    float {{ v.name }} = 0.0/0.0;
+    {% endfor %}
+    {% for v in variables %}
+    float {{ v.name }} = 0.0/0.0;
+    {
+        {{ v.body }}
+        {{ v.expr }};
+    }
+    {% endfor %}
+    {{ formula.body }}
+    return {{ formula.expr }};
+}
+{% endif %}
+
+// Each fragment is one sample of the formula: x is the pixel column
+// and y the sample index.
+void main() {
+    load_sliders();
+    load_variables();
+    float column_x = (2.0*gl_FragCoord.x/viewport.x - 1.0)*scale - translation.x;
+    float i = floor(gl_FragCoord.y);
+    float step = 1.4*pixel_extent.x / samples;
+    float jitter = .5;
+    float ii = i + jitter*rand(vec2(column_x + i*step, i));
+    float x = column_x + ii*step;
+
+    {% if formula %}
+    value = formula(x);
+    {% else %}
+    value = 0.0/0.0;
+    {% endif %}
+}
@@ -0,0 +1,36 @@
+/*
+   Copyright 2021 Alexander Huntley
+
+   This file is part of Plots.
+
+   Plots is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   Plots is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+*/
+
+// Slider values, packed four to a vec4 in the Sliders uniform block
+{% if sliders %}
+layout(std140) uniform Sliders {
+    vec4 slider_values[{{ (sliders|length + 3) // 4 }}];
+};
+{% endif %}
+{% for s in sliders %}
+float {{ s.name }};
+{% endfor %}
+
+// Copies the slider values into globals named after the sliders, which
+// locals such as sum indices may then shadow. Called first in main().
+void load_sliders() {
+    {% for s in sliders %}
+    {{ s.name }} = slider_values[{{ loop.index0 // 4 }}][{{ loop.index0 % 4 }}];
+    {% endfor %}
+}
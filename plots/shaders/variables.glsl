@@ -0,0 +1,53 @@
+/*
+   Copyright 2021 Alexander Huntley
+
+   This file is part of Plots.
+
+   Plots is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   Plots is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+*/
+
+#version 330 core
+out vec4 values;
+
+{% include "view.glsl" %}
+
+{% include "common.glsl" %}
+
+{% include "sliders.glsl" %}
+
+{% for v in variables %}
+float {{ v.name }} = 0.0/0.0;
+{% endfor %}
+
+{% include "functions.glsl" %}
+
+// Evaluates the variables which do not depend on x, once per frame rather
+// than once per sample. Fragment i stores variables 4i to 4i+3.
+void main() {
+    load_sliders();
+    {% for v in variables %}
+    {
+        {{ v.body }}
+        {{ v.expr }};
+    }
+    {% endfor %}
+    {% if variables %}
+    float _values[] = float[]({{ (variables|map(attribute="name")|list
+        + ["0.0"]*(-(variables|length) % 4)) | join(", ") }});
+    int _i = 4*int(gl_FragCoord.x);
+    values = vec4(_values[_i], _values[_i+1], _values[_i+2], _values[_i+3]);
+    {% else %}
+    values = vec4(0.0/0.0);
+    {% endif %}
+}
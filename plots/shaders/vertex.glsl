@@ -20,9 +20,7 @@
 #version 330 core
 layout (location = 0) in vec3 position;
 out vec2 graph_pos;
-uniform vec2 viewport;
-uniform vec2 translation;
-uniform float scale;
+{% include "view.glsl" %}
 
 void main() {
     gl_Position = vec4(position, 1.0);
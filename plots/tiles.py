@@ -0,0 +1,174 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+from OpenGL.GL import *
+from collections import OrderedDict
+import math
+import numpy as np
+
+def tile_range(start, length, tile_extent):
+    """Indices of the tiles of tile_extent overlapping [start, start + length)."""
+    return range(math.floor(start/tile_extent),
+                 math.floor((start + length)/tile_extent) + 1)
+
+class Tile():
+    def __init__(self, size):
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, size, size, 0,
+                     GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        self.samples = 0
+        self.framebuffer = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0,
+                               GL_TEXTURE_2D, self.texture, 0)
+
+class TileCache():
+    """Draws the graph from square tiles rendered offscreen, so that panning
+    only renders the tiles which have newly come into view.
+
+    Tiles are keyed by their zoom level, their position on the grid of tiles
+    at that level, and the state they were rendered with: the renderer's
+    generation of programs, the slider values and the formula styles. The
+    levels are LEVELS_PER_OCTAVE steps of the extent of a pixel in graph
+    coordinates per doubling, and each view is drawn from the level at or
+    just below its own pixel extent, shrunk to fit, so that zooming by
+    small steps and resizing the window reuse the tiles already rendered.
+    A tile rendered with fewer samples than requested is rendered again in
+    place. Least recently used tiles are reused once there are more than
+    `capacity`, or three times as many as the view needs, if that is more.
+
+    After zooming, the tiles of the last complete level are drawn scaled
+    until enough sharp tiles have been rendered; see draw().
+    """
+    SIZE = 256
+    BUDGET = 4  # new tiles per frame while scaled tiles can stand in
+    LEVELS_PER_OCTAVE = 4
+
+    def __init__(self, renderer, capacity=192):
+        self.renderer = renderer
+        self.capacity = capacity
+        self.limit = capacity
+        self.tiles = OrderedDict()
+        self.level = None  # (state, level) of the last complete frame
+
+    def level_pixel(self, level):
+        """The extent of a pixel of the tiles at level."""
+        return 2.0**(level/self.LEVELS_PER_OCTAVE)
+
+    def needs_render(self, key, samples):
+        return key not in self.tiles or self.tiles[key].samples < samples
+
+    def tile(self, key, samples):
+        """Returns the tile for key, rendering it if it is not cached with at
+        least the given number of samples."""
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            tile = self.tiles[key]
+            if tile.samples >= samples:
+                return tile
+        elif len(self.tiles) >= self.limit:
+            _, tile = self.tiles.popitem(last=False)
+        else:
+            tile = Tile(self.SIZE)
+        (_, slider_values, styles), level, i, j = key
+        tile_extent = self.SIZE*self.level_pixel(level)
+        translation = -np.array([i + 0.5, j + 0.5], 'f')*tile_extent
+        glBindFramebuffer(GL_FRAMEBUFFER, tile.framebuffer)
+        self.renderer.render(self.SIZE, self.SIZE, translation, tile_extent/2,
+                             list(slider_values), list(styles), samples)
+        tile.samples = samples
+        self.tiles[key] = tile
+        return tile
+
+    def draw(self, width, height, translation, scale, slider_values, styles,
+             samples):
+        """Draws a width x height graph into the bound framebuffer, in the
+        same way as Renderer.render().
+
+        Returns whether every tile was drawn sharp; if not, draw() should be
+        called again to render more of them.
+        """
+        target = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        state = (self.renderer.generation, tuple(slider_values),
+                 tuple((tuple(rgba), weight) for rgba, weight in styles))
+        pixel = 2*scale/width
+        level = math.floor(math.log2(pixel)*self.LEVELS_PER_OCTAVE)
+        left = -scale - translation[0]
+        bottom = -scale*height/width - translation[1]
+
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, target)
+        glViewport(0, 0, width, height)
+        glClearColor(1, 1, 1, 1)
+        glClear(GL_COLOR_BUFFER_BIT)
+
+        tile_extent = self.SIZE*self.level_pixel(level)
+        columns = tile_range(left, width*pixel, tile_extent)
+        rows = tile_range(bottom, height*pixel, tile_extent)
+        # room for this level, the one stretched over it, and some panning
+        self.limit = max(self.capacity, 3*len(columns)*len(rows))
+
+        budget = None
+        if self.level is not None and self.level != (state, level) \
+           and self.level[0] == state:
+            # zooming: stretch the tiles of the previous level over the view
+            _, old_level = self.level
+            old_extent = self.SIZE*self.level_pixel(old_level)
+            for i in tile_range(left, width*pixel, old_extent):
+                for j in tile_range(bottom, height*pixel, old_extent):
+                    key = (state, old_level, i, j)
+                    if key in self.tiles:
+                        x, y = (i*old_extent - left)/pixel, (j*old_extent - bottom)/pixel
+                        self.blit(self.tiles[key], target, x, y, old_extent/pixel)
+            budget = self.BUDGET
+
+        # the tiles' edges are rounded to the same pixels on either side of
+        # each, so that they meet without seams
+        size = tile_extent/pixel
+        if size == self.SIZE:
+            # align the tiles to whole pixels, so that they need no filtering
+            left = round(left/pixel)*pixel
+            bottom = round(bottom/pixel)*pixel
+        complete = True
+        for i in columns:
+            for j in rows:
+                key = (state, level, i, j)
+                x, y = (i*tile_extent - left)/pixel, (j*tile_extent - bottom)/pixel
+                if self.needs_render(key, samples) and budget is not None:
+                    if budget == 0:
+                        complete = False
+                        if key in self.tiles:
+                            self.blit(self.tiles[key], target, x, y, size)
+                        continue
+                    budget -= 1
+                self.blit(self.tile(key, samples), target, x, y, size)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, target)
+        if complete:
+            self.level = (state, level)
+        return complete
+
+    def blit(self, tile, target, x, y, size):
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, tile.framebuffer)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, target)
+        glBlitFramebuffer(0, 0, self.SIZE, self.SIZE,
+                          round(x), round(y), round(x + size), round(y + size),
+                          GL_COLOR_BUFFER_BIT,
+                          GL_NEAREST if size == self.SIZE else GL_LINEAR)
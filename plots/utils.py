@@ -16,7 +16,7 @@
 # along with Plots.  If not, see <https://www.gnu.org/licenses/>.
 
 from enum import Enum
-import re
+from collections import OrderedDict
 
 import gi
 from gi.repository import GLib, Gtk, Gdk, cairo, Pango, PangoCairo, GObject
@@ -59,6 +59,21 @@ class saved():
         self.ctx.restore()
         return False
 
+def font_options_key(options):
+    return (options.get_antialias(), options.get_hint_style(),
+            options.get_hint_metrics(), options.get_subpixel_order())
+
+def metrics_key(ctx):
+    """Returns what the metrics of text laid out on ctx depend on, besides
+    the text itself: the font, how ctx maps onto device pixels, and the font
+    options of ctx and its surface."""
+    m = ctx.get_matrix()
+    target = ctx.get_target()
+    return (desc.to_string(), m.xx, m.yx, m.xy, m.yy) + \
+        tuple(target.get_device_scale()) + \
+        font_options_key(target.get_font_options()) + \
+        font_options_key(ctx.get_font_options())
+
 class MetricContext():
     "Keeps track of state needed to calculate sizes"
     def __init__(self, cursor=None):
@@ -98,12 +113,30 @@ def deitalify_string(s):
     return "".join(deitalify_char(c) for c in s)
 
 
-def ints_to_floats(string):
-    return re.sub(r"(?<![\.\da-zA-Z_])(\d+)(?![\.\d])", r"\1.0", string)
-
-
 class Text:
-    def __init__(self, text, ctx, scale=1):
+    """A laid out piece of text and its extents.
+
+    Texts are kept in a process-wide LRU cache, keyed by everything their
+    layout depends on, so that measuring the same text again returns the
+    same object. They must therefore not be modified.
+    """
+    _cache = OrderedDict()
+    capacity = 4096
+
+    def __new__(cls, text, ctx, scale=1):
+        key = (text, scale) + metrics_key(ctx)
+        self = cls._cache.get(key)
+        if self is not None:
+            cls._cache.move_to_end(key)
+            return self
+        self = super().__new__(cls)
+        self.measure(text, ctx, scale)
+        cls._cache[key] = self
+        if len(cls._cache) > cls.capacity:
+            cls._cache.popitem(last=False)
+        return self
+
+    def measure(self, text, ctx, scale):
         self.scale = scale
         sf = scale/Pango.SCALE
         self.layout = PangoCairo.create_layout(ctx)
@@ -18,7 +18,6 @@ setuptools.setup(
         "PyOpenGL",
         "Jinja2",
         "numpy",
-        "lark-parser",
     ],
     python_requires='~=3.6',
     entry_points={
@@ -0,0 +1,162 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+import math
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+from plots import cpu, ir
+from plots.formularow import classify_all
+from plots.parser import from_latex
+
+def rows(*latex):
+    formulae, variables, sliders = [], [], []
+    for data, _ in classify_all([from_latex(l) for l in latex], cpu=True):
+        {"formula": formulae, "variable": variables, "function": variables,
+         "slider": sliders}[data.type].append(data)
+    return formulae, variables, sliders
+
+@pytest.mark.parametrize("latex, expected", [
+    (r"y=x^{2}", lambda x: x**2),
+    (r"y=\sum_{k=1}^{3}kx", lambda x: 6*x),
+    (r"y=\prod_{k=1}^{3}k", lambda x: np.full_like(x, 6.0)),
+    (r"y=\frac{1}{x}", lambda x: 1/x),
+    (r"y=x!", lambda x: np.array([1.0, 1.0, 2.0, 6.0])),
+    (r"y=\sqrt[3]{x}", lambda x: np.cbrt(x)),
+])
+def test_evaluate(latex, expected):
+    renderer = cpu.CPURenderer(workers=1)
+    renderer.update_shader(*rows(latex))
+    x = np.array([0.0, 1.0, 2.0, 3.0])
+    with np.errstate(divide="ignore"):
+        np.testing.assert_allclose(renderer.evaluate(x, [])[0], expected(x))
+
+def test_evaluate_variables():
+    renderer = cpu.CPURenderer(workers=1)
+    renderer.update_shader(*rows(r"a=2", r"b=a+1", r"c=bx", r"y=c+b"))
+    x = np.array([1.0, 2.0])
+    np.testing.assert_allclose(renderer.evaluate(x, [5.0])[0], 6*x + 6)
+
+def test_evaluate_variables_out_of_order():
+    renderer = cpu.CPURenderer(workers=1)
+    renderer.update_shader(*rows(r"y=c+b", r"c=bx", r"b=x+1", r"d=d+1", r"y=d"))
+    x = np.array([1.0, 2.0])
+    values = renderer.evaluate(x, [])
+    np.testing.assert_allclose(values[0], (x + 1)*(x + 1))
+    assert np.isnan(values[1]).all()
+
+def test_evaluate_functions():
+    renderer = cpu.CPURenderer(workers=1)
+    renderer.update_shader(*rows(r"y=f(x,2)", r"f(x,t)=g(xt)+a", r"g(x)=x^{2}", r"a=3",
+                                 r"y=h(1)", r"h(t)=tx"))
+    x = np.array([1.0, 2.0])
+    values = renderer.evaluate(x, [5.0])
+    np.testing.assert_allclose(values[0], 4*x*x + 5)
+    assert np.isnan(values[1]).all()
+
+def test_mypow_negative_base():
+    np.testing.assert_allclose(ir.mypow(np.array([-2.0, -2.0]), np.array([2.0, 3.0])),
+                               [4.0, -8.0])
+    assert np.isnan(ir.mypow(-2.0, 0.5))
+
+def test_factorial():
+    x = np.array([0.0, 5.0, 0.5, -0.5, -1.5, 2.5])
+    expected = [1.0, 120.0, math.sqrt(math.pi)/2, math.sqrt(math.pi),
+                -2*math.sqrt(math.pi), math.gamma(3.5)]
+    np.testing.assert_allclose(ir.factorial(x), expected, rtol=1e-12)
+    assert ir.factorial(170.0) == float(math.factorial(170))
+    assert np.isinf(ir.factorial(171.0))
+
+def test_render():
+    renderer = cpu.CPURenderer(workers=1)
+    renderer.update_shader(*rows(r"y=x"))
+    image = renderer.render(64, 32, np.zeros(2), 10, [], [((1.0, 0.0, 0.0, 1.0), 1.0)])
+    assert image.shape == (32, 64, 3)
+    # the line y = x passes through the middle of the image
+    assert (image[16, 30:34] != 255).any()
+
+def test_render_bands():
+    renderer = cpu.CPURenderer(workers=1)
+    renderer.update_shader(*rows(r"y=x^{2}", r"y=\operatorname{sin}(x)"))
+    styles = [((1.0, 0.0, 0.0, 1.0), 1.0), ((0.0, 0.0, 1.0, 0.5), 2.0)]
+    expected = renderer.render(61, 32, np.array([0.5, 0.0]), 3, [], styles)
+    renderer.workers = 3
+    np.testing.assert_array_equal(
+        renderer.render(61, 32, np.array([0.5, 0.0]), 3, [], styles), expected)
+
+# renders a formula with OpenGL in a new process, as PyOpenGL must be told to
+# use EGL before it is first imported, and writes the image to stdout
+GL_SCRIPT = """
+import sys
+from plots import headless
+try:
+    renderer = headless.HeadlessRenderer()
+except Exception as e:
+    print(e, file=sys.stderr)
+    sys.exit(77)
+doc = {"rows": [{**headless.DEFAULT_ROW, "formula": sys.argv[1]}],
+       "scale": float(sys.argv[2]), "translation": [0, 0]}
+sys.stdout.buffer.write(renderer.render(doc, 160, 90).tobytes())
+"""
+
+def render_gl(latex, scale, tmp_path):
+    env = {**os.environ, "PYOPENGL_PLATFORM": "egl", "XDG_CACHE_HOME": str(tmp_path)}
+    result = subprocess.run([sys.executable, "-c", GL_SCRIPT, latex, str(scale)],
+                            capture_output=True, env=env)
+    if result.returncode == 77:
+        pytest.skip(f"no OpenGL 3.3 context: {result.stderr.decode().strip()}")
+    assert result.returncode == 0, result.stderr.decode()
+    return np.frombuffer(result.stdout, np.uint8).reshape(90, 160, 3)
+
+def test_factorial_series_matches_gl(tmp_path):
+    # the terms past 34! overflow single precision, and must vanish rather
+    # than make the sum NaN
+    latex = r"y=\sum_{k=0}^{40}\frac{(-1)^{k}x^{2k+1}}{(2k+1)!}"
+    gl = render_gl(latex, 4, tmp_path)
+    renderer = cpu.CPURenderer(workers=1)
+    renderer.update_shader(*rows(latex))
+    image = renderer.render(160, 90, np.zeros(2), 4, [], [((0.0, 0.0, 0.0, 1.0), 1.0)])
+    # the black curve, for |x| < 2.5, where x^81 fits in single precision
+    curve_gl, curve_cpu = (i[:, 30:130].max(axis=2) < 128 for i in (gl, image))
+    assert curve_gl.sum() > 100
+    assert (curve_gl != curve_cpu).sum() <= 5
+
+@pytest.mark.parametrize("x", [-1.0, -2.0, -7.0])
+def test_factorial_poles(x):
+    assert np.isinf(ir.factorial(x))
+
+def test_factorial_overflow():
+    assert np.isinf(ir.factorial(np.array([171.5, 200.0, 1000.0]))).all()
+
+def test_errors_reported_once(capsys):
+    renderer = cpu.CPURenderer(workers=1)
+    renderer.update_shader(*rows(r"y=x"))
+    renderer.sources = renderer.sources._replace(
+        formulae=[cpu.compile_numpy("undefined_name", "eval")])
+    for _ in range(3):
+        assert np.isnan(renderer.evaluate(np.array([1.0]), [])).all()
+    assert capsys.readouterr().out.count("undefined_name") == 1
+    renderer.update_shader(*rows(r"y=x"))
+    assert renderer.errors == set()
+
+def test_float_constants():
+    code = cpu.compile_numpy("1/0", "eval")
+    with np.errstate(divide="ignore"):
+        assert np.isinf(eval(code, {"_float": np.float64}))
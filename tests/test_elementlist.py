@@ -16,8 +16,10 @@
 # along with Plots.  If not, see <https://www.gnu.org/licenses/>.
 
 import pytest
+from functools import partial
 
 import plots.elements as e
+from plots.elements import index
 from plots.parser import from_latex
 from plots.cursor import Cursor
 import plots.data
@@ -53,6 +55,37 @@ def test_convert_specials_epsilon_upsilon(name):
     assert len(elems) == len(name)
     assert elems.to_latex() == name
 
+@pytest.mark.parametrize("string, names", [
+    ("alphax", ["alpha", "x"]),
+    ("sinhx", ["sinh", "x"]),
+    ("epsilon", ["epsilon"]),
+    ("upsi", ["u", "p", "s", "i"]),
+    ("psix", ["psi", "x"]),
+    ("ppsi", ["p", "psi"]),
+])
+def test_string_to_names(string, names):
+    assert index.string_to_names(string) == names
+
+def test_typing_keywords(cursor):
+    elems = e.ElementList()
+    cursor.reparent(elems, 0)
+    for char in "xbetay":
+        cursor.insert(e.Atom(char))
+    assert elems.to_latex() == "xβy"
+    cursor.reparent(elems, 1)
+    for char in "sin":
+        cursor.insert(e.Atom(char))
+    assert elems.to_latex() == r"x\operatorname{sin}βy"
+
+def test_register_keyword(cursor, monkeypatch):
+    monkeypatch.setattr(index, "KEYWORDS", dict(index.KEYWORDS))
+    monkeypatch.setattr(index, "NOT_AFTER", dict(index.NOT_AFTER))
+    monkeypatch.setattr(index, "_tokenizer", None)
+    index.register_keyword("half", partial(e.Atom, "½"), not_after="t")
+    assert index.string_to_names("halfthalf") == ["half", "t", "h", "a", "l", "f"]
+    elems = do_convert_specials("xhalf")
+    assert len(elems) == 2 and elems[1].name == "½"
+
 @pytest.mark.parametrize("name, cls", [
     ("sum", e.Sum),
     ("prod", e.Sum),
@@ -121,3 +154,60 @@ def test_frac_accept_selection(cursor):
     cursor.greedy_insert(e.Frac)
     assert elems.to_latex() == r"\frac{xyz}{}"
     assert cursor.owner is elems[0].denominator
+
+def test_code_cached():
+    elems = from_latex(r"\frac{x}{2}+1")
+    assert elems.to_ir() is elems.to_ir()
+    assert elems.to_latex() is elems.to_latex()
+
+def test_insert_invalidates_ancestors(cursor):
+    elems = from_latex(r"\sqrt{\frac{x}{2}}")
+    assert elems.to_glsl() == ("", "sqrt(x*0.5)")
+    cursor.reparent(elems[0].radicand[0].denominator, -1)
+    cursor.insert(e.Atom("y"))
+    assert elems.to_latex() == r"\sqrt{\frac{x}{2y}}"
+    assert elems.to_glsl() == ("", "sqrt(x/(2.0*y))")
+
+def test_backspace_invalidates_ancestors(cursor):
+    elems = from_latex(r"\abs{x^{23}}")
+    assert elems.to_latex() == r"\abs{x^{23}}"
+    cursor.reparent(elems[0].argument[1].exponent, -1)
+    cursor.backspace(plots.utils.Direction.LEFT)
+    assert elems.to_latex() == r"\abs{x^{2}}"
+
+def test_dissolve_invalidates_ancestors(cursor):
+    elems = from_latex(r"\sqrt{\frac{abc}{def}}")
+    assert elems.to_latex() == r"\sqrt{\frac{abc}{def}}"
+    cursor.reparent(elems[0].radicand[0].numerator, 0)
+    cursor.backspace(plots.utils.Direction.LEFT)
+    assert elems.to_latex() == r"\sqrt{abcdef}"
+
+def test_selection_backspace_invalidates(cursor):
+    elems = from_latex(r"\frac{abcd}{2}")
+    assert elems.to_latex() == r"\frac{abcd}{2}"
+    cursor.select_all(elems[0].numerator)
+    cursor.backspace(None)
+    assert elems.to_latex() == r"\frac{}{2}"
+
+def test_child_at():
+    elems = from_latex("abcd")
+    # lay the atoms out as if drawn, 10 pixels wide each
+    for i, elem in enumerate(elems):
+        elem.top_left, elem.bottom_right = (10*i, 0), (10*i + 10, 20)
+    elems.edges = [0, 10, 20, 30, 40]
+    assert elems.child_at(0, 5) is elems[0]
+    assert elems.child_at(25, 5) is elems[2]
+    assert elems.child_at(39, 19) is elems[3]
+    assert elems.child_at(25, 30) is None
+    assert elems.child_at(45, 5) is None
+
+def test_index_in_parent(cursor):
+    elems = from_latex("ab")
+    cursor.reparent(elems, 0)
+    for char in "xyz":
+        cursor.insert(e.Atom(char))
+    cursor.reparent(elems, 1)
+    cursor.backspace(plots.utils.Direction.LEFT)
+    elems.insert_elementlist(from_latex("uv"), cursor, 2)
+    assert elems.to_latex() == "yzuvab"
+    assert [elem.index_in_parent for elem in elems] == list(range(6))
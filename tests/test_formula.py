@@ -26,16 +26,16 @@ import plots.parser
     ([e.Atom('x'), e.Atom('y')],
      'x*y'),
     ([e.Frac([e.Atom('x')], [e.Atom('y')])],
-     '(x)/(y)'),
+     'x/y'),
     ([e.Abs([e.Atom('x')])],
      r'abs(x)'),
     ([e.Floor([e.Atom('x')]), e.Atom('y')],
      r'floor(x)*y'),
-    ([e.Ceil([e.Atom('x')]), e.SuperscriptSubscript(exponent=e.ElementList([e.Atom('3')]))],
-     r'mypow(ceil(x), (3.0))'),
+    ([e.Ceil([e.Atom('x')]), e.SuperscriptSubscript(exponent=e.ElementList([e.Atom('y')]))],
+     r'mypow(ceil(x), y)'),
     ([e.Atom('x'), e.SuperscriptSubscript(
         exponent=e.ElementList([e.Atom('2')]))],
-     'mypow(x, (2.0))'),
+     'x*x'),
     ([e.Atom('x'), e.Atom('!')],
      'factorial(x)'),
     ([e.OperatorAtom('sin'), e.Atom('x')],
@@ -48,9 +48,9 @@ import plots.parser
       e.SuperscriptSubscript(
           exponent=e.ElementList([e.Atom('3'), e.Atom('z')])
       )],
-     'mypow(sin(3.0*x), (3.0*z))'),
-    ([e.OperatorAtom('sin'), e.Atom('3'), e.BinaryOperatorAtom('-'), e.Atom('x')],
-     'sin(3.0)-x'),
+     'mypow(sin(3.0*x), 3.0*z)'),
+    ([e.OperatorAtom('sin'), e.Atom('y'), e.BinaryOperatorAtom('-'), e.Atom('x')],
+     'sin(y)-x'),
     ([e.OperatorAtom('sin'), e.BinaryOperatorAtom('-'), e.Atom('x')],
      'sin(-x)'),
     ([e.Atom('y'), e.Radical([
@@ -59,7 +59,7 @@ import plots.parser
     ([e.Atom('y'), e.Radical([
         e.Atom('x'), e.BinaryOperatorAtom('-'), e.Atom('1')],
                              index=[e.Atom('3')])],
-     'y*pow(x-1.0, 1.0/(3.0))'),
+     'y*pow(x-1.0, 0.3333333333333333)'),
 ])
 def test_elementlist_to_glsl(elems, expected):
     assert e.ElementList(elems).to_glsl() == ('', expected)
@@ -0,0 +1,77 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import pytest
+
+from plots import headless, parser
+from plots.formularow import classify
+
+@pytest.mark.parametrize("expr, type, value", [
+    ("a = 3.5", "slider", 3.5),
+    ("a = -2.0", "slider", -2.0),
+    ("a = b*2.0", "variable", None),
+    ("y = sin(x)", "formula", None),
+    ("x = 1.0", "formula", None),
+    ("", "empty", None),
+])
+def test_classify(expr, type, value):
+    data, slider_value = classify("", expr)
+    assert data.type == type
+    assert slider_value == value
+
+def test_classify_rows(tmp_path):
+    path = tmp_path / "doc.json"
+    path.write_text(json.dumps({"rows": [
+        {"formula": "a=2", "slider": 4.0},
+        {"formula": "b=a+1"},
+        {"formula": "y=bx", "rgba": [1, 0, 0, 1]},
+        {"formula": "y=x", "rgba": [0, 1, 0, 1], "visible": False, "weight": 2.5},
+    ]}))
+    doc = headless.load_document(str(path))
+    assert doc["scale"] == 10
+    formulae, variables, sliders, slider_values, styles = headless.classify_rows(doc)
+    assert [s.name for s in sliders] == ["a"]
+    assert slider_values == [4.0]
+    assert [v.name for v in variables] == ["b"]
+    assert len(formulae) == 2
+    # a hidden formula is drawn with no opacity
+    assert styles == [((1, 0, 0, 1), 1.0), ((0, 1, 0, 0.0), 2.5)]
+
+def test_classify_rows_reports_bad_row():
+    doc = {"rows": [{**headless.DEFAULT_ROW, "formula": "y=x"},
+                    {**headless.DEFAULT_ROW, "formula": "y=\\frac{1"}]}
+    with pytest.raises(parser.LatexError, match="row 2"):
+        headless.classify_rows(doc)
+
+def test_render_file_reports_bad_document(tmp_path, monkeypatch):
+    class Worker():
+        def render(self, doc, width, height):
+            headless.classify_rows(doc)
+    monkeypatch.setattr(headless, "_worker", Worker())
+    bad, missing = tmp_path / "bad.json", tmp_path / "missing.json"
+    bad.write_text(json.dumps({"rows": [{"formula": "y=\\sqrt{"}]}))
+    destination, error = headless.render_file((str(bad), str(tmp_path / "bad.png"), 8, 8))
+    assert destination is None
+    assert error.startswith(f"{bad}: row 1:")
+    destination, error = headless.render_file((str(missing), "", 8, 8))
+    assert destination is None
+    assert error.startswith(str(missing))
+
+@pytest.mark.parametrize("size, expected", [("3840x2160", (3840, 2160)), ("10X20", (10, 20))])
+def test_parse_size(size, expected):
+    assert headless.parse_size(size) == expected
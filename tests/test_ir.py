@@ -0,0 +1,130 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+
+from plots import ir
+from plots.formularow import classify
+from plots.parser import from_latex
+
+@pytest.mark.parametrize("latex, expected", [
+    (r"2x^{y}", "2.0*mypow(x, y)"),
+    (r"-x^{y}", "-mypow(x, y)"),
+    (r"x-(y-1)", "x-(y-1.0)"),
+    (r"(x-y)-1", "x-y-1.0"),
+    (r"x\times(-y)", "x*(-y)"),
+    (r"\operatorname{sin}x\operatorname{cos}x", "sin(x*cos(x))"),
+    (r"\operatorname{sin}(x)\operatorname{cos}(x)", "sin(x)*cos(x)"),
+    (r"\operatorname{sin}(x)^{y}", "mypow(sin(x), y)"),
+    (r"3!x", "6.0*x"),
+    (r"(x+1", "x+1.0"),
+])
+def test_parse(latex, expected):
+    assert from_latex(latex).to_glsl() == ("", expected)
+
+@pytest.mark.parametrize("latex, expected", [
+    (r"2\times3+x", "6.0+x"),
+    (r"\frac{x}{4}", "x*0.25"),
+    (r"x\times1+0", "x"),
+    (r"x-(-2)", "x+2.0"),
+    (r"x+-y", "x-y"),
+    (r"x^{1}", "x"),
+    (r"2πx", "6.283185307179586*x"),
+    (r"\operatorname{cos}(π)x", "-1.0*x"),
+    (r"\sqrt{-1}x", "sqrt(-1.0)*x"),
+    (r"\frac{x}{0}", "x/0.0"),
+    (r"0x", "0.0*x"),
+])
+def test_simplify(latex, expected):
+    assert from_latex(latex).to_glsl() == ("", expected)
+
+@pytest.mark.parametrize("latex, body, expr", [
+    (r"x^{2}", "", "x*x"),
+    (r"x^{3}", "", "x*x*x"),
+    (r"x^{4}", "float t0 = x*x;", "t0*t0"),
+    (r"x^{-2}", "", "1.0/(x*x)"),
+    (r"(x+1)^{2}", "float t0 = x+1.0;", "t0*t0"),
+    (r"x^{0}", "", "1.0"),
+    (r"x^{0.5}", "", "mypow(x, 0.5)"),
+    (r"x^{20}", "", "mypow(x, 20.0)"),
+    (r"\abs{x}^{y}", "", "pow(abs(x), y)"),
+    (r"(x^{2}+1)^{0.5}", "", "pow(x*x+1.0, 0.5)"),
+    (r"(x^{3})^{0.5}", "", "mypow(x*x*x, 0.5)"),
+])
+def test_power(latex, body, expr):
+    assert from_latex(latex).to_glsl() == (body, expr)
+
+def test_common_subexpressions():
+    body, expr = from_latex(r"\operatorname{sin}(2x)+\frac{1}{\operatorname{sin}(2x)}").to_glsl()
+    assert body == "float t0 = sin(2.0*x);"
+    assert expr == "t0+1.0/t0"
+
+def test_common_subexpressions_in_sum():
+    body, expr = from_latex(r"\sum_{k=1}^{n}\operatorname{tan}(kx)\operatorname{exp}(kx)").to_glsl()
+    assert body.split("\n") == [
+        "float sum0 = 0.0;",
+        "for (float k=1.0; k <= n; k++) {",
+        "    float t0 = k*x;",
+        "    sum0 += tan(t0)*exp(t0);",
+        "}",
+    ]
+    assert expr == "sum0"
+
+@pytest.mark.parametrize("latex, expected", [
+    (r"f(x)=x^{2}", "f(_x)=_x*_x"),
+    (r"g(x,t)=x+tb", "g(_x, _t)=_x+_t*b"),
+    (r"y=f(2x)+g(x,3)", "y=f(2.0*x)+g(x, 3.0)"),
+    (r"y=2f(x)^{3}", "y=2.0*(f(x)*f(x)*f(x))"),
+    (r"y=h(x)", "y=h*x"),
+])
+def test_functions(latex, expected):
+    node = from_latex(latex).to_ir(assignment=True, functions=frozenset("fg"))
+    assert ir.to_numpy(node) == ("", expected)
+
+@pytest.mark.parametrize("latex", [
+    "",
+    "y=",
+    r"e(x)=x",
+    r"f(x,x)=1",
+    r"f(x)=",
+    r"x)",
+    r"\frac{}{2}",
+    r"\sum_{=1}^{3}k",
+    r"x+\times y",
+])
+def test_invalid(latex):
+    with pytest.raises(ir.ParseError):
+        from_latex(latex).to_ir(assignment=True)
+    assert from_latex(latex).to_glsl() == ("", "")
+
+@pytest.mark.parametrize("latex, kind, value", [
+    (r"a=2\times3", "slider", 6.0),
+    (r"a=-\frac{1}{2}", "slider", -0.5),
+    (r"a=2b", "variable", None),
+    (r"a=2\times b", "variable", None),
+    (r"y=2x", "formula", None),
+    (r"f(x,y)=2x", "function", None),
+])
+def test_classify(latex, kind, value):
+    data, slider_value = classify(*from_latex(latex).to_glsl())
+    assert data.type == kind
+    assert slider_value == value
+
+def test_deep_expression():
+    latex = "+".join(["x"] * 200)
+    body, expr = from_latex(latex).to_glsl()
+    assert expr.count("x") == 200
@@ -0,0 +1,69 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+
+import plots.elements as e
+from plots.parser import LatexError, from_latex
+
+@pytest.mark.parametrize("latex", [
+    r"y=\sum_{n=0}^{14}\frac{\operatorname{sin}((2n+1)x)}{2n+1}",
+    r"a\timesx-b",
+    r"x_{1}^{2}+x^{3}_{4}",
+    r"\sqrt[3]{x}+\sqrt{\abs{x}}",
+    r"\floor{x}\ceil{y}",
+    r"\{[(x)]\}",
+    r"\prod_{k=1}^{n}k",
+    r"αβΩ!.,",
+    r"\frac{}{}",
+    r"x^{}",
+    "",
+])
+def test_round_trip(latex):
+    assert from_latex(latex).to_latex() == latex
+
+def test_whitespace():
+    assert from_latex(" x +\n\\frac { y } {2} ").to_latex() == r"x+\frac{y}{2}"
+
+def test_elements():
+    elems = from_latex(r"x_{1}^{2}\sqrt[3]{y}").elements
+    assert isinstance(elems[1], e.SuperscriptSubscript)
+    assert elems[1].subscript.to_latex() == "1"
+    assert elems[1].exponent.to_latex() == "2"
+    assert isinstance(elems[2], e.Radical)
+    assert elems[2].index.to_latex() == "3"
+    assert elems[2].radicand.to_latex() == "y"
+
+@pytest.mark.parametrize("latex", [
+    r"{x}",
+    r"x}",
+    r"\foo",
+    r"x*y",
+    r"\frac{x",
+    r"\sum_{k=1}",
+    r"\operatorname{}x",
+])
+def test_invalid(latex):
+    with pytest.raises(LatexError):
+        from_latex(latex)
+
+def test_long_series():
+    latex = "y=" + "+".join(rf"\frac{{\operatorname{{sin}}({k}x)}}{{{k}}}"
+                            for k in range(1, 5001))
+    expr = from_latex(latex)
+    assert len(expr.elements) == 2 + 2*5000 - 1
+    assert expr.to_latex() == latex
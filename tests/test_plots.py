@@ -0,0 +1,40 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from plots.plots import Plots
+
+def test_failed_generation_keeps_sources(capsys):
+    app = SimpleNamespace(next_sources=None, compile_source=None)
+    app.start_compile = lambda: setattr(app, "compiled", True)
+    future = Future()
+    future.set_exception(ValueError("bad expression"))
+    assert Plots.shaders_generated(app, future, [], []) is False
+    assert app.next_sources is None
+    assert not hasattr(app, "compiled")
+    assert "bad expression" in capsys.readouterr().out
+
+def test_generation_starts_compile():
+    app = SimpleNamespace(next_sources=None, compile_source=None)
+    app.start_compile = lambda: setattr(app, "compiled", True)
+    future = Future()
+    future.set_result("sources")
+    Plots.shaders_generated(app, future, ["slider"], ["formula"])
+    assert app.next_sources == ("sources", ["slider"], ["formula"])
+    assert app.compiled
@@ -0,0 +1,40 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+
+from plots.profiling import Profiler
+
+def test_disabled_records_nothing():
+    profiler = Profiler()
+    with profiler.span("codegen"):
+        pass
+    assert profiler.events == []
+    assert profiler.cpu_times == {}
+
+def test_span(tmp_path):
+    path = tmp_path / "trace.json"
+    profiler = Profiler(enabled=True, path=str(path))
+    with profiler.span("codegen", row=1):
+        pass
+    assert "codegen" in profiler.cpu_times
+    profiler.save()
+    events = json.loads(path.read_text())["traceEvents"]
+    span, = [e for e in events if e["ph"] == "X"]
+    assert span["name"] == "codegen"
+    assert span["args"] == {"row": 1}
+    assert span["dur"] >= 0
@@ -0,0 +1,70 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+from OpenGL.error import GLError
+from OpenGL.GL import GL_FALSE, GL_INVALID_ENUM
+
+from plots import programcache
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    deleted = []
+    def program_binary(program, binary_format, binary, length):
+        raise GLError(err=GL_INVALID_ENUM)
+    monkeypatch.setattr(programcache, "glCreateProgram", lambda: 7)
+    monkeypatch.setattr(programcache, "glProgramBinary", program_binary)
+    monkeypatch.setattr(programcache, "glDeleteProgram", deleted.append)
+    cache = programcache.ProgramCache(directory=str(tmp_path))
+    cache.binaries = True
+    cache.deleted = deleted
+    return cache
+
+@pytest.mark.parametrize("data", [b"", b"\1\2", b"\xff\xff\xff\xff" + b"garbage"])
+def test_load_corrupt_file(cache, data):
+    path = cache.path("key")
+    with open(path, "wb") as f:
+        f.write(data)
+    assert cache.load("key") is None
+    assert cache.deleted == ([7] if len(data) > 4 else [])
+    with pytest.raises(FileNotFoundError):
+        open(path, "rb")
+
+def test_load_missing_file(cache):
+    assert cache.load("key") is None
+
+def test_failed_compile_is_remembered(tmp_path, monkeypatch):
+    compiled = []
+    monkeypatch.setattr(programcache, "glCreateShader", lambda type: 3)
+    monkeypatch.setattr(programcache, "glShaderSource", lambda shader, source: None)
+    monkeypatch.setattr(programcache, "glCompileShader", compiled.append)
+    monkeypatch.setattr(programcache, "glCreateProgram", lambda: 7)
+    monkeypatch.setattr(programcache, "glAttachShader", lambda program, shader: None)
+    monkeypatch.setattr(programcache, "glLinkProgram", lambda program: None)
+    monkeypatch.setattr(programcache, "glDetachShader", lambda program, shader: None)
+    monkeypatch.setattr(programcache, "glGetShaderiv", lambda shader, name: GL_FALSE)
+    monkeypatch.setattr(programcache, "glGetShaderInfoLog", lambda shader: b"syntax error")
+    monkeypatch.setattr(programcache, "glDeleteProgram", lambda program: None)
+    monkeypatch.setattr(programcache, "glDeleteShader", lambda shader: None)
+    cache = programcache.ProgramCache(directory=str(tmp_path))
+    cache.driver_hash = ""
+    cache.shaders["vertex"] = 2
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="syntax error"):
+            cache.get("vertex", "broken")
+    assert compiled == [3]
+    assert not cache.pending
@@ -0,0 +1,219 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import re
+
+from plots.formularow import RowData
+from plots.renderer import Renderer, ShaderSources, schedule, split_variables
+
+def variable(name, expr, body=""):
+    return RowData(type="variable", name=name, body=body, expr=f"{name} = {expr}")
+
+def slider(name):
+    return RowData(type="slider", name=name, expr=f"{name} = 0.5")
+
+def function(name, params, expr):
+    return RowData(type="function", name=name, params=params, expr=expr)
+
+def test_split_variables():
+    variables = [
+        variable("a", "2.0*b"),
+        variable("c", "sin(x)"),
+        variable("d", "a*c"),
+        variable("f", "a + 1.0"),
+    ]
+    hoisted, dependent, functions, undefined = split_variables(variables)
+    assert [v.name for v in hoisted] == ["a", "f"]
+    assert [v.name for v in dependent] == ["c", "d"]
+    assert functions == undefined == []
+
+def test_split_variables_in_body():
+    variables = [variable("s", "sum0", body="float sum0 = 0.0; sum0 += x;")]
+    hoisted, dependent, functions, undefined = split_variables(variables)
+    assert hoisted == []
+    assert dependent == variables
+
+def test_split_functions():
+    variables = [
+        function("f", ["_t"], "a*_t"),
+        variable("a", "g(2.0)"),
+        function("g", ["_t"], "_t + 1.0"),
+        function("h", ["_t"], "_t*x"),
+        variable("b", "h(1.0)"),
+    ]
+    hoisted, dependent, functions, undefined = split_variables(variables)
+    assert [v.name for v in hoisted] == ["a"]
+    assert [v.name for v in dependent] == ["b"]
+    assert [v.name for v in functions] == ["g", "f"]
+    assert [v.name for v in undefined] == ["h"]
+
+def test_schedule():
+    variables = [
+        variable("a", "b + c"),
+        variable("d", "1.0"),
+        variable("b", "c*x"),
+        variable("c", "2.0"),
+    ]
+    ordered, undefined = schedule(variables)
+    assert [v.name for v in ordered] == ["d", "c", "b", "a"]
+    assert undefined == set()
+
+def test_schedule_cycle():
+    variables = [
+        variable("a", "b"),
+        variable("b", "a + 1.0"),
+        variable("c", "a"),
+        variable("d", "d*2.0"),
+        variable("f", "3.0"),
+    ]
+    ordered, undefined = schedule(variables)
+    assert [v.name for v in ordered] == ["f"]
+    assert undefined == {"a", "b", "c", "d"}
+
+def test_generate_only_used_variables():
+    renderer = Renderer()
+    formulae = [RowData(type="formula", expr="a*x"), RowData(type="formula", expr="x")]
+    variables = [variable("a", "b"), variable("b", "x"), variable("c", "2.0*x")]
+    sources = renderer.generate(formulae, variables, [])
+    assert "float a =" in sources.samples[0] and "float b =" in sources.samples[0]
+    assert "float c =" not in sources.samples[0]
+    # editing a variable only changes the programs of formulae using it
+    variables[2] = variable("c", "3.0*x")
+    assert renderer.generate(formulae, variables, []).samples == sources.samples
+
+def test_generate_hoisted_variable_indices():
+    renderer = Renderer()
+    formulae = [RowData(type="formula", expr="b*x")]
+    sources = renderer.generate(formulae, [variable("a", "1.0"), variable("b", "2.0")], [])
+    assert "b = texelFetch(variables, ivec2(0, 0), 0)[1];" in sources.samples[0]
+    assert "a = texelFetch" not in sources.samples[0]
+
+def test_generate_hoisted_variable_named_like_local():
+    renderer = Renderer()
+    formulae = [RowData(type="formula", expr="x + i")]
+    source = renderer.generate(formulae, [variable("i", "2.0")], []).samples[0]
+    assert "#define i " not in source
+    assert "float i = floor(gl_FragCoord.y);" in source
+    assert source.index("load_variables();") < source.index("float i = floor")
+
+def test_generate_hoisted_variable_named_like_sum_index():
+    renderer = Renderer()
+    body = "float sum0 = 0.0;\nfor (float k=1.0; k <= 3.0; k++) {\n    sum0 += k*x;\n}"
+    formulae = [RowData(type="formula", body=body, expr="sum0*k")]
+    source = renderer.generate(formulae, [variable("k", "2.0")], []).samples[0]
+    assert "#define k " not in source
+    assert "for (float k=1.0;" in source
+    assert "k = texelFetch(variables, ivec2(0, 0), 0)[0];" in source
+
+def test_generate_slider_named_like_local():
+    renderer = Renderer()
+    formulae = [RowData(type="formula", expr="x + i")]
+    sources = renderer.generate(formulae, [], [slider("i")])
+    source = sources.samples[0]
+    # main() declares its own i, which must not be rewritten
+    assert "#define i " not in source
+    assert "float i = floor(gl_FragCoord.y);" in source
+    assert "i = slider_values[0][0];" in source
+    assert source.index("load_sliders();") < source.index("float i = floor")
+
+def test_generate_slider_named_like_sum_index():
+    renderer = Renderer()
+    body = "float sum0 = 0.0;\nfor (float k=1.0; k <= 3.0; k++) {\n    sum0 += k*x;\n}"
+    formulae = [RowData(type="formula", body=body, expr="sum0*k")]
+    sources = renderer.generate(formulae, [], [slider("j"), slider("k")])
+    source = sources.samples[0]
+    assert "#define k " not in source
+    assert "for (float k=1.0;" in source
+    assert "k = slider_values[0][1];" in source
+
+def test_generate_cycle():
+    renderer = Renderer()
+    formulae = [RowData(type="formula", expr="a*x")]
+    sources = renderer.generate(formulae, [variable("a", "a + 1.0")], [])
+    assert "float a = 0.0/0.0;" in sources.samples[0]
+    assert "a = a + 1.0" not in sources.samples[0]
+
+def test_generate_functions():
+    renderer = Renderer()
+    formulae = [RowData(type="formula", expr="f(x)"), RowData(type="formula", expr="x")]
+    variables = [function("f", ["_t"], "g(_t, 2.0)*a"), function("g", ["_t", "_u"], "_t*_u"),
+                 variable("a", "2.0")]
+    sources = renderer.generate(formulae, variables, [])
+    assert "float g(float _t, float _u) {" in sources.samples[0]
+    assert "return g(_t, 2.0)*a;" in sources.samples[0]
+    assert sources.samples[0].index("float g(") < sources.samples[0].index("float f(")
+    assert "float f(" not in sources.samples[1]
+
+@pytest.mark.parametrize("names, texels", [("a", 1), ("abcd", 1), ("abcde", 2)])
+def test_generate_variables(names, texels):
+    renderer = Renderer()
+    sources = renderer.generate([], [variable(n, "1.0") for n in names], [])
+    assert sources.variable_count == len(names)
+    values = re.search(r"float _values\[\] = float\[\]\((.*)\);", sources.variables)
+    assert len(values.group(1).split(",")) == 4*texels
+
+def test_generate_no_hoisted_variables():
+    renderer = Renderer()
+    sources = renderer.generate([], [variable("a", "x")], [])
+    assert sources.variables is None
+
+class Pending():
+    def __init__(self, ready=True, error=False):
+        self._ready = ready
+        self.error = error
+
+    def ready(self):
+        return self._ready
+
+    def result(self):
+        if self.error:
+            raise RuntimeError("0:1(1): error: syntax error")
+        return 1
+
+@pytest.mark.parametrize("variables", [None, Pending(True)])
+def test_update_ready(variables):
+    renderer = Renderer()
+    renderer.pending = ShaderSources(samples=[Pending(True)], fragment=Pending(True),
+                                     variables=variables, variable_count=0, labels=[])
+    assert renderer.update_ready()
+
+def test_update_not_ready_while_variables_compile():
+    renderer = Renderer()
+    renderer.pending = ShaderSources(samples=[Pending(True)], fragment=Pending(True),
+                                     variables=Pending(False), variable_count=1, labels=[])
+    assert not renderer.update_ready()
+
+def test_failed_fragment_program_falls_back_to_blank_compositing(monkeypatch):
+    renderer = Renderer()
+    renderer.vertex_source = renderer.vertex_template.render()
+    renderer.columns_program = 2
+    fallbacks = []
+    monkeypatch.setattr(renderer.cache, "get", lambda vertex, fragment: fallbacks.append(fragment))
+    monkeypatch.setattr(renderer.cache, "trim", lambda keep: None)
+    monkeypatch.setattr(renderer, "prepare", lambda program: None)
+    renderer.pending = ShaderSources(samples=[Pending()], fragment=Pending(error=True),
+                                     variables=None, variable_count=0, labels=[])
+    renderer.finish_update()
+    fallback, = fallbacks
+    assert fallback == renderer.fragment_template.render(capacity=8)
+
+def test_generate_labels():
+    renderer = Renderer()
+    formulae = [RowData(type="formula", expr="x"), RowData(type="formula", expr="2.0*x")]
+    assert renderer.generate(formulae, [], []).labels == ["formula 1", "formula 2"]
+    assert renderer.generate(formulae, [], [], ["row 1", "row 3"]).labels == ["row 1", "row 3"]
@@ -16,10 +16,13 @@
 # along with Plots.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import math
+import numpy as np
 import pytest
 import re
 
-import plots.formula as f
+from plots.cpu import compile_numpy
+from plots.ir import NAMESPACE
 from plots.parser import from_latex
 
 from tests.fixtures import cursor
@@ -28,36 +31,114 @@ def clean(s):
     return re.sub(r" +", " ", s.replace("\n", " ")).strip()
 
 @pytest.mark.parametrize('latex, body, expr', [
-    (r"\sum_{i=1}^{50}3i-1", """
+    (r"\sum_{i=1}^{n}\operatorname{sin}(ix)-1", """
+float t0 = sin(x);
+float t1 = cos(x);
+float t2 = t0;
+float t3 = t1;
 float sum0 = 0.0;
-for (float i=1.0; i <= 50.0; i++) {
-    sum0 += 3.0*i;
+for (float i=1.0; i <= n; i++) {
+    sum0 += t0;
+    float t4 = t0*t3+t1*t2;
+    t1 = t1*t3-t0*t2;
+    t0 = t4;
 }
 """, "sum0-1.0"),
     # x + x Σ[x^2(Σ x^{ij}) + Σexp(ikx)]
-    (r"x + x\sum_{i=1}^{4}[x^{2}(\sum_{j=1}^{i}x^{ij})+\sum_{k=1}^{i^{2}}\operatorname{exp}(ikx)]", """
+    (r"x + x\sum_{i=1}^{n}[x^{2}(\sum_{j=1}^{i}x^{ij})+\sum_{k=1}^{i^{2}}\operatorname{exp}(ikx)]", """
+float t0 = x*x;
 float sum2 = 0.0;
-for (float i=1.0; i <= 4.0; i++) {
+for (float i=1.0; i <= n; i++) {
     float sum0 = 0.0;
     for (float j=1.0; j <= i; j++) {
-        sum0 += mypow(x, (i*j));
+        sum0 += mypow(x, i*j);
     }
+    float t1 = i*i;
     float sum1 = 0.0;
-    for (float k=1.0; k <= mypow(i, (2.0)); k++) {
+    for (float k=1.0; k <= t1; k++) {
         sum1 += exp(i*k*x);
     }
-    sum2 += (mypow(x, (2.0))*(sum0)+sum1);
+    sum2 += t0*sum0+sum1;
 }
 """, "x+x*sum2"),
     (r"\prod_{i=4}^{50}\operatorname{sin}(3ix-1)", """
+float t0 = 3.0*x;
+float t1 = t0*4.0-1.0;
+float t2 = sin(t1);
+float t3 = cos(t1);
+float t4 = sin(t0);
+float t5 = cos(t0);
 float sum0 = 1.0;
 for (float i=4.0; i <= 50.0; i++) {
-    sum0 *= sin(3.0*i*x-1.0);
+    sum0 *= t2;
+    float t6 = t2*t5+t3*t4;
+    t3 = t3*t5-t2*t4;
+    t2 = t6;
 }
 """, "sum0"),
+    (r"\sum_{k=1}^{n}\operatorname{exp}(kx)\operatorname{cos}(x)", """
+float t0 = cos(x);
+float sum0 = 0.0;
+for (float k=1.0; k <= n; k++) {
+    sum0 += exp(k*x)*t0;
+}
+""", "sum0"),
+    (r"\sum_{k=1}^{3}\operatorname{exp}(kx)", "", "exp(x)+exp(2.0*x)+exp(3.0*x)"),
+    (r"\sum_{k=1}^{0}x", "", "0.0"),
+    (r"\sum_{i=1}^{50}3i-1", "", "3824.0"),
+    (r"\sum_{k=0}^{n}2^{k}", "", "pow(2.0, max(floor(n)+1.0, 0.0))-1.0"),
+    (r"\prod_{k=1}^{n}x", "", "mypow(x, max(floor(n-1.0)+1.0, 0.0))"),
 ])
 def test_sum_to_glsl(latex, body, expr):
-    f.Sum.glsl_var_counter = 0
     glsl = from_latex(latex).to_glsl()
     assert clean(glsl[0]) == clean(body)
     assert glsl[1] == expr
+
+def test_sum_to_glsl_repeatable():
+    latex = r"\sum_{i=1}^{n}\sum_{j=1}^{i}\operatorname{sin}(ij)"
+    assert from_latex(latex).to_glsl() == from_latex(latex).to_glsl()
+
+@pytest.mark.parametrize('latex, expr', [
+    (r"\sum_{i=1}^{n}\operatorname{sin}(ix)-1", "_sum(lambda i: sin(i*x), 1.0, n)-1.0"),
+    (r"\prod_{i=4}^{50}\operatorname{sin}(3ix-1)",
+     "_prod(lambda i: sin(3.0*i*x-1.0), 4.0, 50.0)"),
+    (r"x\sum_{i=1}^{n}\frac{\sum_{j=1}^{i}\operatorname{sin}(ij)}{2}",
+     "x*_sum(lambda i: _sum(lambda j: sin(i*j), 1.0, i)*0.5, 1.0, n)"),
+])
+def test_sum_to_numpy(latex, expr):
+    assert from_latex(latex).to_numpy() == ("", expr)
+
+@pytest.mark.parametrize('latex, term', [
+    (r"\sum_{k=1}^{n}k", lambda k, x: k),
+    (r"\sum_{k=0}^{n}k^{2}x", lambda k, x: k*k*x),
+    (r"\sum_{k=2}^{n}(k-2)^{2}", lambda k, x: (k-2)**2),
+    (r"\sum_{k=-1.5}^{n}(3k+x)(k-x)", lambda k, x: (3*k+x)*(k-x)),
+    (r"\sum_{k=1}^{n}\frac{x-k}{2}", lambda k, x: (x-k)/2),
+    (r"\sum_{k=0}^{n}\frac{2^{k}x}{3}", lambda k, x: 2**k*x/3),
+    (r"\sum_{k=1}^{n}\frac{(-1)^{k}}{2}", lambda k, x: (-1)**k/2),
+    (r"\sum_{k=1}^{n}\frac{x}{3}", lambda k, x: x/3),
+])
+def test_closed_forms(latex, term):
+    code = from_latex("y=" + latex).to_numpy()[1].split("=", 1)[1]
+    assert "_sum" not in code
+    for n in [-3, 0, 1, 2, 5, 9.5, 40]:
+        x = 0.7
+        k, expected = from_latex(latex)[0], 0.0
+        start = float(k.bottom.to_latex().split("=")[1])
+        while start <= n:
+            expected += term(start, x)
+            start += 1
+        actual = eval(compile_numpy(code, "eval"), {**NAMESPACE, "n": n, "x": x})
+        assert actual == pytest.approx(expected, abs=1e-9)
+
+@pytest.mark.parametrize('latex, expected', [
+    (r"\sum_{i=0}^{7}\frac{(-1)^{i}}{(2i+1)!}x^{2i+1}",
+     lambda x: sum((-1)**i/math.factorial(2*i+1)*x**(2*i+1) for i in range(8))),
+    (r"\prod_{k=1}^{4}(x-k)", lambda x: (x-1)*(x-2)*(x-3)*(x-4)),
+])
+def test_unrolled(latex, expected):
+    code = from_latex(latex).to_numpy()[1]
+    assert "_sum" not in code and "_prod" not in code
+    x = np.linspace(-3, 3, 7)
+    actual = eval(compile_numpy(code, "eval"), {**NAMESPACE, "x": x})
+    np.testing.assert_allclose(actual, expected(x), atol=1e-12)
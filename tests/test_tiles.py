@@ -0,0 +1,135 @@
+# Copyright 2021 Alexander Huntley
+
+# This file is part of Plots.
+
+# Plots is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Plots is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Plots.  If not, see <https://www.gnu.org/licenses/>.
+
+from itertools import count
+import pytest
+
+from plots import tiles
+from plots.tiles import TileCache, tile_range
+
+@pytest.mark.parametrize("start, length, extent, expected", [
+    (0.0, 1.0, 1.0, range(0, 2)),
+    (0.5, 1.0, 1.0, range(0, 2)),
+    (-0.5, 0.25, 1.0, range(-1, 0)),
+    (-2.5, 5.0, 2.0, range(-2, 2)),
+])
+def test_tile_range(start, length, extent, expected):
+    assert tile_range(start, length, extent) == expected
+
+class FakeRenderer():
+    def __init__(self):
+        self.generation = 1
+        self.rendered = []
+
+    def render(self, width, height, translation, scale, slider_values, styles, samples):
+        self.rendered.append((tuple(translation), scale, samples))
+
+@pytest.fixture
+def cache(monkeypatch):
+    names = count(1)
+    blits = []
+    for name in ["glBindTexture", "glTexImage2D", "glTexParameteri", "glBindFramebuffer",
+                 "glFramebufferTexture2D", "glViewport", "glClearColor", "glClear"]:
+        monkeypatch.setattr(tiles, name, lambda *args: None)
+    monkeypatch.setattr(tiles, "glGenTextures", lambda n: next(names))
+    monkeypatch.setattr(tiles, "glGenFramebuffers", lambda n: next(names))
+    monkeypatch.setattr(tiles, "glGetIntegerv", lambda name: 0)
+    monkeypatch.setattr(tiles, "glBlitFramebuffer", lambda *args: blits.append(args[4:8]))
+    cache = TileCache(FakeRenderer())
+    cache.blits = blits
+    return cache
+
+STYLES = [((0.0, 0.0, 0.0, 1.0), 2.5)]
+
+def draw(cache, scale=1.0, slider_values=(), styles=STYLES, samples=4,
+         size=(512, 512), translation=(0.0, 0.0)):
+    """Draws a view, by default 512 x 512 and centred on the origin, which
+    overlaps 3 x 3 tiles, and returns whether it was complete and the
+    number of tiles rendered."""
+    before = len(cache.renderer.rendered)
+    cache.blits.clear()
+    complete = cache.draw(*size, translation, scale, list(slider_values), styles, samples)
+    return complete, len(cache.renderer.rendered) - before
+
+def test_draw_reuses_tiles(cache):
+    assert draw(cache) == (True, 9)
+    assert draw(cache) == (True, 0)
+    assert len(cache.blits) == 9
+    assert draw(cache, samples=8) == (True, 9)
+    assert draw(cache, samples=4) == (True, 0)
+
+def test_generation_invalidates_tiles(cache):
+    draw(cache)
+    cache.renderer.generation = 2
+    assert draw(cache) == (True, 9)
+
+@pytest.mark.parametrize("changed", [
+    {"slider_values": [0.5]},
+    {"styles": [((1.0, 0.0, 0.0, 1.0), 2.5)]},
+    {"styles": [((0.0, 0.0, 0.0, 1.0), 5.0)]},
+])
+def test_state_invalidates_tiles(cache, changed):
+    draw(cache)
+    assert draw(cache, **changed) == (True, 9)
+
+def test_zoom_stretches_previous_level(cache):
+    draw(cache)
+    complete, rendered = draw(cache, scale=0.5)
+    assert not complete
+    assert rendered == TileCache.BUDGET
+    # the 2 x 2 tiles of the previous level overlapping the view are drawn
+    # first, at twice their size
+    stretched = [b for b in cache.blits if b[2] - b[0] == 2*TileCache.SIZE]
+    assert len(stretched) == 4
+    assert cache.blits[:4] == stretched
+    assert len(cache.blits) == 4 + TileCache.BUDGET
+
+def test_zoom_budget(cache):
+    draw(cache)
+    assert draw(cache, scale=0.5) == (False, 4)
+    assert draw(cache, scale=0.5) == (False, 4)
+    assert draw(cache, scale=0.5) == (True, 1)
+    # the new level is complete, so nothing is stretched
+    assert draw(cache, scale=0.5) == (True, 0)
+    assert all(b[2] - b[0] == TileCache.SIZE for b in cache.blits)
+
+def test_zoom_renders_level_fully_after_state_change(cache):
+    draw(cache)
+    cache.renderer.generation = 2
+    assert draw(cache, scale=0.5) == (True, 9)
+
+def test_small_zoom_reuses_level(cache):
+    # a view of [-0.5, 1.5] or a little more overlaps the tiles -1 to 1
+    assert draw(cache, translation=(-0.5, -0.5)) == (True, 9)
+    assert draw(cache, scale=1.05, translation=(-0.5, -0.5)) == (True, 0)
+    # the tiles are shrunk to fit, so they are filtered
+    assert len(cache.blits) == 9
+    assert all(b[2] - b[0] < TileCache.SIZE for b in cache.blits)
+    # the edges of neighbouring tiles meet
+    assert {b[2] for b in cache.blits} - {b[0] for b in cache.blits} == {max(b[2] for b in cache.blits)}
+
+def test_resize_reuses_level(cache):
+    draw(cache, translation=(-0.5, -0.5))
+    # the same extent of a pixel, in a smaller window
+    assert draw(cache, scale=500/512, size=(500, 400), translation=(-0.5, -0.5)) == (True, 0)
+    assert all(b[2] - b[0] == TileCache.SIZE for b in cache.blits)
+
+def test_capacity_grows_with_view(cache):
+    # 17 x 17 tiles, more than the default capacity
+    assert draw(cache, scale=8.0, size=(4096, 4096)) == (True, 289)
+    assert draw(cache, scale=8.0, size=(4096, 4096)) == (True, 0)
+    assert len(cache.tiles) == 289